@@ -0,0 +1,191 @@
+"""Background jobs for attachment analysis.
+
+/chat answers an upload with a job id right away. A small thread pool in the worker
+process that accepted the upload renders and analyzes the file, while the client polls
+/chat/jobs/<id>. (There is no event stream: under gthread workers it would hold a request
+thread for the whole analysis, which is what moving attachments off the request avoids.)
+
+Job records are JSON files in ATTACHMENT_JOBS_DIR, so any gunicorn worker can report on
+any job. Job ids are random, so only the client that got one can read the result. A
+retried upload attaches to the job already running (or finished) instead of starting the
+work again: a .key file maps the client's scope and idempotency key to the job id.
+"""
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+JOBS_DIR = os.getenv('ATTACHMENT_JOBS_DIR', os.path.join(tempfile.gettempdir(), 'ccc_attachment_jobs'))
+JOB_WORKERS = int(os.getenv('ATTACHMENT_JOB_WORKERS', '4'))  # concurrent analyses per process
+JOB_TTL = int(os.getenv('ATTACHMENT_JOB_TTL', '3600'))  # finished jobs are kept, and reused by retries, this long
+# An unfinished job not updated for this long lost its worker (restart, crash) and is reported failed
+JOB_STALE_SECONDS = int(os.getenv('ATTACHMENT_JOB_STALE_SECONDS', '300'))
+CLEANUP_INTERVAL = 60
+FINISHED = ('done', 'failed')
+JOB_ID = re.compile(r'[0-9a-f]{32}')
+
+_executor = None
+_executor_lock = threading.Lock()
+_last_cleanup = 0
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='attachment-job')
+    return _executor
+
+
+def _reset_executor():
+    global _executor
+    _executor = None  # Threads don't survive fork; the child builds its own
+
+
+os.register_at_fork(after_in_child=_reset_executor)
+
+
+def key_path(idempotency_key, scope):
+    digest = hashlib.sha256(f'{scope}\0{idempotency_key}'.encode('utf-8')).hexdigest()[:32]
+    return os.path.join(JOBS_DIR, f'{digest}.key')
+
+
+def job_path(job_id):
+    return os.path.join(JOBS_DIR, f'{job_id}.json')
+
+
+def write_temp(content):
+    fd, temp_path = tempfile.mkstemp(dir=JOBS_DIR, suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        if isinstance(content, str):
+            f.write(content)
+        else:
+            json.dump(content, f, ensure_ascii=False)
+    return temp_path
+
+
+def read_key(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def get_job(job_id):
+    """The job record, or None when unknown or expired. Stale unfinished jobs read as failed."""
+    if not JOB_ID.fullmatch(job_id or ''):
+        return None
+    try:
+        with open(job_path(job_id), encoding='utf-8') as f:
+            job = json.load(f)
+    except (OSError, ValueError):
+        return None
+    age = time.time() - job['updated']
+    if job['status'] in FINISHED:
+        return job if age <= JOB_TTL else None
+    if age > JOB_STALE_SECONDS:
+        job.update(status='failed', error='The job was interrupted; please try again.')
+    return job
+
+
+def create_job(idempotency_key=None, scope='', **fields):
+    """Return (job, created). A live or finished job with the same key, from the same client
+    scope, is returned as is; a failed or expired one is replaced, so retrying after a
+    failure starts over."""
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    cleanup_expired()
+    now = time.time()
+    job = dict(fields, id=uuid.uuid4().hex, status='queued', progress={'stage': 'queued'}, result=None, error=None,
+               created=now, updated=now)
+    os.replace(write_temp(job), job_path(job['id']))  # before any key points at it
+    if not idempotency_key:
+        return job, True
+    path = key_path(idempotency_key, scope)
+    temp_path = write_temp(job['id'])
+    try:
+        try:
+            os.link(temp_path, path)  # atomic create-if-absent across processes
+        except FileExistsError:
+            existing_id = read_key(path)
+            existing = get_job(existing_id)
+            if existing is not None and existing['status'] != 'failed':
+                os.remove(job_path(job['id']))
+                return existing, False
+            # Concurrent retries of a failed job: the first to claim it replaces it, the rest join that one
+            claim = f'{path[:-len(".key")]}.{existing_id}.retry'
+            try:
+                os.link(temp_path, claim)
+            except FileExistsError:
+                winner = get_job(read_key(claim))
+                if winner is not None:
+                    os.remove(job_path(job['id']))
+                    return winner, False
+            os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return job, True
+
+
+def update_job(job_id, **fields):
+    """Change a job's record (only the process running the job writes it)"""
+    job = get_job(job_id)
+    if job is None:
+        return
+    job.update(fields, updated=time.time())
+    os.replace(write_temp(job), job_path(job_id))
+
+
+def submit(job_id, function, *args):
+    """Run function(progress, *args) in the pool; its return value becomes the job result.
+
+    progress(stage, done=None, total=None) records how far the job has got.
+    """
+    def progress(stage, done=None, total=None):
+        update_job(job_id, status='running', progress={'stage': stage, 'done': done, 'total': total})
+
+    def run():
+        started = time.time()
+        progress('started')
+        try:
+            result = function(progress, *args)
+        except Exception as e:
+            print(f"Attachment job {job_id} failed: {e}")
+            update_job(job_id, status='failed', error=str(e))
+            return
+        update_job(job_id, status='done', progress={'stage': 'done'}, result=result)
+        print(f"Attachment job {job_id} done in {time.time() - started:.1f}s")
+
+    return get_executor().submit(run)
+
+
+def job_status(job):
+    """The job as returned to clients"""
+    return {key: job[key] for key in ('id', 'status', 'progress', 'result', 'error', 'filename') if key in job}
+
+
+def cleanup_expired():
+    """Delete job files past their TTL (at most once a minute per process)"""
+    global _last_cleanup
+    now = time.time()
+    if now - _last_cleanup < CLEANUP_INTERVAL:
+        return
+    _last_cleanup = now
+    try:
+        names = os.listdir(JOBS_DIR)
+    except OSError:
+        return
+    for name in names:
+        path = os.path.join(JOBS_DIR, name)
+        try:
+            if now - os.path.getmtime(path) > max(JOB_TTL, JOB_STALE_SECONDS):
+                os.remove(path)
+        except OSError:
+            pass
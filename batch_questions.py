@@ -0,0 +1,85 @@
+"""Run a JSONL file of questions through the knowledge base pipeline.
+
+Each input line is a JSON object with the question in "message", "question" or "body"
+(so requests.jsonl-style files work as they are), an optional "id"/"request_id" and
+optional "user_language"/"output_language". Results are written as JSONL in completion
+order, each with its elapsed_ms, followed by a summary line; progress goes to stderr.
+
+By default the questions run in this process through ccc_core (needs Bedrock
+credentials, or BEDROCK_ENDPOINT_URL pointing at bedrock_stub.py). With --url they are
+posted to a running backend's /chat/batch instead, which also prefills that server's
+answer cache (set BATCH_API_TOKEN on the server and pass it with --token).
+
+Usage:
+    python batch_questions.py questions.jsonl [--workers 4] [--out results.jsonl]
+    python batch_questions.py questions.jsonl --url https://chat.example.edu --token $BATCH_API_TOKEN
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import urllib.request
+
+
+def run_local(lines, workers):
+    from ccc_core import batch
+
+    # The pipeline logs with print(); keep stdout for results only
+    with contextlib.redirect_stdout(sys.stderr):
+        yield from batch.run_batch(batch.parse_lines(lines), workers)
+
+
+def run_remote(lines, url, token, workers, timeout):
+    request = urllib.request.Request(
+        f"{url.rstrip('/')}/chat/batch?workers={workers}",
+        data=''.join(lines).encode('utf-8'),
+        headers={'Content-Type': 'application/x-ndjson', 'X-Batch-Token': token or ''},
+        method='POST'
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        for line in response:  # the server streams one result per line as questions finish
+            if line.strip():
+                yield json.loads(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input', help="JSONL file of questions ('-' for stdin)")
+    parser.add_argument('--out', help='write results here instead of stdout')
+    parser.add_argument('--workers', type=int, default=4, help='questions answered concurrently')
+    parser.add_argument('--url', help='backend base URL; runs the batch on that server via /chat/batch')
+    parser.add_argument('--token', default=os.getenv('BATCH_API_TOKEN'), help='X-Batch-Token for --url')
+    parser.add_argument('--timeout', type=float, default=300, help='seconds to wait for each result with --url')
+    args = parser.parse_args()
+
+    if args.input == '-':
+        lines = sys.stdin.readlines()
+    else:
+        with open(args.input, encoding='utf-8') as f:
+            lines = f.readlines()
+
+    if args.url:
+        results = run_remote(lines, args.url, args.token, args.workers, args.timeout)
+    else:
+        results = run_local(lines, args.workers)
+
+    out = open(args.out, 'w', encoding='utf-8') if args.out else sys.stdout
+    try:
+        for result in results:
+            out.write(json.dumps(result, ensure_ascii=False) + '\n')
+            out.flush()
+            if 'summary' in result:
+                print(f"Summary: {json.dumps(result['summary'])}", file=sys.stderr)
+            elif 'error' in result:
+                print(f"  {result['id']}: error: {result['error']}", file=sys.stderr)
+            else:
+                flags = ' (duplicate)' if result.get('deduplicated') else ' (cached)' if result.get('cached') else ''
+                print(f"  {result['id']}: {result['elapsed_ms']:.0f} ms{flags}", file=sys.stderr)
+    finally:
+        if args.out:
+            out.close()
+
+
+if __name__ == '__main__':
+    main()
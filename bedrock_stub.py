@@ -0,0 +1,124 @@
+"""Local stand-in for the Bedrock runtime APIs, for load tests and offline development.
+
+Answers retrieve_and_generate, retrieve and invoke_model with canned responses after a
+fixed delay that mimics model latency. Point the backend at it with:
+
+    python bedrock_stub.py --port 8765 --latency-ms 800
+    BEDROCK_ENDPOINT_URL=http://127.0.0.1:8765 AWS_ACCESS_KEY_ID=stub AWS_SECRET_ACCESS_KEY=stub \\
+        gunicorn -c gunicorn.conf.py chatbot_backend:app
+
+With --replay it answers retrieve_and_generate from responses recorded by
+bench_golden.py --record instead, keyed by the input text and delayed by the recorded
+latency (times --latency-scale); inputs without a recording get a 404.
+"""
+import argparse
+import json
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STUB_ANSWER = (
+    "CCCApply is the online application for the California Community Colleges [1]. "
+    "You create an OpenCCC account, then submit an application to each college you want to attend [1].\n\n"
+    "Sources:\n[1] CCCApply — https://www.cccapply.org/en/"
+)
+STUB_REFERENCE = {
+    'content': {'text': 'CCCApply is the online application for the California Community Colleges.'},
+    'location': {'type': 'WEB', 'webLocation': {'url': 'https://www.cccapply.org/en/'}},
+    'metadata': {'title': 'CCCApply'}
+}
+
+
+def load_recordings(path):
+    """retrieve_and_generate recordings by input text (see bench_golden.py)"""
+    with open(path, encoding='utf-8') as f:
+        return json.load(f).get('retrieve_and_generate', {})
+
+
+class BedrockStubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real endpoint
+    latency_ms = 800
+    recordings = None
+    latency_scale = 1.0
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        request_body = self.rfile.read(length)
+        if self.recordings is not None and self.path == '/retrieveAndGenerate':
+            self.replay(json.loads(request_body)['input']['text'])
+            return
+        time.sleep(self.latency_ms / 1000)
+
+        if self.path == '/retrieveAndGenerate':
+            payload = {
+                'sessionId': str(uuid.uuid4()),
+                'output': {'text': STUB_ANSWER},
+                'citations': [{'retrievedReferences': [STUB_REFERENCE]}]
+            }
+        elif self.path.endswith('/retrieve'):
+            payload = {'retrievalResults': [dict(STUB_REFERENCE, score=0.9)]}
+        elif self.path.startswith('/model/') and self.path.endswith('/invoke'):
+            payload = {
+                'id': 'stub', 'type': 'message', 'role': 'assistant',
+                'content': [{'type': 'text', 'text': STUB_ANSWER}],
+                'stop_reason': 'end_turn',
+                'usage': {'input_tokens': len(request_body) // 4, 'output_tokens': len(STUB_ANSWER) // 4}
+            }
+        else:
+            self.send_json(404, {'message': f'Unknown stub operation: {self.path}'})
+            return
+        self.send_json(200, payload)
+
+    def replay(self, input_text):
+        recording = self.recordings.get(input_text)
+        if not recording:
+            self.send_json(404, {'message': f'No recording for input: {input_text[:80]}'})
+            return
+        time.sleep(recording['latency_ms'] * self.latency_scale / 1000)
+        self.send_json(200, recording['response'])
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # One line per request would dominate load test output
+
+
+def make_server(port=8765, latency_ms=800, recordings=None, latency_scale=1.0):
+    handler = type('ConfiguredBedrockStubHandler', (BedrockStubHandler,), {
+        'latency_ms': latency_ms,
+        'recordings': recordings,
+        'latency_scale': latency_scale
+    })
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local Bedrock runtime stub')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=int, default=800, help='simulated model latency per call')
+    parser.add_argument('--replay', help='recordings file written by bench_golden.py --record')
+    parser.add_argument('--latency-scale', type=float, default=1.0, help='multiplier for recorded latencies')
+    args = parser.parse_args()
+
+    recordings = load_recordings(args.replay) if args.replay else None
+    server = make_server(args.port, args.latency_ms, recordings, args.latency_scale)
+    if recordings is not None:
+        print(f"Bedrock stub replaying {len(recordings)} recordings on http://127.0.0.1:{args.port}")
+    else:
+        print(f"Bedrock stub listening on http://127.0.0.1:{args.port} ({args.latency_ms} ms latency)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
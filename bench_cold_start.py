@@ -0,0 +1,177 @@
+"""Local cold-start benchmark for the Lambda and Flask entry points.
+
+Measures, in fresh interpreter processes:
+  - import time of each entry point (chatbot_backend, lambda_function, kb_sync_lambda,
+    kb_ingestion_monitor), so shared ccc_core changes show up in every deployment
+  - first-invocation vs warm-invocation lambda_function handler latency, with Bedrock
+    replaced by a botocore Stubber so no AWS calls are made
+  - the `-X importtime` breakdown of one entry point (lambda_function by default)
+
+With --check it also verifies that heavy optional stacks (PyMuPDF, langdetect,
+googletrans, numpy, boto3) stay deferred until first use and that each entry point imports
+within its budget, exiting non-zero otherwise, so it can run as a CI step.
+
+Usage:
+    python bench_cold_start.py [--runs 5] [--top 10] [--profile chatbot_backend] [--check]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Fake credentials/region so boto3 can build clients without touching AWS
+BENCH_ENV = dict(
+    os.environ,
+    AWS_ACCESS_KEY_ID='bench',
+    AWS_SECRET_ACCESS_KEY='bench',
+    AWS_REGION='us-west-2',
+    AWS_DEFAULT_REGION='us-west-2',
+    PYTHONDONTWRITEBYTECODE='1'
+)
+
+ENTRY_POINTS = ['chatbot_backend', 'lambda_function', 'kb_sync_lambda', 'kb_ingestion_monitor']
+
+# Packages an entry point must not load at import time (they are imported on first use)
+DEFERRED_IMPORTS = {
+    'chatbot_backend': ['boto3', 'botocore', 'fitz', 'pymupdf', 'langdetect', 'googletrans', 'httpx', 'numpy',
+                        'ccc_core.local_index'],
+    'lambda_function': ['fitz', 'pymupdf', 'langdetect', 'googletrans', 'httpx', 'numpy', 'ccc_core.local_index']
+}
+# Median import budgets for --check; generous enough for a shared CI runner
+IMPORT_BUDGETS_MS = {
+    'chatbot_backend': 400,
+    'lambda_function': 500
+}
+
+IMPORT_SCRIPT = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import MODULE
+import_ms = (time.perf_counter() - t0) * 1000
+packages = sorted({name.split('.')[0] for name in sys.modules} | {name for name in sys.modules if name.startswith('ccc_core.')})
+print('BENCH ' + json.dumps({'import_ms': import_ms, 'modules': len(sys.modules), 'packages': packages}))
+"""
+
+INVOCATION_SCRIPT = r"""
+import json, time
+t0 = time.perf_counter()
+import lambda_function
+import_ms = (time.perf_counter() - t0) * 1000
+from botocore.stub import Stubber
+
+stubber = Stubber(lambda_function.bedrock_agent_runtime)
+canned = {
+    'output': {'text': 'CCCApply is the online application for California community colleges. [1]'},
+    'citations': [{'retrievedReferences': [{
+        'content': {'text': 'CCCApply is the online application for the California Community Colleges.'},
+        'location': {'type': 'WEB', 'webLocation': {'url': 'https://www.cccapply.org/en/'}},
+        'metadata': {'title': 'CCCApply'}
+    }]}],
+    'sessionId': 'bench'
+}
+for _ in range(INVOCATIONS):
+    stubber.add_response('retrieve_and_generate', canned)
+stubber.activate()
+
+timings = []
+for n in range(INVOCATIONS):
+    # Distinct questions so warm invocations reach Bedrock instead of the answer cache
+    event = {'httpMethod': 'POST', 'body': json.dumps({'message': f'What is CCCApply? ({n})'})}
+    started = time.perf_counter()
+    lambda_function.lambda_handler(event, None)
+    timings.append((time.perf_counter() - started) * 1000)
+print('BENCH ' + json.dumps({'import_ms': import_ms, 'init_ms': lambda_function.INIT_DURATION_MS, 'invocations_ms': timings}))
+"""
+
+
+def run_bench_script(script):
+    completed = subprocess.run(
+        [sys.executable, '-c', script], cwd=HERE, env=BENCH_ENV, capture_output=True, text=True, check=True
+    )
+    for line in completed.stdout.splitlines():
+        if line.startswith('BENCH '):
+            return json.loads(line[len('BENCH '):])
+    raise RuntimeError(f"Benchmark run produced no result:\n{completed.stdout}\n{completed.stderr}")
+
+
+def run_invocations(invocations):
+    return run_bench_script(INVOCATION_SCRIPT.replace('INVOCATIONS', str(invocations)))
+
+
+def run_import(module):
+    return run_bench_script(IMPORT_SCRIPT.replace('MODULE', module))
+
+
+def import_time_breakdown(module):
+    """Return [(cumulative_us, self_us, module_name)] from `python -X importtime`"""
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=HERE, env=BENCH_ENV, capture_output=True, text=True, check=True
+    )
+    rows = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative_us), int(self_us), name.rstrip()))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help='fresh processes to sample')
+    parser.add_argument('--invocations', type=int, default=5, help='handler calls per process')
+    parser.add_argument('--top', type=int, default=10, help='slowest imports to list')
+    parser.add_argument('--profile', default='lambda_function', choices=ENTRY_POINTS, help='entry point to break down')
+    parser.add_argument('--check', action='store_true', help='fail on eager heavy imports or blown import budgets')
+    args = parser.parse_args()
+
+    failures = []
+    print(f"Entry point import time ({args.runs} fresh processes)")
+    for module in ENTRY_POINTS:
+        imports = [run_import(module) for _ in range(args.runs)]
+        import_ms = [result['import_ms'] for result in imports]
+        median_ms = statistics.median(import_ms)
+        print(f"  {module:22s} median {median_ms:8.1f} ms   max {max(import_ms):8.1f} ms"
+              f"   {imports[0]['modules']} modules")
+
+        eager = [name for name in DEFERRED_IMPORTS.get(module, []) if name in imports[0]['packages']]
+        if eager:
+            failures.append(f"{module} imports {', '.join(eager)} at import time")
+        budget_ms = IMPORT_BUDGETS_MS.get(module)
+        if budget_ms and median_ms > budget_ms:
+            failures.append(f"{module} import median {median_ms:.1f} ms exceeds the {budget_ms} ms budget")
+
+    results = [run_invocations(args.invocations) for _ in range(args.runs)]
+    import_ms = [result['import_ms'] for result in results]
+    init_ms = [result['init_ms'] for result in results]
+    first_ms = [result['invocations_ms'][0] for result in results]
+    warm_ms = [ms for result in results for ms in result['invocations_ms'][1:]]
+
+    print(f"\nlambda_function cold start ({args.runs} fresh processes)")
+    print(f"  import (wall)          median {statistics.median(import_ms):8.1f} ms   max {max(import_ms):8.1f} ms")
+    print(f"  init (module scope)    median {statistics.median(init_ms):8.1f} ms   max {max(init_ms):8.1f} ms")
+    print(f"  first invocation       median {statistics.median(first_ms):8.1f} ms   max {max(first_ms):8.1f} ms")
+    if warm_ms:
+        print(f"  warm invocation        median {statistics.median(warm_ms):8.1f} ms   max {max(warm_ms):8.1f} ms")
+
+    rows = import_time_breakdown(args.profile)
+    print(f"\nSlowest imports of {args.profile} (cumulative, -X importtime):")
+    for cumulative_us, self_us, name in sorted(rows, reverse=True)[:args.top]:
+        print(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+
+    if args.check:
+        if failures:
+            print("\nImport check FAILED:")
+            for failure in failures:
+                print(f"  - {failure}")
+            sys.exit(1)
+        print("\nImport check passed")
+
+
+if __name__ == '__main__':
+    main()
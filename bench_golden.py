@@ -0,0 +1,330 @@
+"""Answer quality and latency regression benchmark on a golden question set.
+
+Runs every question in golden_questions.jsonl through query_engine.query_knowledge_base
+one at a time (answer cache cleared first) and reports per question:
+  - latency: end to end, and the retrieve_and_generate call alone
+  - estimated output tokens (answer characters / 4; retrieve_and_generate reports no usage)
+  - the model the router picked (ccc_core.model_router) and the call's estimated cost
+  - citations returned by the model, sources shown to the user, and how many of the
+    question's "expect" terms appear in the answer or source URLs
+  - translation calls (question to English, answer back to the user's language)
+
+--record calls real Bedrock (or BEDROCK_ENDPOINT_URL) and Google Translate and saves the
+responses, their latency and a hash of the prompt/inference config to the recordings
+file. Without it the questions are replayed offline against bedrock_stub.py --replay
+with the recorded latencies, so a run only measures what changed in this repo.
+Prompt, inferenceConfig or routing changes (get_multilingual_prompt_template,
+TEXT_INFERENCE_CONFIG, model_router) change the model's answers, so re-record after them
+and compare the new run with the baseline. To measure routing itself, record and save a
+baseline with MODEL_ROUTING=off, then record with routing on into another recordings
+file and compare.
+
+Usage:
+    python bench_golden.py --record                  # needs AWS credentials
+    python bench_golden.py --save-baseline           # replay and keep the results
+    python bench_golden.py --check                   # replay, exit 1 on regressions
+    MODEL_ROUTING=off python bench_golden.py --record --recordings golden_recordings_sonnet.json
+"""
+import argparse
+import collections
+import hashlib
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+QUESTIONS_FILE = os.path.join(HERE, 'golden_questions.jsonl')
+RECORDINGS_FILE = os.path.join(HERE, 'golden_recordings.json')
+BASELINE_FILE = os.path.join(HERE, 'golden_baseline.json')
+
+CHARS_PER_TOKEN = 4
+# --check tolerances against the baseline
+LATENCY_TOLERANCE = 0.20
+LATENCY_FLOOR_MS = 50  # ignore jitter on fast (cached/local) answers
+TOKEN_TOLERANCE = 0.20
+COST_TOLERANCE = 0.20
+
+
+class CountingTranslator:
+    """Stands in for googletrans.Translator: counts calls and records or replays them"""
+
+    def __init__(self, upstream=None, recorded=None):
+        self.upstream = upstream
+        self.recorded = recorded if recorded is not None else {}
+        self.calls = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def translate(self, text, dest='en', src='auto'):
+        key = f"{src}|{dest}|{text}"
+        with self.lock:
+            self.calls += 1
+        if self.upstream is not None:
+            translated = self.upstream.translate(text, dest=dest, src=src).text
+            self.recorded[key] = translated
+        elif key in self.recorded:
+            translated = self.recorded[key]
+        else:
+            with self.lock:
+                self.misses += 1
+            translated = text
+        return Translated(translated)
+
+
+class Translated:
+    def __init__(self, text):
+        self.text = text
+
+
+def load_questions(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def prompt_hash(rag_config):
+    """Fingerprint of the prompt template and inference config sent to the model"""
+    return hashlib.sha256(json.dumps(rag_config, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+
+
+def start_replay_stub(recordings, latency_scale):
+    from bedrock_stub import make_server
+
+    server = make_server(0, recordings=recordings, latency_scale=latency_scale)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def instrument_client(client, calls):
+    """Time each retrieve_and_generate call and keep its input, config hash and response"""
+
+    def before_call(params, context, **kwargs):
+        context['golden_started'] = time.perf_counter()
+        context['golden_input'] = params['input']['text']
+        context['golden_prompt_hash'] = prompt_hash(params['retrieveAndGenerateConfiguration'])
+        kb_config = params['retrieveAndGenerateConfiguration']['knowledgeBaseConfiguration']
+        context['golden_model_id'] = kb_config['modelArn'].split('/')[-1]
+        context['golden_prompt_chars'] = len(kb_config['generationConfiguration']['promptTemplate']['textPromptTemplate'])
+
+    def after_call(http_response, parsed, context, **kwargs):
+        if 'golden_started' not in context:
+            return
+        response = {key: value for key, value in parsed.items() if key != 'ResponseMetadata'}
+        calls.append({
+            'input': context['golden_input'],
+            'prompt_hash': context['golden_prompt_hash'],
+            'model_id': context['golden_model_id'],
+            'prompt_chars': context['golden_prompt_chars'],
+            'latency_ms': round((time.perf_counter() - context['golden_started']) * 1000, 1),
+            'status': http_response.status_code,
+            'response': response
+        })
+
+    events = client.meta.events
+    events.register('before-parameter-build.bedrock-agent-runtime.RetrieveAndGenerate', before_call)
+    events.register('after-call.bedrock-agent-runtime.RetrieveAndGenerate', after_call)
+
+
+def expected_hits(item, result):
+    haystack = (result['answer'] + ' ' + ' '.join(source.get('uri') or '' for source in result['sources'])).lower()
+    return sum(1 for term in item.get('expect', []) if term.lower() in haystack)
+
+
+def estimated_cost(model_call, output_tokens):
+    """Prompt, question and retrieved passages in, answer out (characters / 4 each)"""
+    from ccc_core import model_router
+
+    passage_chars = sum(
+        len(reference.get('content', {}).get('text', ''))
+        for citation in model_call['response'].get('citations', [])
+        for reference in citation.get('retrievedReferences', [])
+    )
+    input_tokens = (model_call['prompt_chars'] + len(model_call['input']) + passage_chars) // CHARS_PER_TOKEN
+    return model_router.estimate_cost(model_call['model_id'], input_tokens, output_tokens)
+
+
+def run_question(item, query_engine, translator, calls):
+    query_engine.clear_caches()
+    translator.calls = 0
+    del calls[:]
+
+    started = time.perf_counter()
+    result = query_engine.query_knowledge_base(
+        item['question'], item.get('user_language', 'en'), item.get('output_language'), auto_detect=False
+    )
+    latency_ms = (time.perf_counter() - started) * 1000
+
+    model_call = calls[-1] if calls else None
+    output_tokens = len(result['answer']) // CHARS_PER_TOKEN
+    citations = 0
+    cost = None
+    if model_call and model_call['status'] == 200:
+        citations = sum(len(c.get('retrievedReferences', [])) for c in model_call['response'].get('citations', []))
+        cost = estimated_cost(model_call, output_tokens)
+    return {
+        'id': item['id'],
+        'user_language': item.get('user_language', 'en'),
+        'latency_ms': round(latency_ms, 1),
+        'model_ms': model_call['latency_ms'] if model_call else 0,
+        'output_chars': len(result['answer']),
+        'output_tokens_est': output_tokens,
+        'model_id': model_call['model_id'] if model_call else None,
+        'cost_usd_est': cost,
+        'citations': citations,
+        'sources': len(result['sources']),
+        'expected': len(item.get('expect', [])),
+        'expected_hits': expected_hits(item, result),
+        'translation_calls': translator.calls,
+        'answered': bool(model_call and model_call['status'] == 200),
+        'prompt_hash': model_call['prompt_hash'] if model_call else None
+    }, model_call
+
+
+def summarize(results):
+    latencies = [result['latency_ms'] for result in results]
+    return {
+        'questions': len(results),
+        'answered': sum(result['answered'] for result in results),
+        'latency_p50_ms': round(statistics.median(latencies), 1),
+        'latency_max_ms': max(latencies),
+        'output_tokens_est': sum(result['output_tokens_est'] for result in results),
+        'cost_usd_est': round(sum(result['cost_usd_est'] or 0 for result in results), 6),
+        'models': dict(collections.Counter(result['model_id'] for result in results if result['model_id'])),
+        'citations': sum(result['citations'] for result in results),
+        'sources': sum(result['sources'] for result in results),
+        'expected_hits': sum(result['expected_hits'] for result in results),
+        'translation_calls': sum(result['translation_calls'] for result in results)
+    }
+
+
+def compare(results, baseline):
+    """Regressions of this run against a saved baseline, as readable strings"""
+    regressions = []
+    previous = {result['id']: result for result in baseline['results']}
+    for result in results:
+        before = previous.get(result['id'])
+        if not before:
+            continue
+        name = result['id']
+        if result['latency_ms'] > max(before['latency_ms'] * (1 + LATENCY_TOLERANCE), before['latency_ms'] + LATENCY_FLOOR_MS):
+            regressions.append(f"{name}: latency {before['latency_ms']:.0f} -> {result['latency_ms']:.0f} ms")
+        if result['output_tokens_est'] > before['output_tokens_est'] * (1 + TOKEN_TOLERANCE):
+            regressions.append(f"{name}: output tokens {before['output_tokens_est']} -> {result['output_tokens_est']}")
+        before_cost, cost = before.get('cost_usd_est') or 0, result['cost_usd_est'] or 0
+        if before_cost and cost > before_cost * (1 + COST_TOLERANCE):
+            regressions.append(f"{name}: cost ${before_cost:.5f} -> ${cost:.5f} ({before.get('model_id')} -> {result['model_id']})")
+        if result['translation_calls'] > before['translation_calls']:
+            regressions.append(f"{name}: translation calls {before['translation_calls']} -> {result['translation_calls']}")
+        if result['sources'] < before['sources']:
+            regressions.append(f"{name}: sources {before['sources']} -> {result['sources']}")
+        if result['expected_hits'] < before['expected_hits']:
+            regressions.append(f"{name}: expected terms {before['expected_hits']} -> {result['expected_hits']}")
+        if before['answered'] and not result['answered']:
+            regressions.append(f"{name}: no longer answered")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--questions', default=QUESTIONS_FILE, help='golden questions (JSONL)')
+    parser.add_argument('--recordings', default=RECORDINGS_FILE, help='recorded Bedrock/translation responses')
+    parser.add_argument('--baseline', default=BASELINE_FILE, help='saved results to compare with')
+    parser.add_argument('--record', action='store_true', help='call the real services and save recordings')
+    parser.add_argument('--save-baseline', action='store_true', help='save this run as the baseline')
+    parser.add_argument('--check', action='store_true', help='exit non-zero on regressions against the baseline')
+    parser.add_argument('--latency-scale', type=float, default=1.0, help='multiplier for replayed model latency')
+    args = parser.parse_args()
+
+    questions = load_questions(args.questions)
+    recordings = {'retrieve_and_generate': {}, 'translations': {}}
+    stub = None
+    if not args.record:
+        if not os.path.exists(args.recordings):
+            sys.exit(f"No recordings at {args.recordings}; run with --record first")
+        with open(args.recordings, encoding='utf-8') as f:
+            recordings = json.load(f)
+        stub = start_replay_stub(recordings['retrieve_and_generate'], args.latency_scale)
+        # Must be set before ccc_core.config is imported
+        os.environ['BEDROCK_ENDPOINT_URL'] = f"http://127.0.0.1:{stub.server_address[1]}"
+        os.environ.setdefault('AWS_ACCESS_KEY_ID', 'replay')
+        os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'replay')
+    os.environ['LOCAL_INDEX_LOCATION'] = ''  # every question goes to the model
+
+    from ccc_core import clients, query_engine, translation
+
+    calls = []
+    instrument_client(clients.get_client('bedrock-agent-runtime'), calls)
+    if args.record:
+        translator = CountingTranslator(upstream=translation.get_translator())
+    else:
+        translator = CountingTranslator(recorded=recordings.get('translations', {}))
+    translation._translator = translator
+
+    current_hash = prompt_hash(query_engine.retrieve_and_generate_config('en', 'en'))
+    print(f"Golden set: {len(questions)} questions ({'recording' if args.record else 'replay'}), "
+          f"prompt/config {current_hash}")
+    print(f"  {'id':24s} {'lang':5s} {'latency':>9s} {'model':>9s} {'tokens':>7s} {'cost $':>9s} {'cites':>6s} "
+          f"{'srcs':>5s} {'expect':>7s} {'transl':>7s}  model")
+
+    results = []
+    stale = set()
+    for item in questions:
+        result, model_call = run_question(item, query_engine, translator, calls)
+        results.append(result)
+        if args.record and model_call:
+            recordings['retrieve_and_generate'][model_call['input']] = {
+                'latency_ms': model_call['latency_ms'],
+                'prompt_hash': model_call['prompt_hash'],
+                'model_id': model_call['model_id'],
+                'response': model_call['response']
+            }
+        elif model_call and model_call['status'] == 200:
+            recorded_hash = recordings['retrieve_and_generate'][model_call['input']].get('prompt_hash')
+            if recorded_hash != model_call['prompt_hash']:
+                stale.add(item['id'])
+        print(f"  {result['id']:24s} {result['user_language']:5s} {result['latency_ms']:7.0f}ms "
+              f"{result['model_ms']:7.0f}ms {result['output_tokens_est']:7d} {result['cost_usd_est'] or 0:9.5f} "
+              f"{result['citations']:6d} {result['sources']:5d} {result['expected_hits']:3d}/{result['expected']:<3d} "
+              f"{result['translation_calls']:7d}  {result['model_id'] or '-'}{'' if result['answered'] else '  (not answered)'}")
+
+    summary = summarize(results)
+    print(f"Summary: {json.dumps(summary)}")
+    print(f"Output language check: {json.dumps(translation.verification_stats())}")
+    if stub:
+        stub.shutdown()
+    if translator.misses:
+        print(f"Warning: {translator.misses} translations had no recording and were left untranslated")
+    if stale:
+        print(f"Warning: recorded with a different prompt/inference config or model, re-record to measure it: "
+              f"{', '.join(sorted(stale))}")
+
+    if args.record:
+        recordings['translations'] = translator.recorded
+        recordings['meta'] = {'recorded_at': time.strftime('%Y-%m-%dT%H:%M:%S'), 'prompt_hash': current_hash}
+        with open(args.recordings, 'w', encoding='utf-8') as f:
+            json.dump(recordings, f, ensure_ascii=False, indent=1, sort_keys=True)
+        print(f"Wrote {len(recordings['retrieve_and_generate'])} recordings to {args.recordings}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({'summary': summary, 'results': results}, f, ensure_ascii=False, indent=1)
+        print(f"Saved baseline to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f))
+        if regressions:
+            print("\nRegressions against the baseline:")
+            for regression in regressions:
+                print(f"  - {regression}")
+            if args.check:
+                sys.exit(1)
+        else:
+            print("No regressions against the baseline")
+    elif args.check:
+        sys.exit(f"No baseline at {args.baseline}; run with --save-baseline first")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Rerank latency per query at various over-fetch sizes (K).
+
+Times ccc_core.rerank.rerank over synthetic CCCApply-style passages (about the size of
+knowledge base chunks) for the English questions in golden_questions.jsonl, with the
+NumPy scorer and the plain-Python fallback, and checks that both pick the same passages.
+Latency includes tokenizing the K passages, which is the work the reranker adds per turn.
+
+Usage:
+    python bench_rerank.py [--k 10 30 50 100] [--top-n 5] [--repeats 20]
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import time
+
+from ccc_core import rerank
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+QUESTIONS_FILE = os.path.join(HERE, 'golden_questions.jsonl')
+
+SENTENCES = [
+    "CCCApply is the online application for the California Community Colleges.",
+    "You need an OpenCCC account before you can start an application.",
+    "If you forgot your password, use the account recovery link on the sign in page.",
+    "Residency is determined from your answers about where you have lived for the past two years.",
+    "Students who meet AB 540 requirements may be exempt from nonresident tuition.",
+    "The California College Promise Grant waives enrollment fees for eligible students.",
+    "International students apply through a separate international application.",
+    "You can apply to more than one college, but each college needs its own application.",
+    "Your CCCID is created when you set up your OpenCCC account.",
+    "Check the status of your application by contacting the admissions office of the college.",
+    "Financial aid applications are submitted through the FAFSA or the California Dream Act Application.",
+    "Colleges may take several business days to process a submitted application.",
+    "Save your progress often; applications are kept in your account for later.",
+    "Counselors can help you choose a program of study and plan transfer coursework.",
+    "Some colleges have priority registration deadlines for new students.",
+    "Update your contact information from the account settings page."
+]
+
+
+def load_questions(path):
+    with open(path, encoding='utf-8') as f:
+        items = [json.loads(line) for line in f if line.strip()]
+    return [item['question'] for item in items if item.get('user_language', 'en') == 'en']
+
+
+def synthetic_results(count, rng):
+    """retrieve()-shaped results of 6-10 sentences each, with vector scores in [0.3, 0.9]"""
+    return [
+        {
+            'content': {'text': ' '.join(rng.choice(SENTENCES) for _ in range(rng.randint(6, 10)))},
+            'location': {'type': 'WEB', 'webLocation': {'url': f'https://www.cccapply.org/en/page-{n}'}},
+            'score': rng.uniform(0.3, 0.9)
+        }
+        for n in range(count)
+    ]
+
+
+def time_rerank(questions, candidates, top_n, repeats, use_numpy):
+    timings = []
+    for _ in range(repeats):
+        for question, results in zip(questions, candidates):
+            started = time.perf_counter()
+            rerank.rerank(question, results, top_n, use_numpy=use_numpy)
+            timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.95) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--k', type=int, nargs='+', default=[10, 30, 50, 100], help='candidates fetched per query')
+    parser.add_argument('--top-n', type=int, default=5, help='passages kept for generation')
+    parser.add_argument('--repeats', type=int, default=20, help='passes over the question set')
+    args = parser.parse_args()
+
+    if rerank.numpy_available():
+        modes = [('numpy', True), ('python', False)]
+    else:
+        print("NumPy not installed; timing the plain-Python scorer only")
+        modes = [('python', False)]
+
+    questions = load_questions(QUESTIONS_FILE)
+    rng = random.Random(0)
+    print(f"Rerank latency per query ({len(questions)} questions x {args.repeats} repeats, top {args.top_n})")
+    print(f"  {'K':>5s}  " + '  '.join(f"{name + ' p50':>12s} {name + ' p95':>12s}" for name, _ in modes))
+    for k in args.k:
+        candidates = [synthetic_results(k, rng) for _ in questions]
+        if len(modes) > 1:
+            for question, results in zip(questions, candidates):
+                fast = rerank.rerank(question, results, args.top_n, use_numpy=True)
+                slow = rerank.rerank(question, results, args.top_n, use_numpy=False)
+                if [id(r) for r in fast] != [id(r) for r in slow]:
+                    print(f"  warning: NumPy and Python rankings differ for {question!r} at K={k}")
+        row = []
+        for _, use_numpy in modes:
+            p50, p95 = time_rerank(questions, candidates, args.top_n, args.repeats, use_numpy)
+            row.append(f"{p50:10.2f}ms {p95:10.2f}ms")
+        print(f"  {k:5d}  " + '  '.join(row))
+
+
+if __name__ == '__main__':
+    main()
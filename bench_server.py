@@ -0,0 +1,150 @@
+"""Throughput benchmark for the production server (gunicorn.conf.py) against the Bedrock stub.
+
+Starts bedrock_stub.py in-process, then for each worker count launches gunicorn with the
+production config and drives /chat with concurrent text questions (each one distinct, so
+the answer cache never short-circuits Bedrock). Prints the scaling curve: throughput and
+latency percentiles per worker count.
+
+Usage:
+    python bench_server.py [--workers 1,2,4] [--threads 8] [--requests 400] [--concurrency 64]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import bedrock_stub
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# English only: other languages add Google Translate round trips, which the stub can't replace
+QUESTIONS = [
+    "How do I create an OpenCCC account?",
+    "How do I apply for financial aid at a community college?",
+    "What documents do I need to apply to a California community college?",
+    "How do I submit my application to a community college?",
+    "Can I apply to more than one college at the same time?",
+    "How can I recover my CCCID if I forgot it?"
+]
+
+
+def default_worker_counts():
+    cores = multiprocessing.cpu_count()
+    counts = [1]
+    while counts[-1] * 2 <= cores * 2:
+        counts.append(counts[-1] * 2)
+    return counts
+
+
+def wait_for_server(base_url, process, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with status {process.returncode}")
+        try:
+            with urllib.request.urlopen(f"{base_url}/test", timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("gunicorn did not become ready in time")
+
+
+def post_question(base_url, question):
+    request = urllib.request.Request(
+        f"{base_url}/chat",
+        data=json.dumps({'message': question, 'conversation_history': []}).encode('utf-8'),
+        headers={'Content-Type': 'application/json'},
+        method='POST'
+    )
+    started = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=120) as response:
+        response.read()
+        ok = response.status == 200
+    return ok, (time.perf_counter() - started) * 1000
+
+
+def run_load(base_url, total_requests, concurrency):
+    # Distinct questions so every request reaches the (stubbed) knowledge base
+    questions = [f"{QUESTIONS[n % len(QUESTIONS)]} ({n})" for n in range(total_requests)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda question: post_question(base_url, question), questions))
+    elapsed = time.perf_counter() - started
+    latencies = sorted(ms for ok, ms in results)
+    return {
+        'throughput': total_requests / elapsed,
+        'errors': sum(1 for ok, ms in results if not ok),
+        'p50_ms': statistics.median(latencies),
+        'p95_ms': latencies[int(len(latencies) * 0.95) - 1]
+    }
+
+
+def bench_workers(workers, args, stub_url):
+    port = args.port
+    env = dict(
+        os.environ,
+        AWS_ACCESS_KEY_ID='bench',
+        AWS_SECRET_ACCESS_KEY='bench',
+        AWS_REGION='us-west-2',
+        AWS_DEFAULT_REGION='us-west-2',
+        BEDROCK_ENDPOINT_URL=stub_url,
+        BIND=f"127.0.0.1:{port}",
+        WEB_WORKERS=str(workers),
+        WEB_THREADS=str(args.threads),
+        WEB_ACCESS_LOG='',
+        REQUEST_LOG_PATH=''  # keep benchmark questions out of the cache-warming log
+    )
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'chatbot_backend:app'],
+        cwd=HERE, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        base_url = f"http://127.0.0.1:{port}"
+        boot_started = time.perf_counter()
+        wait_for_server(base_url, process)
+        boot_s = time.perf_counter() - boot_started
+        run_load(base_url, min(args.concurrency, args.requests), args.concurrency)  # warm up every worker
+        result = run_load(base_url, args.requests, args.concurrency)
+        result['boot_s'] = boot_s
+        return result
+    finally:
+        process.terminate()
+        process.wait(timeout=60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', help='comma-separated worker counts (default: 1, 2, 4 ... 2x cores)')
+    parser.add_argument('--threads', type=int, default=8, help='threads per worker')
+    parser.add_argument('--requests', type=int, default=400, help='requests per worker count')
+    parser.add_argument('--concurrency', type=int, default=64, help='concurrent client connections')
+    parser.add_argument('--latency-ms', type=int, default=200, help='simulated Bedrock latency')
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--stub-port', type=int, default=8765)
+    args = parser.parse_args()
+
+    worker_counts = [int(n) for n in args.workers.split(',')] if args.workers else default_worker_counts()
+
+    stub = bedrock_stub.make_server(args.stub_port, args.latency_ms)
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+    stub_url = f"http://127.0.0.1:{args.stub_port}"
+
+    print(f"{multiprocessing.cpu_count()} cores, {args.threads} threads/worker, {args.requests} requests, "
+          f"concurrency {args.concurrency}, stub latency {args.latency_ms} ms")
+    print(f"{'workers':>8} {'boot s':>8} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7}")
+    for workers in worker_counts:
+        result = bench_workers(workers, args, stub_url)
+        print(f"{workers:8d} {result['boot_s']:8.1f} {result['throughput']:8.1f} "
+              f"{result['p50_ms']:8.0f} {result['p95_ms']:8.0f} {result['errors']:7d}")
+    stub.shutdown()
+
+
+if __name__ == '__main__':
+    main()
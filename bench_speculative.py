@@ -0,0 +1,118 @@
+"""End-to-end latency of non-English questions, serial vs speculative pipeline.
+
+Runs the non-English questions in golden_questions.jsonl through query_knowledge_base
+with SPECULATIVE_PIPELINE off and on, against an in-process bedrock_stub.py (fixed model
+latency) and a stand-in translator with a fixed per-call latency, so only the
+orchestration differs. The stub always answers in English, so a speculative answer still
+pays one answer translation here that a real model answering in the user's language
+would not. Two scenarios:
+  - cold: nothing cached, every question needs a generation (speculation starts once the
+    translation has taken longer than SPECULATION_DELAY_MS)
+  - canonical cached: the English answer exists (the question was asked before in another
+    language), so only translations are needed and the speculative answer is discarded
+
+Questions are sent the way the widget sends them before a language is picked
+(user_language 'en', auto-detected); --declared passes each question's language instead.
+
+Usage:
+    python bench_speculative.py [--model-ms 1500] [--translate-ms 300] [--repeats 3] [--declared]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+QUESTIONS_FILE = os.path.join(HERE, 'golden_questions.jsonl')
+
+
+class DelayedTranslator:
+    """Stands in for googletrans.Translator with a fixed network latency per call"""
+
+    def __init__(self, latency_ms):
+        self.latency_ms = latency_ms
+
+    def translate(self, text, dest='en', src='auto'):
+        time.sleep(self.latency_ms / 1000)
+        return Translated(f"[{dest}] {text}")
+
+
+class Translated:
+    def __init__(self, text):
+        self.text = text
+
+
+def load_questions(path):
+    with open(path, encoding='utf-8') as f:
+        items = [json.loads(line) for line in f if line.strip()]
+    return [item for item in items if item.get('user_language', 'en') != 'en']
+
+
+def run(query_engine, item, declared):
+    language = item['user_language'] if declared else 'en'
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):  # the pipeline logs every stage
+        query_engine.query_knowledge_base(item['question'], language, item.get('output_language'))
+    return (time.perf_counter() - started) * 1000
+
+
+def measure(query_engine, config, questions, speculative, warm_canonical, repeats, declared):
+    timings = []
+    for _ in range(repeats):
+        for item in questions:
+            query_engine.clear_caches()
+            if warm_canonical:
+                # The serial pipeline fills the canonical English answer directly (a speculative
+                # win only back-fills it in the background)
+                config.SPECULATIVE_PIPELINE = False
+                run(query_engine, item, declared)
+                query_engine.answer_cache.clear()
+                query_engine.translation_cache.clear()
+                query_engine.question_translation_cache.clear()
+            config.SPECULATIVE_PIPELINE = speculative
+            timings.append(run(query_engine, item, declared))
+    return statistics.median(timings), max(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model-ms', type=int, default=1500, help='simulated retrieve_and_generate latency')
+    parser.add_argument('--translate-ms', type=int, default=300, help='simulated latency per translation call')
+    parser.add_argument('--repeats', type=int, default=3, help='passes over the question set')
+    parser.add_argument('--declared', action='store_true', help="send each question's language instead of auto-detecting")
+    args = parser.parse_args()
+
+    from bedrock_stub import make_server
+
+    stub = make_server(0, latency_ms=args.model_ms)
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+    # Must be set before ccc_core.config is imported
+    os.environ['BEDROCK_ENDPOINT_URL'] = f"http://127.0.0.1:{stub.server_address[1]}"
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'bench')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'bench')
+    os.environ['LOCAL_INDEX_LOCATION'] = ''
+
+    from ccc_core import config, query_engine, translation
+
+    translation._translator = DelayedTranslator(args.translate_ms)
+    translation.load_language_profiles()
+    questions = load_questions(QUESTIONS_FILE)
+
+    print(f"{len(questions)} non-English questions x {args.repeats}, model {args.model_ms} ms, "
+          f"translation {args.translate_ms} ms/call, {'declared' if args.declared else 'auto-detected'} language")
+    print(f"  {'scenario':18s} {'serial p50':>11s} {'speculative p50':>16s} {'saved':>8s}   (max serial / speculative)")
+    for name, warm_canonical in (('cold', False), ('canonical cached', True)):
+        serial_p50, serial_max = measure(query_engine, config, questions, False, warm_canonical, args.repeats, args.declared)
+        speculative_p50, speculative_max = measure(query_engine, config, questions, True, warm_canonical, args.repeats, args.declared)
+        saved = (serial_p50 - speculative_p50) / serial_p50 * 100
+        print(f"  {name:18s} {serial_p50:9.0f}ms {speculative_p50:14.0f}ms {saved:7.1f}%   "
+              f"({serial_max:.0f} / {speculative_max:.0f} ms)")
+    stub.shutdown()
+
+
+if __name__ == '__main__':
+    main()
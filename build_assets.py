@@ -0,0 +1,235 @@
+"""Build step for the chat widget's static assets.
+
+Writes production copies of the widget files to STATIC_DIR (default ./static):
+  - JS/CSS minified (rjsmin/rcssmin when installed; CSS falls back to a built-in
+    minifier, JS is copied as-is) and fingerprinted with a content hash
+  - background.png recompressed and converted to WebP and AVIF (Pillow, when installed);
+    the demo page offers them through image-set() with the PNG as fallback
+  - gzip and brotli (when installed) copies of every text asset, served to clients
+    that accept them
+  - chatbot_loader.js (the embed snippet, kept under its plain name) pointing at the
+    fingerprinted widget files, which it loads on first use
+  - asset-manifest.json mapping each source name to its built name; chatbot_backend
+    only serves files listed there
+  - message-catalog.json: ccc_core.messages translated into every supported language
+    (googletrans, when installed), so error and widget messages are never translated
+    per request; messages unchanged since the previous build are not re-translated
+
+Usage:
+    pip install -r requirements_build.txt   # optional, for full minification/compression
+    python build_assets.py [--out static]
+"""
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.getenv('STATIC_DIR', os.path.join(HERE, 'static'))
+MANIFEST_NAME = 'asset-manifest.json'
+MESSAGE_CATALOG_NAME = 'message-catalog.json'
+
+BACKGROUND_IMAGE = 'background.png'
+WIDGET_CSS = 'chatbot_widget.css'
+WIDGET_JS = 'chatbot_widget.js'
+WIDGET_HTML = 'chatbot_widget.html'
+WIDGET_MARKUP = 'chatbot_widget_markup.html'
+WIDGET_LOADER = 'chatbot_loader.js'
+
+COMPRESSIBLE_EXTENSIONS = {'.js', '.css', '.html', '.json', '.svg'}
+WEBP_QUALITY = 80
+AVIF_QUALITY = 60
+HASH_LENGTH = 10
+
+
+def fingerprint(filename, data):
+    """background.png + bytes -> background.<hash>.png"""
+    stem, ext = os.path.splitext(filename)
+    return f"{stem}.{hashlib.sha256(data).hexdigest()[:HASH_LENGTH]}{ext}"
+
+
+def minify_css(css):
+    """Strip comments and insignificant whitespace (good enough for hand-written CSS)"""
+    try:
+        import rcssmin
+
+        return rcssmin.cssmin(css)
+    except ImportError:
+        pass
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.DOTALL)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{};,>])\s*', r'\1', css)
+    return css.replace(';}', '}').strip()
+
+
+def minify_js(js):
+    try:
+        import rjsmin
+    except ImportError:
+        print("  rjsmin not installed; copying JS unminified (still compressed)")
+        return js
+    return rjsmin.jsmin(js)
+
+
+def compress_variants(path, data):
+    """Write .gz/.br next to a text asset when they are smaller than the original"""
+    written = {}
+    gz = gzip.compress(data, compresslevel=9, mtime=0)  # mtime=0 keeps builds reproducible
+    if len(gz) < len(data):
+        with open(path + '.gz', 'wb') as f:
+            f.write(gz)
+        written['gzip'] = len(gz)
+    try:
+        import brotli
+
+        br = brotli.compress(data, quality=11)
+        if len(br) < len(data):
+            with open(path + '.br', 'wb') as f:
+                f.write(br)
+            written['br'] = len(br)
+    except ImportError:
+        pass
+    return written
+
+
+def optimize_images(source_path):
+    """Return {ext: bytes} for the background: optimized PNG plus WebP/AVIF when possible"""
+    with open(source_path, 'rb') as f:
+        original = f.read()
+    try:
+        from PIL import Image, features
+    except ImportError:
+        print("  Pillow not installed; copying background.png unoptimized")
+        return {'.png': original}
+
+    variants = {}
+    with Image.open(source_path) as image:
+        image.load()
+        buffer = io.BytesIO()
+        image.save(buffer, format='PNG', optimize=True)
+        variants['.png'] = min(buffer.getvalue(), original, key=len)
+        if features.check('webp'):
+            buffer = io.BytesIO()
+            image.save(buffer, format='WEBP', quality=WEBP_QUALITY, method=6)
+            variants['.webp'] = buffer.getvalue()
+        if features.check('avif'):
+            buffer = io.BytesIO()
+            image.save(buffer, format='AVIF', quality=AVIF_QUALITY)
+            variants['.avif'] = buffer.getvalue()
+    return variants
+
+
+def background_css(images, prefix=''):
+    """CSS declarations for the background: plain PNG, then image-set() for modern formats"""
+    declaration = f"background-image: url('{prefix}{images['.png']}');"
+    candidates = [
+        f"url('{prefix}{images[ext]}') type('{mime}')"
+        for ext, mime in (('.avif', 'image/avif'), ('.webp', 'image/webp'), ('.png', 'image/png'))
+        if ext in images
+    ]
+    if len(candidates) > 1:
+        # Browsers without image-set() ignore this declaration and keep the PNG
+        declaration += f" background-image: image-set({', '.join(candidates)});"
+    return declaration
+
+
+def build_message_catalog(out_dir, previous):
+    """Write the localized message catalog, reusing previous translations"""
+    from ccc_core import messages, translation
+
+    if not translation.translation_available():
+        print("  googletrans not installed; no message catalog (messages are translated live)")
+        return
+    catalog, translated, reused = messages.build_catalog(previous)
+    with open(os.path.join(out_dir, MESSAGE_CATALOG_NAME), 'w', encoding='utf-8') as f:
+        json.dump(catalog, f, ensure_ascii=False, indent=1, sort_keys=True)
+    print(f"  {MESSAGE_CATALOG_NAME}: {len(catalog['languages'])} languages, "
+          f"{translated} messages translated, {reused} reused")
+
+
+def load_previous_catalog(out_dir):
+    try:
+        with open(os.path.join(out_dir, MESSAGE_CATALOG_NAME), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def build(out_dir=STATIC_DIR):
+    previous_catalog = load_previous_catalog(out_dir)
+    if os.path.isdir(out_dir):
+        shutil.rmtree(out_dir)
+    os.makedirs(out_dir)
+    manifest = {}
+    report = []
+
+    def emit(source_name, data, built_name):
+        path = os.path.join(out_dir, built_name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        compressed = compress_variants(path, data) if os.path.splitext(built_name)[1] in COMPRESSIBLE_EXTENSIONS else {}
+        report.append((built_name, len(data), compressed))
+        return built_name
+
+    # Images first: the demo page refers to their fingerprinted names
+    images = {}
+    source_path = os.path.join(HERE, BACKGROUND_IMAGE)
+    source_size = os.path.getsize(source_path)
+    for ext, data in optimize_images(source_path).items():
+        name = os.path.splitext(BACKGROUND_IMAGE)[0] + ext
+        images[ext] = emit(name, data, fingerprint(name, data))
+        manifest[name] = images[ext]
+    print(f"  {BACKGROUND_IMAGE}: {source_size:,} bytes source")
+
+    with open(os.path.join(HERE, WIDGET_CSS), encoding='utf-8') as f:
+        css_data = minify_css(f.read()).encode('utf-8')
+    manifest[WIDGET_CSS] = emit(WIDGET_CSS, css_data, fingerprint(WIDGET_CSS, css_data))
+
+    with open(os.path.join(HERE, WIDGET_JS), encoding='utf-8') as f:
+        js_data = minify_js(f.read()).encode('utf-8')
+    manifest[WIDGET_JS] = emit(WIDGET_JS, js_data, fingerprint(WIDGET_JS, js_data))
+
+    with open(os.path.join(HERE, WIDGET_MARKUP), 'rb') as f:
+        markup_data = f.read()
+    manifest[WIDGET_MARKUP] = emit(WIDGET_MARKUP, markup_data, fingerprint(WIDGET_MARKUP, markup_data))
+
+    # The loader is embedded by host pages under its plain name and revalidated, so it can
+    # refer to the fingerprinted (forever-cacheable) widget files
+    with open(os.path.join(HERE, WIDGET_LOADER), encoding='utf-8') as f:
+        loader = f.read()
+    for name in (WIDGET_CSS, WIDGET_JS, WIDGET_MARKUP):
+        loader = loader.replace(f"'{name}'", f"'static/{manifest[name]}'")
+    loader_data = minify_js(loader).encode('utf-8')
+    manifest[WIDGET_LOADER] = emit(WIDGET_LOADER, loader_data, fingerprint(WIDGET_LOADER, loader_data))
+
+    # The demo page keeps its name too; only its background needs rewriting
+    with open(os.path.join(HERE, WIDGET_HTML), encoding='utf-8') as f:
+        html = f.read()
+    html = re.sub(r"background-image:\s*url\(['\"]?background\.png['\"]?\);", background_css(images, 'static/'), html)
+    manifest[WIDGET_HTML] = emit(WIDGET_HTML, html.encode('utf-8'), WIDGET_HTML)
+
+    with open(os.path.join(out_dir, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    build_message_catalog(out_dir, previous_catalog)
+
+    for name, size, compressed in report:
+        variants = ', '.join(f"{encoding} {compressed_size:,}" for encoding, compressed_size in compressed.items())
+        print(f"  {name:40s} {size:>10,} bytes{'   (' + variants + ')' if variants else ''}")
+    print(f"Wrote {len(manifest)} assets to {out_dir}")
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--out', default=STATIC_DIR, help='output directory')
+    args = parser.parse_args()
+    build(args.out)
+
+
+if __name__ == '__main__':
+    main()
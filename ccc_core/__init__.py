@@ -0,0 +1,23 @@
+"""Core question-answering library shared by the Flask app and the Lambda handler.
+
+Submodules are imported lazily on first attribute access, so an entry point only pays
+for what it uses (the Lambda cold path never loads the PDF or translation stacks):
+
+    from ccc_core import query_engine      # loads query_engine (and its light deps)
+    import ccc_core; ccc_core.translation  # loads translation on first access
+"""
+import importlib
+
+__all__ = ['answer_cache', 'batch', 'citations', 'clients', 'compression', 'config', 'languages', 'local_index', 'messages', 'model_router', 'query_engine', 'rerank', 'translation']
+
+
+def __getattr__(name):
+    if name in __all__:
+        module = importlib.import_module(f'.{name}', __name__)
+        globals()[name] = module
+        return module
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,132 @@
+"""Batch question runner shared by the /chat/batch endpoint and batch_questions.py.
+
+Items are plain dicts (see parse_item). run_batch() answers them through
+query_engine.query_knowledge_base with bounded parallelism: identical questions (same
+text and languages) are answered once, and answers land in the shared answer cache, so
+a batch also prefills it. Results are yielded as they complete, one dict per input
+item with its elapsed_ms, followed by a summary dict.
+"""
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from . import config, query_engine
+
+
+def parse_item(entry, number):
+    """Normalize one input entry; the question may be in message, question or body"""
+    if not isinstance(entry, dict):
+        return {'id': number, 'error': 'Item must be a JSON object'}
+    
+    item_id = entry.get('id', entry.get('request_id', number))
+    question = entry.get('message') or entry.get('question') or entry.get('body') or ''
+    if not isinstance(question, str) or not question.strip():
+        return {'id': item_id, 'error': 'No question provided'}
+    
+    return {
+        'id': item_id,
+        'question': question.strip(),
+        'user_language': entry.get('user_language') or 'en',
+        'output_language': entry.get('output_language')
+    }
+
+
+def parse_lines(lines):
+    """Yield items from JSONL lines, skipping blank lines; bad lines become error items"""
+    number = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        number += 1
+        try:
+            entry = json.loads(line)
+        except ValueError as e:
+            yield {'id': number, 'error': f'Invalid JSON: {e}'}
+            continue
+        yield parse_item(entry, number)
+
+
+def item_key(item):
+    return query_engine.answer_cache_key(item['question'], item['user_language'], item['output_language'])
+
+
+def answer_item(item):
+    """Answer one item, timing it and noting whether the answer cache already had it"""
+    cached = query_engine.answer_cache.get(item_key(item)) is not None
+    started = time.perf_counter()
+    try:
+        result = query_engine.query_knowledge_base(item['question'], item['user_language'], item['output_language'])
+    except Exception as e:
+        return {'error': str(e), 'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)}
+    if result.get('is_error'):
+        # The knowledge base failed; the answer is the (localized) error message
+        return {
+            'error': result['answer'],
+            'detected_language': result['detected_language'],
+            'output_language': result['output_language'],
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)
+        }
+    
+    return {
+        'answer': result['answer'],
+        'sources': result['sources'],
+        'detected_language': result['detected_language'],
+        'output_language': result['output_language'],
+        'cached': cached,
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)
+    }
+
+
+def summarize(results, wall_ms):
+    """Counts and latency percentiles of the questions that were actually run"""
+    timings = sorted(r['elapsed_ms'] for r in results if not r.get('deduplicated') and 'elapsed_ms' in r)
+    summary = {
+        'items': len(results),
+        'answered': sum(1 for r in results if 'answer' in r),
+        'errors': sum(1 for r in results if 'error' in r),
+        'deduplicated': sum(1 for r in results if r.get('deduplicated')),
+        'cached': sum(1 for r in results if r.get('cached')),
+        'wall_ms': round(wall_ms, 1)
+    }
+    if timings:
+        summary['p50_ms'] = round(statistics.median(timings), 1)
+        summary['p95_ms'] = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    return summary
+
+
+def run_batch(items, max_workers=config.BATCH_MAX_WORKERS):
+    """Yield one result per item as answers complete, then {'summary': {...}}"""
+    started = time.perf_counter()
+    results = []
+    groups = {}  # answer cache key -> items asking that question
+    
+    def emit(result):
+        results.append(result)
+        return result
+    
+    executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+    try:
+        futures = {}
+        for item in items:
+            if 'error' in item:
+                yield emit(dict(item))
+                continue
+            key = item_key(item)
+            if key in groups:
+                groups[key].append(item)
+                continue
+            groups[key] = [item]
+            futures[executor.submit(answer_item, item)] = key
+        
+        for future in as_completed(futures):
+            first, *duplicates = groups[futures[future]]
+            result = future.result()
+            yield emit(dict(result, id=first['id'], question=first['question']))
+            for item in duplicates:
+                yield emit(dict(result, id=item['id'], question=item['question'], deduplicated=True, elapsed_ms=0.0))
+    finally:
+        # A client that disconnects mid-batch shouldn't keep queued questions running
+        executor.shutdown(wait=False, cancel_futures=True)
+    
+    yield {'summary': summarize(results, (time.perf_counter() - started) * 1000)}
@@ -0,0 +1,157 @@
+"""Citation handling: turning retrieved references into numbered, deduplicated sources"""
+
+
+def extract_key_phrase(text):
+    """Extract a key phrase from the content for deep linking"""
+    if not text:
+        return "Document content"
+    
+    # Clean the text
+    text = text.strip()
+    
+    # Look for headings (lines starting with #)
+    lines = text.split('\n')
+    for line in lines:
+        line = line.strip()
+        if line.startswith('#') and len(line) > 3:
+            phrase = line.replace('#', '').strip()
+            if len(phrase) > 5 and not phrase.isdigit():  # Avoid single numbers
+                return phrase[:50]
+    
+    # Look for sentences with key terms
+    sentences = text.split('. ')
+    for sentence in sentences[:3]:  # Check first 3 sentences
+        sentence = sentence.strip()
+        if len(sentence) > 20 and len(sentence) < 100 and not sentence.isdigit():
+            return sentence[:50]
+    
+    # Look for any meaningful phrase (avoid single words/numbers)
+    words = text.split()
+    if len(words) >= 3:
+        # Take first few words that form a meaningful phrase
+        phrase = ' '.join(words[:8])  # First 8 words
+        if len(phrase) > 10 and not phrase.isdigit():
+            return phrase[:50]
+    
+    # Fallback to first 50 characters, but avoid if it's just numbers
+    fallback = text[:50]
+    if fallback.strip() and not fallback.strip().isdigit():
+        return fallback
+    
+    # Final fallback
+    return "Document excerpt"
+
+
+def is_better_title(new_title, existing_title):
+    """Determine if new title is better than existing (prefer plain language over numbers)"""
+    if not existing_title:
+        return True
+    if not new_title:
+        return False
+    
+    # Prefer titles with letters over pure numbers
+    new_has_letters = any(c.isalpha() for c in new_title)
+    existing_has_letters = any(c.isalpha() for c in existing_title)
+    
+    if new_has_letters and not existing_has_letters:
+        return True
+    if existing_has_letters and not new_has_letters:
+        return False
+    
+    # If both have letters or both are numeric, prefer longer title
+    return len(new_title) > len(existing_title)
+
+
+def normalize_url(url):
+    """Normalize URL to catch duplicates with different formats"""
+    if not url:
+        return url
+    
+    # Remove trailing slashes and fragments
+    url = url.rstrip('/').split('#')[0].split('?')[0]
+    
+    # Extract the core page identifier (usually the page ID)
+    # For Jira/Confluence URLs, extract the page ID
+    if '/pages/' in url:
+        parts = url.split('/pages/')
+        if len(parts) > 1:
+            page_part = parts[1].split('/')[0]  # Get just the page ID
+            return f"{parts[0]}/pages/{page_part}"
+    
+    return url
+
+
+def reference_title(reference, uri, location_type):
+    """Use the metadata title if it's meaningful, otherwise derive one from the URI"""
+    if location_type == 'webLocation':
+        # Extract title from URL - replace + with spaces and decode
+        url_title = uri.split('/')[-1].replace('+', ' ') if uri else 'Web Document'
+        default_title = 'Web Document'
+    else:
+        # Extract title from URI path
+        url_title = uri.split('/')[-1] if uri else 'Document'
+        default_title = 'Document'
+    
+    metadata_title = reference.get('metadata', {}).get('title', '')
+    if metadata_title and len(metadata_title) > 3 and not metadata_title.isdigit():
+        return metadata_title
+    return url_title or default_title
+
+
+def reference_location(reference):
+    """(uri, location type) of a retrieved reference, or (None, None) for other location types"""
+    location = reference.get('location', {})
+    if 'webLocation' in location:
+        return location['webLocation']['url'], 'webLocation'
+    if 's3Location' in location:
+        return location['s3Location']['uri'], 's3Location'
+    return None, None
+
+
+def build_sources(citations):
+    """Flatten retrieve_and_generate citations into numbered sources, one per page"""
+    unique_sources = {}  # Track unique documents by normalized URI
+    
+    for citation in citations:
+        for reference in citation.get('retrievedReferences', []):
+            uri, location_type = reference_location(reference)
+            if not uri:
+                continue
+            title = reference_title(reference, uri, location_type)
+            
+            # Extract a snippet of the relevant text for deep linking
+            content_text = reference.get('content', {}).get('text', '')
+            snippet = extract_key_phrase(content_text)
+            
+            # Deduplicate by normalized URI - keep the best title and snippet
+            normalized_uri = normalize_url(uri)
+            if normalized_uri not in unique_sources:
+                unique_sources[normalized_uri] = {
+                    'title': title,
+                    'uri': uri,  # Keep original URI for linking
+                    'snippet': snippet,
+                    'content': content_text
+                }
+            else:
+                existing = unique_sources[normalized_uri]
+                more_content = len(content_text) > len(existing['content'])
+                # Update if we have a better title or more content
+                if is_better_title(title, existing['title']) or more_content:
+                    # Keep the better title, but prefer more content for snippet
+                    unique_sources[normalized_uri] = {
+                        'title': title if is_better_title(title, existing['title']) else existing['title'],
+                        'uri': uri if more_content else existing['uri'],
+                        'snippet': snippet if more_content else existing['snippet'],
+                        'content': content_text if more_content else existing['content']
+                    }
+    
+    # Convert to final sources list with numbering
+    return [
+        {
+            'number': number,
+            'title': source_data['title'],
+            'uri': source_data['uri'],
+            'snippet': source_data['snippet']
+        }
+        for number, source_data in enumerate(unique_sources.values(), start=1)
+    ]
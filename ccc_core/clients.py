@@ -0,0 +1,46 @@
+"""Pooled AWS clients: one per service per process, created on first use.
+
+boto3 clients are thread-safe once built and keep a pool of HTTPS connections, so
+sharing them avoids a client construction and TLS handshake on every request.
+"""
+import threading
+
+from . import config
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def client_config():
+    from botocore.config import Config
+
+    return Config(
+        region_name=config.AWS_REGION,
+        connect_timeout=config.BEDROCK_CONNECT_TIMEOUT,
+        read_timeout=config.BEDROCK_READ_TIMEOUT,
+        retries={'max_attempts': config.BEDROCK_MAX_ATTEMPTS, 'mode': 'standard'},
+        max_pool_connections=config.BEDROCK_MAX_POOL_CONNECTIONS,
+        tcp_keepalive=True
+    )
+
+
+def get_client(service_name):
+    """Return the shared client for an AWS service, creating it on first use"""
+    client = _clients.get(service_name)
+    if client is None:
+        # Client creation is not thread-safe on the default session, so serialize it
+        with _lock:
+            client = _clients.get(service_name)
+            if client is None:
+                import boto3
+
+                endpoint_url = config.BEDROCK_ENDPOINT_URL if service_name in config.BEDROCK_RUNTIME_SERVICES else None
+                client = boto3.client(service_name, config=client_config(), endpoint_url=endpoint_url)
+                _clients[service_name] = client
+    return client
+
+
+def reset_clients():
+    """Drop all pooled clients (e.g. after fork; connections must not be shared across processes)"""
+    with _lock:
+        _clients.clear()
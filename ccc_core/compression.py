@@ -0,0 +1,113 @@
+"""Passage compression for the retrieve -> compress -> generate mode.
+
+retrieve_and_generate pastes every retrieved passage verbatim into the prompt. Here each
+passage is trimmed to the sentences that best match the question (a local IDF-weighted
+term overlap score), near-duplicate passages from the same page (same normalize_url)
+are dropped, and passages are kept in retrieval order until the input-token budget is
+spent. Token counts are estimated at 4 characters per token.
+"""
+import math
+import re
+
+from .citations import normalize_url, reference_location
+
+CHARS_PER_TOKEN = 4
+MAX_SENTENCES_PER_PASSAGE = 4
+MIN_PASSAGE_TOKENS = 256  # Passage room left when the prompt alone exceeds the budget
+NEAR_DUPLICATE_OVERLAP = 0.8  # Share of the smaller passage's terms found in the other
+
+SENTENCE_SPLIT = re.compile(r'(?<=[.!?])\s+|\n+')
+WORD = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+STOPWORDS = frozenset(
+    'a an and are as at be but by can do does for from has have how i if in is it its me my of on or our '
+    'should so that the their them there they this to was we what when where which who why will with you your'.split()
+)
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN
+
+
+def terms(text):
+    return [word for word in WORD.findall(text.lower()) if word not in STOPWORDS]
+
+
+def split_sentences(text):
+    return [sentence.strip() for sentence in SENTENCE_SPLIT.split(text) if sentence.strip()]
+
+
+def inverse_document_frequencies(sentence_terms):
+    """IDF of each term over all retrieved sentences, so common boilerplate counts for little"""
+    counts = {}
+    for sentence in sentence_terms:
+        for term in set(sentence):
+            counts[term] = counts.get(term, 0) + 1
+    total = len(sentence_terms)
+    return {term: math.log(1 + total / count) for term, count in counts.items()}
+
+
+def compress_passage(sentences, sentence_terms, question_terms, idf, max_sentences=MAX_SENTENCES_PER_PASSAGE):
+    """Keep the sentences that best match the question, in their original order"""
+    if len(sentences) <= max_sentences:
+        return ' '.join(sentences)
+    scores = [
+        sum(idf.get(term, 0) for term in set(words) & question_terms) / math.sqrt(1 + len(words))
+        for words in sentence_terms
+    ]
+    best = sorted(range(len(sentences)), key=lambda i: scores[i], reverse=True)[:max_sentences]
+    if not any(scores[i] for i in best):
+        best = range(max_sentences)  # No overlap at all: the lead sentences are the best guess
+    return ' '.join(sentences[i] for i in sorted(best))
+
+
+def overlap(first, second):
+    """Overlap coefficient: 1.0 when one passage's terms are a subset of the other's"""
+    if not first or not second:
+        return 0.0
+    return len(first & second) / min(len(first), len(second))
+
+
+def compress_results(question, retrieval_results, token_budget):
+    """Trim, dedupe and budget retrieve() results.
+
+    Returns a list of {'text', 'uri', 'reference'} dicts, where 'reference' is the
+    retrieval result with its content replaced by the compressed text (the shape
+    build_sources expects).
+    """
+    question_terms = set(terms(question))
+    passages = []
+    for result in retrieval_results:
+        text = result.get('content', {}).get('text', '')
+        if not text.strip():
+            continue
+        sentences = split_sentences(text)
+        passages.append((result, sentences, [terms(sentence) for sentence in sentences]))
+
+    idf = inverse_document_frequencies([words for _, _, sentence_terms in passages for words in sentence_terms])
+
+    kept = []
+    kept_terms = {}  # normalized URL -> term sets of the passages kept for that page
+    used_tokens = 0
+    for result, sentences, sentence_terms in passages:
+        uri, _ = reference_location(result)
+        page = normalize_url(uri) if uri else None
+        passage_terms = {term for words in sentence_terms for term in words}
+        if page and any(overlap(passage_terms, other) >= NEAR_DUPLICATE_OVERLAP for other in kept_terms.get(page, [])):
+            continue
+
+        text = compress_passage(sentences, sentence_terms, question_terms, idf)
+        tokens = estimate_tokens(text)
+        if used_tokens + tokens > token_budget:
+            if kept:
+                continue  # A shorter passage further down may still fit
+            text = text[:token_budget * CHARS_PER_TOKEN]  # Always keep something of the best passage
+            tokens = estimate_tokens(text)
+
+        used_tokens += tokens
+        kept_terms.setdefault(page, []).append(passage_terms)
+        kept.append({
+            'text': text,
+            'uri': uri,
+            'reference': dict(result, content={'text': text})
+        })
+    return kept
@@ -0,0 +1,74 @@
+"""Deployment configuration shared by every entry point (override with environment variables)"""
+import os
+import tempfile
+
+AWS_REGION = os.getenv('AWS_REGION', 'us-west-2')
+KNOWLEDGE_BASE_ID = os.getenv('KNOWLEDGE_BASE_ID', 'UJ1ZYKF7DG')
+MODEL_ID = os.getenv('MODEL_ID', 'anthropic.claude-3-5-sonnet-20241022-v2:0')
+MODEL_ARN = os.getenv('MODEL_ARN', f'arn:aws:bedrock:{AWS_REGION}::foundation-model/{MODEL_ID}')
+
+# Model routing (see model_router.py): simple lookups and plain image descriptions go to a
+# smaller, faster model; everything else stays on MODEL_ID. MODEL_ROUTING=off pins MODEL_ID.
+MODEL_ROUTING = os.getenv('MODEL_ROUTING', 'on').lower() not in ('off', 'false', '0')
+FAST_MODEL_ID = os.getenv('FAST_MODEL_ID', 'anthropic.claude-3-5-haiku-20241022-v1:0')
+FAST_MODEL_ARN = os.getenv('FAST_MODEL_ARN', f'arn:aws:bedrock:{AWS_REGION}::foundation-model/{FAST_MODEL_ID}')
+# Claude 3.5 Haiku takes no images on Bedrock, so vision has its own fast model
+FAST_VISION_MODEL_ID = os.getenv('FAST_VISION_MODEL_ID', 'anthropic.claude-3-haiku-20240307-v1:0')
+
+# Bedrock client behaviour (see clients.py)
+BEDROCK_CONNECT_TIMEOUT = int(os.getenv('BEDROCK_CONNECT_TIMEOUT', '5'))
+BEDROCK_READ_TIMEOUT = int(os.getenv('BEDROCK_READ_TIMEOUT', '60'))
+BEDROCK_MAX_ATTEMPTS = int(os.getenv('BEDROCK_MAX_ATTEMPTS', '2'))
+BEDROCK_MAX_POOL_CONNECTIONS = int(os.getenv('BEDROCK_MAX_POOL_CONNECTIONS', '20'))
+# Send bedrock-runtime/bedrock-agent-runtime calls elsewhere, e.g. to bedrock_stub.py for load tests
+BEDROCK_ENDPOINT_URL = os.getenv('BEDROCK_ENDPOINT_URL')
+BEDROCK_RUNTIME_SERVICES = ('bedrock-runtime', 'bedrock-agent-runtime')
+
+TEXT_INFERENCE_CONFIG = {
+    'temperature': 0.1,
+    'topP': 0.95,
+    'maxTokens': 2000
+}
+
+# 'retrieve_and_generate' (managed) or 'compressed': retrieve, trim passages locally, then
+# invoke_model within INPUT_TOKEN_BUDGET (prompt + question + passages, see compression.py)
+GENERATION_MODE = os.getenv('GENERATION_MODE', 'retrieve_and_generate')
+RETRIEVE_RESULTS = int(os.getenv('RETRIEVE_RESULTS', '8'))
+INPUT_TOKEN_BUDGET = int(os.getenv('INPUT_TOKEN_BUDGET', '3000'))
+# In compressed mode, over-fetch this many passages and keep the best RERANK_TOP_N after
+# local reranking (rerank.py); 0 disables reranking and fetches RETRIEVE_RESULTS
+RERANK_FETCH_K = int(os.getenv('RERANK_FETCH_K', '30'))
+RERANK_TOP_N = int(os.getenv('RERANK_TOP_N', '5'))
+
+# Answer cache for standalone questions
+ANSWER_CACHE_TTL = int(os.getenv('ANSWER_CACHE_TTL', '21600'))  # 6 hours
+ANSWER_CACHE_SIZE = int(os.getenv('ANSWER_CACHE_SIZE', '1024'))
+# Translated canonical answers, one entry per (English question, output language)
+TRANSLATION_CACHE_SIZE = int(os.getenv('TRANSLATION_CACHE_SIZE', '4096'))
+# invalidate_caches() bumps this file; every process on the machine (gunicorn workers)
+# sees the change within CACHE_GENERATION_CHECK_SECONDS and drops its own caches
+CACHE_GENERATION_FILE = os.getenv('CACHE_GENERATION_FILE', os.path.join(tempfile.gettempdir(), 'ccc_cache_generation'))
+CACHE_GENERATION_CHECK_SECONDS = float(os.getenv('CACHE_GENERATION_CHECK_SECONDS', '1'))
+
+# Non-English questions: overlap translation with language detection and with a speculative
+# answer to the original question (see query_engine.translate_question_speculatively)
+SPECULATIVE_PIPELINE = os.getenv('SPECULATIVE_PIPELINE', 'on').lower() not in ('off', 'false', '0')
+PIPELINE_WORKERS = int(os.getenv('PIPELINE_WORKERS', '16'))
+# A question translation back within this long is checked against the caches and the local
+# index before any speculative answer is started
+SPECULATION_DELAY_MS = int(os.getenv('SPECULATION_DELAY_MS', '100'))
+
+# Localized fixed messages written by build_assets.py (see messages.py)
+MESSAGE_CATALOG = os.getenv('MESSAGE_CATALOG', os.path.join(
+    os.getenv('STATIC_DIR', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'static')),
+    'message-catalog.json'
+))
+
+# Local FAQ index snapshot (local path or s3:// URI) written by kb_sync_lambda; unset disables it
+LOCAL_INDEX_LOCATION = os.getenv('LOCAL_INDEX_LOCATION')
+LOCAL_INDEX_REFRESH_SECONDS = int(os.getenv('LOCAL_INDEX_REFRESH_SECONDS', '300'))
+LOCAL_INDEX_MIN_CONFIDENCE = float(os.getenv('LOCAL_INDEX_MIN_CONFIDENCE', '0.85'))
+
+# Batch questions (/chat/batch and batch_questions.py)
+BATCH_MAX_WORKERS = int(os.getenv('BATCH_MAX_WORKERS', '4'))  # concurrent knowledge base calls per batch
+BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', '1000'))
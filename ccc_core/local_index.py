@@ -0,0 +1,491 @@
+"""Local in-process index of the knowledge base source documents.
+
+Built from the same S3 data source the Bedrock knowledge base ingests, so exact or
+near-exact FAQ questions can be answered in milliseconds without calling
+retrieve_and_generate. Every lookup reports a confidence score; the app only uses
+the local answer when it clears LOCAL_INDEX_MIN_CONFIDENCE and otherwise falls
+through to the managed knowledge base.
+
+The index is rebuilt incrementally: documents are tracked by S3 ETag and only new
+or changed objects are re-read when kb_sync_lambda triggers an ingestion
+(refresh_index_snapshot); query_engine serves the saved snapshot.
+"""
+import base64
+import gzip
+import html
+import json
+import math
+import os
+import re
+import time
+
+from .clients import get_client
+
+try:
+    import numpy as np
+except ImportError:  # Embedding vectors are optional
+    np = None
+
+INDEX_VERSION = 1
+INDEXED_EXTENSIONS = {'txt', 'md', 'html', 'htm', 'pdf'}
+MAX_PASSAGE_CHARS = 1200
+EMBEDDING_MODEL_ID = os.getenv('LOCAL_INDEX_EMBEDDING_MODEL', 'amazon.titan-embed-text-v2:0')
+EMBEDDING_DIMENSIONS = 256  # Compact vectors, stored as float16
+
+# Common English words that carry no retrieval signal
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'can', 'do', 'does', 'for', 'from',
+    'how', 'i', 'if', 'in', 'is', 'it', 'my', 'of', 'on', 'or', 'the', 'to', 'what',
+    'when', 'where', 'which', 'who', 'why', 'will', 'with', 'you', 'your', 's'
+}
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+QUESTION_PREFIX_PATTERN = re.compile(r'^(?:#+\s*|\*\*|q\s*[:.)]\s*|question\s*[:.)]\s*|\d+[.)]\s*)+', re.IGNORECASE)
+
+
+def tokenize(text):
+    """Lowercase word tokens with stopwords removed"""
+    if not text:
+        return []
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+def normalize_question(text):
+    """Canonical form of a question used for exact-match lookups"""
+    return ' '.join(TOKEN_PATTERN.findall((text or '').lower()))
+
+
+class Bm25Index:
+    """Okapi BM25 over a mutable set of token lists, with incremental add/remove"""
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = {}  # term -> {entry_id: term frequency}
+        self.lengths = {}   # entry_id -> token count
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def add(self, entry_id, tokens):
+        if entry_id in self.lengths:
+            self.remove(entry_id)
+        counts = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for token, count in counts.items():
+            self.postings.setdefault(token, {})[entry_id] = count
+        self.lengths[entry_id] = len(tokens)
+        self.total_length += len(tokens)
+
+    def remove(self, entry_id, tokens=None):
+        length = self.lengths.pop(entry_id, None)
+        if length is None:
+            return
+        self.total_length -= length
+        terms = set(tokens) if tokens is not None else list(self.postings)
+        for token in terms:
+            entries = self.postings.get(token)
+            if entries and entry_id in entries:
+                del entries[entry_id]
+                if not entries:
+                    del self.postings[token]
+
+    def idf(self, token):
+        count = len(self.lengths)
+        df = len(self.postings.get(token, ()))
+        return math.log(1 + (count - df + 0.5) / (df + 0.5))
+
+    def search(self, tokens, k=10):
+        """Return [(entry_id, score)] for the top k entries"""
+        if not self.lengths or not tokens:
+            return []
+        avg_length = self.total_length / len(self.lengths) or 1
+        scores = {}
+        for token in set(tokens):
+            entries = self.postings.get(token)
+            if not entries:
+                continue
+            idf = self.idf(token)
+            for entry_id, tf in entries.items():
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[entry_id] / avg_length)
+                scores[entry_id] = scores.get(entry_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return ranked[:k]
+
+
+def split_passages(text, max_chars=MAX_PASSAGE_CHARS):
+    """Split document text into passages, pairing FAQ-style questions with their answers"""
+    passages = []
+    heading = ''
+    buffer = []
+    pending_question = None
+
+    def flush():
+        if buffer:
+            passages.append({'question': '', 'heading': heading, 'text': '\n\n'.join(buffer)})
+            buffer.clear()
+
+    for block in re.split(r'\n\s*\n', text or ''):
+        block = block.strip()
+        if not block:
+            continue
+        lines = block.split('\n')
+        first_line = QUESTION_PREFIX_PATTERN.sub('', lines[0].strip()).strip('*# ').strip()
+
+        if pending_question:
+            passages.append({'question': pending_question, 'heading': heading, 'text': block})
+            pending_question = None
+            continue
+
+        if first_line.endswith('?') and len(first_line) < 200:
+            flush()
+            answer = '\n'.join(lines[1:]).strip()
+            if answer:
+                passages.append({'question': first_line, 'heading': heading, 'text': answer})
+            else:
+                pending_question = first_line
+            continue
+
+        if lines[0].lstrip().startswith('#'):
+            flush()
+            heading = first_line
+            if len(lines) == 1:
+                continue
+
+        if buffer and sum(len(part) for part in buffer) + len(block) > max_chars:
+            flush()
+        buffer.append(block)
+
+    flush()
+    return passages
+
+
+def extract_document_text(key, data):
+    """Extract plain text from an indexed source object"""
+    extension = key.rsplit('.', 1)[-1].lower() if '.' in key else ''
+    if extension == 'pdf':
+        import fitz  # PyMuPDF is only needed when PDFs are indexed
+        with fitz.open(stream=data, filetype='pdf') as document:
+            return '\n\n'.join(page.get_text() for page in document)
+    text = data.decode('utf-8', errors='replace')
+    if extension in ('html', 'htm'):
+        text = re.sub(r'(?is)<(script|style).*?</\1>', ' ', text)
+        text = re.sub(r'(?i)<br\s*/?>|</p>|</h\d>|</li>', '\n\n', text)
+        text = re.sub(r'(?i)<h\d[^>]*>', '\n\n# ', text)
+        text = html.unescape(re.sub(r'<[^>]+>', ' ', text))
+        text = re.sub(r'[ \t]+', ' ', text)
+    return text
+
+
+def titan_embedder(client=None):
+    """Embedding function backed by Bedrock Titan text embeddings (on the shared, configured
+    bedrock-runtime client unless one is given; it is only built on the first call)"""
+
+    def embed(texts):
+        runtime = client or get_client('bedrock-runtime')
+        vectors = []
+        for text in texts:
+            response = runtime.invoke_model(
+                modelId=EMBEDDING_MODEL_ID,
+                body=json.dumps({'inputText': text[:8000], 'dimensions': EMBEDDING_DIMENSIONS, 'normalize': True})
+            )
+            vectors.append(json.loads(response['body'].read())['embedding'])
+        return vectors
+
+    return embed
+
+
+class LocalKnowledgeIndex:
+    """BM25 (plus optional embedding) index over knowledge base source documents"""
+
+    def __init__(self, embed_fn=None):
+        self.embed_fn = embed_fn if np is not None else None
+        self.documents = {}  # key -> {'etag', 'url', 'title', 'passages', 'vectors'}
+        self.passage_index = Bm25Index()
+        self.question_index = Bm25Index(b=0.3)  # FAQ questions are short and similar in length
+        self.entries = {}  # entry_id -> passage dict with 'doc', 'url', 'title'
+        self.exact_questions = {}  # normalized question -> entry_id
+        self._vector_ids = []
+        self._vector_matrix = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    # --- Building -------------------------------------------------------
+
+    def add_document(self, key, etag, text, url=None, title=None, vectors=None):
+        """Index (or re-index) one source document"""
+        self.remove_document(key)
+        passages = split_passages(text)
+        url = url or key
+        title = title or key.rsplit('/', 1)[-1]
+
+        if vectors is None and self.embed_fn is not None:
+            questions = [passage['question'] for passage in passages if passage['question']]
+            if questions:
+                try:
+                    vectors = encode_vectors(self.embed_fn(questions))
+                except Exception as e:
+                    print(f"Local index embedding error for {key}: {e}")
+
+        self.documents[key] = {'etag': etag, 'url': url, 'title': title, 'passages': passages, 'vectors': vectors}
+        self._index_document(key)
+        self._vector_matrix = None
+
+    def _index_document(self, key):
+        document = self.documents[key]
+        for position, passage in enumerate(document['passages']):
+            entry_id = f"{key}#{position}"
+            entry = dict(passage, doc=key, url=document['url'], title=passage['heading'] or document['title'])
+            entry['tokens'] = tokenize(f"{passage['question']} {passage['heading']} {passage['text']}")
+            self.entries[entry_id] = entry
+            self.passage_index.add(entry_id, entry['tokens'])
+            if passage['question']:
+                entry['question_tokens'] = tokenize(passage['question'])
+                self.question_index.add(entry_id, entry['question_tokens'])
+                self.exact_questions[normalize_question(passage['question'])] = entry_id
+
+    def remove_document(self, key):
+        document = self.documents.pop(key, None)
+        if not document:
+            return
+        for position in range(len(document['passages'])):
+            entry_id = f"{key}#{position}"
+            entry = self.entries.pop(entry_id, None)
+            if not entry:
+                continue
+            self.passage_index.remove(entry_id, entry['tokens'])
+            if entry.get('question_tokens') is not None:
+                self.question_index.remove(entry_id, entry['question_tokens'])
+                normalized = normalize_question(entry['question'])
+                if self.exact_questions.get(normalized) == entry_id:
+                    del self.exact_questions[normalized]
+        self._vector_matrix = None
+
+    def sync_from_s3(self, bucket, prefix='', s3_client=None, listed=None):
+        """Incrementally re-index the bucket: only new or changed ETags are read.
+
+        `listed` is an optional {key: etag} listing the caller already fetched.
+        """
+        s3_client = s3_client or get_client('s3')
+        started = time.time()
+        if listed is None:
+            listed = {}
+            paginator = s3_client.get_paginator('list_objects_v2')
+            for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+                for obj in page.get('Contents', []):
+                    listed[obj['Key']] = obj['ETag'].strip('"')
+
+        added = updated = removed = 0
+        for key in list(self.documents):
+            if key not in listed:
+                self.remove_document(key)
+                removed += 1
+
+        for key, etag in listed.items():
+            extension = key.rsplit('.', 1)[-1].lower() if '.' in key else ''
+            if extension not in INDEXED_EXTENSIONS:
+                continue
+            # Bedrock metadata sidecars carry the citation URL/title; a changed sidecar re-indexes the document
+            sidecar_etag = listed.get(f"{key}.metadata.json", '')
+            combined_etag = f"{etag}:{sidecar_etag}" if sidecar_etag else etag
+            existing = self.documents.get(key)
+            if existing and existing['etag'] == combined_etag:
+                continue
+            try:
+                data = s3_client.get_object(Bucket=bucket, Key=key)['Body'].read()
+                url, title = f"s3://{bucket}/{key}", None
+                if sidecar_etag:
+                    sidecar = json.loads(s3_client.get_object(Bucket=bucket, Key=f"{key}.metadata.json")['Body'].read())
+                    attributes = sidecar.get('metadataAttributes', {})
+                    url = attributes.get('url') or attributes.get('source_url') or url
+                    title = attributes.get('title')
+                self.add_document(key, combined_etag, extract_document_text(key, data), url=url, title=title)
+                if existing:
+                    updated += 1
+                else:
+                    added += 1
+            except Exception as e:
+                print(f"Local index failed to read s3://{bucket}/{key}: {e}")
+
+        stats = {
+            'added': added,
+            'updated': updated,
+            'removed': removed,
+            'documents': len(self.documents),
+            'passages': len(self.entries),
+            'seconds': round(time.time() - started, 3)
+        }
+        print(f"Local index sync: {json.dumps(stats)}")
+        return stats
+
+    # --- Querying -------------------------------------------------------
+
+    def search(self, question, k=5):
+        """Rank passages for a question; returns [(entry, bm25_score)]"""
+        return [(self.entries[entry_id], score) for entry_id, score in self.passage_index.search(tokenize(question), k)]
+
+    def lookup(self, question):
+        """Find the best FAQ match for a question.
+
+        Returns a dict with the matched entry, its answer, and a confidence in [0, 1],
+        or None when the index has no candidate at all.
+        """
+        if not self.entries:
+            return None
+
+        exact_id = self.exact_questions.get(normalize_question(question))
+        if exact_id:
+            return self._match(exact_id, 1.0, 'exact')
+
+        query_tokens = tokenize(question)
+        candidates = self.question_index.search(query_tokens, k=5)
+        best_id, best_confidence = None, 0.0
+        for entry_id, _ in candidates:
+            confidence = self._lexical_confidence(query_tokens, self.entries[entry_id]['question_tokens'])
+            if confidence > best_confidence:
+                best_id, best_confidence = entry_id, confidence
+
+        if self.embed_fn is not None:
+            semantic_id, similarity = self._nearest_vector(question)
+            if semantic_id is not None:
+                lexical = best_confidence if semantic_id == best_id else self._lexical_confidence(
+                    query_tokens, self.entries[semantic_id]['question_tokens'])
+                blended = 0.5 * lexical + 0.5 * similarity
+                if blended > best_confidence:
+                    best_id, best_confidence = semantic_id, blended
+
+        if best_id is None:
+            # No FAQ candidate; report the best passage with a low, score-derived confidence
+            results = self.passage_index.search(query_tokens, k=1)
+            if not results:
+                return None
+            entry_id, score = results[0]
+            return self._match(entry_id, min(0.5, score / (score + 10.0)), 'passage')
+
+        return self._match(best_id, round(best_confidence, 4), 'faq')
+
+    def _lexical_confidence(self, query_tokens, question_tokens):
+        """IDF-weighted F1 between the query and an FAQ question"""
+        query_terms, question_terms = set(query_tokens), set(question_tokens)
+        if not query_terms or not question_terms:
+            return 0.0
+        weight = self.question_index.idf
+        shared = sum(weight(token) for token in query_terms & question_terms)
+        if shared == 0:
+            return 0.0
+        recall = shared / sum(weight(token) for token in query_terms)
+        precision = shared / sum(weight(token) for token in question_terms)
+        return 2 * recall * precision / (recall + precision)
+
+    def _nearest_vector(self, question):
+        if self._vector_matrix is None:
+            self._build_vector_matrix()
+        if self._vector_matrix is None or not self._vector_ids:
+            return None, 0.0
+        try:
+            query = np.asarray(self.embed_fn([question])[0], dtype=np.float32)
+        except Exception as e:
+            print(f"Local index query embedding error: {e}")
+            return None, 0.0
+        similarities = self._vector_matrix @ query
+        best = int(np.argmax(similarities))
+        return self._vector_ids[best], float(max(0.0, similarities[best]))
+
+    def _build_vector_matrix(self):
+        ids, rows = [], []
+        for key, document in self.documents.items():
+            vectors = decode_vectors(document.get('vectors'))
+            if vectors is None:
+                continue
+            question_positions = [position for position, passage in enumerate(document['passages']) if passage['question']]
+            for position, vector in zip(question_positions, vectors):
+                ids.append(f"{key}#{position}")
+                rows.append(vector)
+        self._vector_ids = ids
+        self._vector_matrix = np.vstack(rows).astype(np.float32) if rows else None
+
+    def _match(self, entry_id, confidence, match_type):
+        entry = self.entries[entry_id]
+        return {
+            'confidence': confidence,
+            'match_type': match_type,
+            'question': entry['question'],
+            'answer': entry['text'],
+            'title': entry['title'],
+            'url': entry['url'],
+            'document': entry['doc']
+        }
+
+    # --- Persistence ----------------------------------------------------
+
+    def to_snapshot(self):
+        return {
+            'version': INDEX_VERSION,
+            'built_at': time.time(),
+            'documents': self.documents
+        }
+
+    @classmethod
+    def from_snapshot(cls, snapshot, embed_fn=None):
+        index = cls(embed_fn=embed_fn)
+        if snapshot.get('version') != INDEX_VERSION:
+            print("Local index snapshot version mismatch; starting empty")
+            return index
+        index.documents = snapshot.get('documents', {})
+        for key in index.documents:
+            index._index_document(key)
+        if not any(document.get('vectors') for document in index.documents.values()):
+            index.embed_fn = None  # no stored vectors to compare a query embedding against
+        return index
+
+    def save(self, location, s3_client=None):
+        """Write a gzipped JSON snapshot to a local path or s3:// URI"""
+        payload = gzip.compress(json.dumps(self.to_snapshot()).encode('utf-8'))
+        if location.startswith('s3://'):
+            bucket, key = location[5:].split('/', 1)
+            (s3_client or get_client('s3')).put_object(Bucket=bucket, Key=key, Body=payload)
+        else:
+            with open(location, 'wb') as f:
+                f.write(payload)
+
+    @classmethod
+    def load(cls, location, s3_client=None, embed_fn=None):
+        """Load a snapshot from a local path or s3:// URI (empty index if missing)"""
+        try:
+            if location.startswith('s3://'):
+                bucket, key = location[5:].split('/', 1)
+                payload = (s3_client or get_client('s3')).get_object(Bucket=bucket, Key=key)['Body'].read()
+            else:
+                with open(location, 'rb') as f:
+                    payload = f.read()
+        except Exception as e:
+            print(f"No local index snapshot at {location}: {e}")
+            return cls(embed_fn=embed_fn)
+        return cls.from_snapshot(json.loads(gzip.decompress(payload)), embed_fn=embed_fn)
+
+
+def encode_vectors(vectors):
+    """Pack embedding vectors as base64 float16 for the JSON snapshot"""
+    if np is None or not vectors:
+        return None
+    matrix = np.asarray(vectors, dtype=np.float16)
+    return {'shape': list(matrix.shape), 'data': base64.b64encode(matrix.tobytes()).decode('ascii')}
+
+
+def decode_vectors(packed):
+    if np is None or not packed:
+        return None
+    matrix = np.frombuffer(base64.b64decode(packed['data']), dtype=np.float16)
+    return matrix.reshape(packed['shape'])
+
+
+def refresh_index_snapshot(bucket, prefix, location, embed_fn=None, listed=None):
+    """Load the current snapshot, re-index changed documents, and save it back"""
+    index = LocalKnowledgeIndex.load(location, embed_fn=embed_fn)
+    stats = index.sync_from_s3(bucket, prefix, listed=listed)
+    if stats['added'] or stats['updated'] or stats['removed']:
+        index.save(location)
+    return stats
@@ -0,0 +1,123 @@
+"""Fixed user-facing messages (errors, widget notices) and their localized catalog.
+
+build_assets.py translates MESSAGES into every supported language once, at build time,
+and writes the catalog to MESSAGE_CATALOG; localize() then only looks strings up. A
+language or message missing from the catalog (no build, or a stale one) falls back to
+translating the English text live, as before.
+"""
+import functools
+import hashlib
+import json
+import string
+import threading
+
+from . import config
+from .languages import SUPPORTED_LANGUAGES
+
+# key -> English template; {placeholders} are filled after lookup and never translated
+MESSAGES = {
+    'file_too_large': 'File too large',
+    'no_message': 'No message provided',
+    'no_message_or_file': 'No message or valid file provided',
+    'attachment_failed': 'Failed to process attachment: {error}',
+    'knowledge_base_error': "I'm having trouble accessing the knowledge base right now. Error: {error}",
+    'image_empty': 'Error: Image file is empty.',
+    'image_no_result': 'Could not analyze the image.',
+    'image_failed': "Sorry, I couldn't analyze this image. Error: {error}",
+    'pdf_no_pages': 'Error: PDF has no pages.',
+    'pdf_failed': "Error processing PDF '{filename}': {error}",
+    'test_mode_image': "[TEST MODE] Analyzing image '{filename}' with question: '{question}'",
+    'test_mode_pdf': "[TEST MODE] Analyzing PDF '{filename}' with question: '{question}'",
+    'test_sources_intro': 'Here are three facts about CCCID. [1] [2] [3]',
+    'language_changed': "Language changed to {language}. I'll respond in {language} from now on."
+}
+
+_catalog_lock = threading.Lock()
+_catalog = None
+
+
+def placeholders(template):
+    return {field for _, field, _, _ in string.Formatter().parse(template) if field}
+
+
+def load_catalog():
+    """{language: {key: template}} from MESSAGE_CATALOG, read once"""
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                try:
+                    with open(config.MESSAGE_CATALOG, encoding='utf-8') as f:
+                        data = json.load(f)
+                    source = data.get('source', {})
+                    # Entries translated from an older English text are stale
+                    _catalog = {
+                        language: {key: text for key, text in entries.items() if source.get(key) == MESSAGES.get(key)}
+                        for language, entries in data.get('languages', {}).items()
+                    }
+                    print(f"Loaded message catalog: {len(_catalog)} languages")
+                except (OSError, ValueError) as e:
+                    print(f"No message catalog at {config.MESSAGE_CATALOG} ({e}); fixed messages are translated live")
+                    _catalog = {}
+    return _catalog
+
+
+def catalog_messages(language):
+    """Every message template for a language: catalog entries, English for the rest"""
+    return dict(MESSAGES, **load_catalog().get(language, {}))
+
+
+@functools.lru_cache(maxsize=None)
+def catalog_etag(language):
+    """Content hash of a language's messages, the same on every server instance"""
+    data = json.dumps(catalog_messages(language), ensure_ascii=False, sort_keys=True).encode('utf-8')
+    return hashlib.sha256(data).hexdigest()[:32]
+
+
+def localize(key, language, **values):
+    """The message in the requested language, with its placeholders filled in"""
+    english = MESSAGES[key]
+    if not language or language == 'en':
+        return english.format(**values)
+    template = load_catalog().get(language, {}).get(key)
+    if template is not None:
+        try:
+            return template.format(**values)
+        except (KeyError, IndexError, ValueError) as e:
+            print(f"Bad catalog entry {language}/{key}: {e}")
+
+    from .translation import translate_text
+
+    return translate_text(english.format(**values), target_lang=language, source_lang='en')
+
+
+def build_catalog(previous=None, translate=None, languages=None):
+    """Translate MESSAGES into every supported language (build time).
+
+    Entries of a previous catalog whose English text is unchanged are reused, so a
+    rebuild only translates new or edited messages. A translation that lost or renamed
+    a placeholder is left out (localize() then translates that message live).
+    """
+    if translate is None:
+        from .translation import translate_text as translate
+    previous = previous or {}
+    previous_source = previous.get('source', {})
+    previous_languages = previous.get('languages', {})
+    catalog = {'source': dict(MESSAGES), 'languages': {}}
+    translated = reused = 0
+    for language in languages or sorted(SUPPORTED_LANGUAGES):
+        if language == 'en':
+            continue
+        entries = {}
+        for key, english in MESSAGES.items():
+            old = previous_languages.get(language, {}).get(key)
+            if old is not None and previous_source.get(key) == english:
+                entries[key] = old
+                reused += 1
+                continue
+            text = translate(english, target_lang=language, source_lang='en')
+            if text and text != english and placeholders(text) == placeholders(english):
+                entries[key] = text
+                translated += 1
+        catalog['languages'][language] = entries
+    return catalog, translated, reused
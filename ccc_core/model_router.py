@@ -0,0 +1,94 @@
+"""Complexity-based model routing between a fast model and the full model (MODEL_ID).
+
+A cheap local classifier looks at the question's length, intent keywords and, when the
+local FAQ index ran, its match confidence. The keywords are English, so questions in other
+languages (answered speculatively before their translation is back) stay on the full model. Simple lookups ("what's the CCCApply URL")
+and plain image descriptions go to the fast model. Counseling, planning and follow-up
+questions and multi-page documents stay on the full model. Every decision is logged as
+"Model route: <tier> -> <model> (<reason>)".
+"""
+import os
+import re
+
+from . import config
+
+FAST_MAX_WORDS = int(os.getenv('FAST_MAX_WORDS', '25'))
+# A local index match this close to the answer threshold marks an FAQ-style question
+FAST_MIN_RETRIEVAL_SCORE = float(os.getenv('FAST_MIN_RETRIEVAL_SCORE', '0.5'))
+
+# Questions that need reasoning, guidance or care stay on the full model
+COMPLEX_PATTERN = re.compile(
+    r"\b(should i|which (?:college|program|major|one)|recommend|advice|advise|compare|difference between|"
+    r"pathway|transfer|career|major|counsel\w*|plan\w*|decide|why|explain|appeal|denied|rejected|"
+    r"stress\w*|anxious|anxiety|depress\w*|overwhelm\w*|worried|scared|struggl\w*|afraid|hopeless)\b",
+    re.IGNORECASE
+)
+LOOKUP_PATTERN = re.compile(
+    r"\b(what is|what's|what are|url|link|website|site|where (?:do|can|is)|when|deadline|how do i|"
+    r"how can i|reset|password|username|log ?in|sign ?in|phone|email|contact|cccid|opencc\w*)\b",
+    re.IGNORECASE
+)
+
+# USD per million input/output tokens, for cost estimates in benchmarks
+MODEL_PRICES = {
+    'anthropic.claude-3-5-sonnet-20241022-v2:0': (3.00, 15.00),
+    'anthropic.claude-3-5-haiku-20241022-v1:0': (0.80, 4.00),
+    'anthropic.claude-3-haiku-20240307-v1:0': (0.25, 1.25)
+}
+
+
+def classify_question(question, conversation_history=None, retrieval_score=None, language='en'):
+    """Return (tier, reason) for a question in language; tier is 'fast' or 'full'"""
+    if not config.MODEL_ROUTING:
+        return 'full', 'routing off'
+    if conversation_history:
+        return 'full', 'follow-up'
+    if language != 'en':
+        return 'full', f'untranslated {language} question'
+    if COMPLEX_PATTERN.search(question):
+        return 'full', 'complex intent'
+    if len(question.split()) > FAST_MAX_WORDS:
+        return 'full', 'long question'
+    if retrieval_score is not None and retrieval_score >= FAST_MIN_RETRIEVAL_SCORE:
+        return 'fast', f'FAQ match {retrieval_score:.2f}'
+    if LOOKUP_PATTERN.search(question):
+        return 'fast', 'lookup'
+    return 'full', 'default'
+
+
+def log_route(tier, model_id, reason):
+    print(f"Model route: {tier} -> {model_id} ({reason})")
+
+
+def route_question(question, conversation_history=None, retrieval_score=None, language='en'):
+    """Pick the knowledge base model for a question: {tier, model_id, model_arn, reason}"""
+    tier, reason = classify_question(question, conversation_history, retrieval_score, language)
+    if tier == 'fast':
+        route = {'tier': tier, 'model_id': config.FAST_MODEL_ID, 'model_arn': config.FAST_MODEL_ARN, 'reason': reason}
+    else:
+        route = {'tier': tier, 'model_id': config.MODEL_ID, 'model_arn': config.MODEL_ARN, 'reason': reason}
+    log_route(route['tier'], route['model_id'], reason)
+    return route
+
+
+def route_vision(user_question='', page_count=1, conversation_history=None, language='en'):
+    """Pick the invoke_model model for an image or PDF request: {tier, model_id, reason}"""
+    if not config.MODEL_ROUTING:
+        tier, reason = 'full', 'routing off'
+    elif page_count > 1:
+        tier, reason = 'full', f'{page_count}-page document'
+    elif not user_question.strip() and not conversation_history:
+        tier, reason = 'fast', 'plain description'
+    else:
+        tier, reason = classify_question(user_question, conversation_history, language=language)
+    model_id = config.FAST_VISION_MODEL_ID if tier == 'fast' else config.MODEL_ID
+    log_route(tier, model_id, reason)
+    return {'tier': tier, 'model_id': model_id, 'reason': reason}
+
+
+def estimate_cost(model_id, input_tokens, output_tokens):
+    """Estimated USD cost of one call, or None for a model without known prices"""
+    prices = MODEL_PRICES.get(model_id)
+    if not prices:
+        return None
+    return (input_tokens * prices[0] + output_tokens * prices[1]) / 1_000_000
@@ -0,0 +1,94 @@
+"""Local reranking of over-fetched retrieve() results.
+
+Asking Bedrock for more passages improves recall but inflates the prompt. Instead,
+over-fetch (RERANK_FETCH_K) and rescore the candidates here with BM25 over the fetched
+set, blended with Bedrock's own retrieval score, then pass only the best RERANK_TOP_N
+to generation. BM25 is vectorized with NumPy when it is installed; the Lambda package
+without NumPy uses the same formula in plain Python.
+"""
+import functools
+import math
+import os
+
+from .compression import terms
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+# Share of the final score taken by BM25; the rest is the retrieval (vector) score
+RERANK_BM25_WEIGHT = float(os.getenv('RERANK_BM25_WEIGHT', '0.5'))
+
+
+def passage_text(result):
+    return result.get('content', {}).get('text', '')
+
+
+def term_frequencies(question_terms, passages_terms):
+    """[passage][question term] counts, plus each passage's length in terms"""
+    columns = {term: position for position, term in enumerate(question_terms)}
+    frequencies = []
+    for words in passages_terms:
+        row = [0] * len(question_terms)
+        for word in words:
+            position = columns.get(word)
+            if position is not None:
+                row[position] += 1
+        frequencies.append(row)
+    return frequencies, [len(words) for words in passages_terms]
+
+
+def bm25_scores_numpy(frequencies, lengths):
+    import numpy as np
+
+    tf = np.asarray(frequencies, dtype=np.float32)
+    length = np.asarray(lengths, dtype=np.float32)
+    count = tf.shape[0]
+    df = np.count_nonzero(tf, axis=0)
+    idf = np.log1p((count - df + 0.5) / (df + 0.5))
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * length / max(float(length.mean()), 1.0))
+    return ((tf * (BM25_K1 + 1)) / (tf + norm[:, None]) * idf).sum(axis=1).tolist()
+
+
+def bm25_scores_python(frequencies, lengths):
+    count = len(frequencies)
+    columns = len(frequencies[0]) if frequencies else 0
+    df = [sum(1 for row in frequencies if row[column]) for column in range(columns)]
+    idf = [math.log1p((count - d + 0.5) / (d + 0.5)) for d in df]
+    avg_length = max(sum(lengths) / count, 1.0) if count else 1.0
+    scores = []
+    for row, length in zip(frequencies, lengths):
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)
+        scores.append(sum(idf[c] * tf * (BM25_K1 + 1) / (tf + norm) for c, tf in enumerate(row) if tf))
+    return scores
+
+
+@functools.lru_cache(maxsize=None)
+def numpy_available():
+    """True when NumPy is installed (the Lambda package does not ship it)"""
+    import importlib.util
+
+    return importlib.util.find_spec('numpy') is not None
+
+
+def bm25_scores(question, results, use_numpy=None):
+    """BM25 score of each result's text for the question, with IDF over the results themselves"""
+    question_terms = sorted(set(terms(question)))
+    if not results or not question_terms:
+        return [0.0] * len(results)
+    frequencies, lengths = term_frequencies(question_terms, [terms(passage_text(result)) for result in results])
+    if use_numpy is None:
+        use_numpy = numpy_available()
+    return bm25_scores_numpy(frequencies, lengths) if use_numpy else bm25_scores_python(frequencies, lengths)
+
+
+def rerank(question, results, top_n, use_numpy=None):
+    """Return the top_n results by blended BM25 and retrieval score, best first"""
+    if len(results) <= 1:
+        return list(results)
+    lexical = bm25_scores(question, results, use_numpy)
+    best_lexical = max(lexical) or 1.0
+    scored = [
+        (RERANK_BM25_WEIGHT * lexical_score / best_lexical + (1 - RERANK_BM25_WEIGHT) * (result.get('score') or 0.0), position)
+        for position, (result, lexical_score) in enumerate(zip(results, lexical))
+    ]
+    scored.sort(key=lambda item: (-item[0], item[1]))  # Ties keep retrieval order
+    return [results[position] for _, position in scored[:top_n]]
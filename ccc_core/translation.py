@@ -0,0 +1,257 @@
+"""Language detection and translation helpers.
+
+langdetect and googletrans are imported on first use: the Lambda deployment package
+does not ship them, in which case questions are treated as English and text is
+returned untranslated.
+
+ensure_language() checks generated text paragraph by paragraph and translates only the
+paragraphs that are not in the requested language.
+"""
+import functools
+import re
+import threading
+
+from .languages import SUPPORTED_LANGUAGES
+
+_translator = None
+_translator_lock = threading.Lock()
+_profiles_loaded = False
+_profiles_lock = threading.Lock()
+
+URL_PATTERN = r'https?://[^\s\])>]+'
+CITATION_PATTERN = r'\[\d+\]'
+PRESERVED_PATTERN = re.compile(f'{URL_PATTERN}|{CITATION_PATTERN}')
+PRESERVED_SPLIT = re.compile(f'({URL_PATTERN}|{CITATION_PATTERN})')  # odd positions are the preserved pieces
+# Stand-ins for URLs and citation markers while translating; translators leave these brackets alone
+PLACEHOLDER = '\u27e6{}\u27e7'
+PLACEHOLDER_PATTERN = re.compile('\u27e6\\s*(\\d+)\\s*\u27e7')
+# Removed before judging a paragraph's language: code, link targets, URLs, citation markers
+NON_PROSE_PATTERN = re.compile(
+    r'```.*?```|`[^`\n]*`|\]\([^)\s]*\)|' + URL_PATTERN + '|' + CITATION_PATTERN,
+    re.DOTALL
+)
+PARAGRAPH_BREAK = re.compile(r'(\n[ \t]*\n)')
+SOURCES_HEADING = re.compile(r'^\W*sources?\s*:', re.IGNORECASE)
+MIN_PROSE_LETTERS = 20  # Shorter paragraphs (headings, lists of names) are left alone
+# langdetect probability needed to call a Latin-script paragraph wrong; short or mixed prose scores lower
+WRONG_LANGUAGE_MIN_CONFIDENCE = 0.9
+# Output languages written in Latin script; for the others the script alone tells English apart
+LATIN_SCRIPT_LANGUAGES = {
+    'en', 'es', 'fr', 'de', 'it', 'pt', 'vi', 'nl', 'sv', 'da', 'no', 'fi', 'pl', 'cs', 'sk', 'hu',
+    'ro', 'hr', 'sl', 'et', 'lv', 'lt', 'sq', 'mt', 'is', 'ga', 'cy', 'eu', 'ca', 'gl', 'tr', 'sw',
+    'zu', 'af', 'xh', 'st', 'tn', 'ss', 'nr', 've', 'ts'
+}
+# Words the old stopword heuristic counted; kept only to measure the translations it would have made
+LEGACY_ENGLISH_INDICATORS = frozenset(
+    ['the', 'and', 'or', 'for', 'with', 'this', 'that', 'you', 'your', 'are', 'is', 'have', 'can', 'will']
+)
+
+_verification_stats = {'answers': 0, 'paragraphs_checked': 0, 'paragraphs_translated': 0, 'translations_avoided': 0}
+_verification_lock = threading.Lock()
+
+
+def get_translator():
+    """Return the shared Google Translator, building it on first use"""
+    global _translator
+    if _translator is None:
+        with _translator_lock:
+            if _translator is None:
+                from googletrans import Translator
+
+                _translator = Translator()
+    return _translator
+
+
+@functools.lru_cache(maxsize=None)
+def translation_available():
+    """True when googletrans is installed (the Lambda package does not ship it)"""
+    import importlib.util
+
+    return importlib.util.find_spec('googletrans') is not None
+
+
+def load_language_profiles():
+    """Load langdetect's language profiles once.
+
+    langdetect loads them lazily on the first detect() without a lock, so concurrent
+    first calls (gthread workers, batches) could see a half-loaded set and fail or
+    misdetect. Seeded so the same text is always detected the same way.
+    """
+    global _profiles_loaded
+    if not _profiles_loaded:
+        with _profiles_lock:
+            if not _profiles_loaded:
+                from langdetect import DetectorFactory
+                from langdetect.detector_factory import init_factory
+
+                DetectorFactory.seed = 0
+                init_factory()  # ~60 MB of dicts, over a second to parse
+                _profiles_loaded = True
+
+
+def detect_language(text):
+    """Detect the language of input text"""
+    try:
+        # Clean text for better detection
+        cleaned_text = re.sub(r'[^\w\s]', ' ', text).strip()
+        if not cleaned_text or len(cleaned_text) < 3:
+            return 'en'  # Default to English for very short text
+        
+        load_language_profiles()
+        from langdetect import detect
+        
+        detected_lang = detect(cleaned_text)
+        
+        # Map some common variations
+        if detected_lang == 'zh-cn':
+            detected_lang = 'zh'
+        elif detected_lang == 'zh-tw':
+            detected_lang = 'zh-tw'
+        
+        return detected_lang if detected_lang in SUPPORTED_LANGUAGES else 'en'
+    except Exception as e:
+        print(f"Language detection error: {e}")
+        return 'en'  # Default to English if detection fails
+
+
+def translate_text(text, target_lang='en', source_lang=None):
+    """Translate text to target language"""
+    try:
+        if not text or not text.strip():
+            return text
+        
+        # Don't translate if already in target language
+        if source_lang and source_lang == target_lang:
+            return text
+            
+        # Auto-detect source language if not provided
+        if not source_lang:
+            source_lang = detect_language(text)
+            
+        # Don't translate if already in target language
+        if source_lang == target_lang:
+            return text
+            
+        # Handle Chinese variants
+        if target_lang == 'zh-cn':
+            target_lang = 'zh'
+        
+        translated = get_translator().translate(text, dest=target_lang, src=source_lang)
+        return translated.text
+        
+    except Exception as e:
+        print(f"Translation error: {e}")
+        return text  # Return original text if translation fails
+
+
+def translate_preserve_urls(text, target_lang, source_lang='en'):
+    """Translate text in one call while preserving URLs and citation markers.
+
+    They are swapped for numbered placeholders before translating and put back after; if
+    the translator drops or repeats a placeholder, the text between them is translated
+    piece by piece instead.
+    """
+    preserved = []
+
+    def hold(match):
+        preserved.append(match.group(0))
+        return PLACEHOLDER.format(len(preserved) - 1)
+
+    try:
+        masked = PRESERVED_PATTERN.sub(hold, text)
+        if not preserved:
+            return translate_text(text, target_lang=target_lang, source_lang=source_lang)
+        translated = translate_text(masked, target_lang=target_lang, source_lang=source_lang)
+        found = [int(number) for number in PLACEHOLDER_PATTERN.findall(translated)]
+        if sorted(found) == list(range(len(preserved))):
+            return PLACEHOLDER_PATTERN.sub(lambda match: preserved[int(match.group(1))], translated)
+        
+        print("Translation lost URL/citation placeholders; translating between them instead")
+        parts = PRESERVED_SPLIT.split(text)
+        return ''.join(
+            part if position % 2 or not part.strip() else translate_text(part, target_lang=target_lang, source_lang=source_lang)
+            for position, part in enumerate(parts)
+        )
+    except Exception as e:
+        print(f"Error in translate_preserve_urls: {e}")
+        return translate_text(text, target_lang=target_lang, source_lang=source_lang)
+
+
+def paragraph_language(paragraph, output_language):
+    """('ok' | 'wrong' | 'unknown', language the paragraph is in): is its prose in output_language?
+
+    One pass over the letters decides non-Latin target languages by script; Latin-script
+    targets fall back to langdetect on the prose alone, and only a confident detection of
+    another language counts as wrong.
+    """
+    prose = NON_PROSE_PATTERN.sub(' ', paragraph)
+    letters = latin = 0
+    for char in prose:
+        if char.isalpha():
+            letters += 1
+            if char < '\u0250' or '\u1e00' <= char <= '\u1eff':  # Basic Latin through Latin Extended-B, and Vietnamese
+                latin += 1
+    if letters < MIN_PROSE_LETTERS:
+        return 'unknown', None
+    
+    target = 'zh' if output_language in ('zh-cn', 'zh-tw') else output_language
+    if target not in LATIN_SCRIPT_LANGUAGES:
+        return ('wrong', 'en') if latin / letters > 0.5 else ('ok', output_language)
+    
+    try:
+        load_language_profiles()
+        from langdetect import detect_langs
+        
+        best = detect_langs(prose)[0]
+    except Exception as e:
+        print(f"Output language detection error: {e}")
+        return 'unknown', None
+    if best.lang != target and best.prob >= WRONG_LANGUAGE_MIN_CONFIDENCE:
+        return 'wrong', best.lang
+    return 'ok', output_language
+
+
+def ensure_language(text, output_language):
+    """Translate the paragraphs of generated text that are not in output_language.
+
+    URLs, citation markers and code spans are ignored when judging a paragraph and kept
+    when translating it; the Sources section is left as written.
+    """
+    if output_language == 'en' or not text:
+        return text
+    
+    parts = PARAGRAPH_BREAK.split(text)
+    checked = translated = 0
+    in_sources = False
+    for position in range(0, len(parts), 2):  # odd positions are the paragraph breaks
+        paragraph = parts[position]
+        if in_sources or SOURCES_HEADING.match(paragraph):
+            in_sources = True
+            continue
+        verdict, language = paragraph_language(paragraph, output_language)
+        if verdict == 'unknown':
+            continue
+        checked += 1
+        if verdict == 'wrong':
+            parts[position] = translate_preserve_urls(paragraph, output_language, source_lang=language)
+            translated += 1
+    
+    # The old heuristic translated whole answers with more than 3 of these words
+    words = set(re.findall(r'[a-z]+', text.lower()))
+    avoided = checked - translated if len(words & LEGACY_ENGLISH_INDICATORS) > 3 else 0
+    with _verification_lock:
+        _verification_stats['answers'] += 1
+        _verification_stats['paragraphs_checked'] += checked
+        _verification_stats['paragraphs_translated'] += translated
+        _verification_stats['translations_avoided'] += avoided
+    if translated or avoided:
+        print(f"Output language check ({output_language}): {translated} of {checked} paragraphs translated, "
+              f"{avoided} translations avoided")
+    return ''.join(parts) if translated else text
+
+
+def verification_stats():
+    """Counters of ensure_language() since start (translations_avoided: paragraphs the old
+    stopword heuristic would have sent to the translator that were already in the right language)"""
+    with _verification_lock:
+        return dict(_verification_stats)
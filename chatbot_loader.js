@@ -0,0 +1,113 @@
+// CCCApply Assistant embed loader.
+// Renders only the floating chat button. The widget's markup, CSS and script are fetched
+// the first time the button is hovered, focused or clicked, so host pages don't pay for
+// the full widget at page load. Embed with:
+//   <script async src="https://<chatbot host>/chatbot_loader.js"></script>
+(function() {
+    // build_assets.py rewrites these to the fingerprinted builds
+    const WIDGET_ASSETS = {
+        css: 'chatbot_widget.css',
+        markup: 'chatbot_widget_markup.html',
+        script: 'chatbot_widget.js'
+    };
+
+    const loaderScript = document.currentScript;
+    const assetBase = new URL('.', loaderScript ? loaderScript.src : window.location.href);
+
+    // The widget sends API requests to the host that served this loader (see apiUrl)
+    window.CCC_CHAT_CONFIG = Object.assign({ apiBase: assetBase.href.replace(/\/$/, '') }, window.CCC_CHAT_CONFIG || {});
+
+    let widgetPromise = null;
+
+    function assetUrl(name) {
+        return new URL(name, assetBase).href;
+    }
+
+    function loadStylesheet(href) {
+        return new Promise(function(resolve, reject) {
+            const link = document.createElement('link');
+            link.rel = 'stylesheet';
+            link.href = href;
+            link.onload = resolve;
+            link.onerror = function() { reject(new Error('Failed to load ' + href)); };
+            document.head.appendChild(link);
+        });
+    }
+
+    function loadScript(src) {
+        return new Promise(function(resolve, reject) {
+            const script = document.createElement('script');
+            script.src = src;
+            script.async = true;
+            script.onload = resolve;
+            script.onerror = function() { reject(new Error('Failed to load ' + src)); };
+            document.head.appendChild(script);
+        });
+    }
+
+    function loadWidget(container) {
+        if (!widgetPromise) {
+            const markup = fetch(assetUrl(WIDGET_ASSETS.markup)).then(function(response) {
+                if (!response.ok) throw new Error('Failed to load widget markup: ' + response.status);
+                return response.text();
+            });
+            widgetPromise = Promise.all([markup, loadStylesheet(assetUrl(WIDGET_ASSETS.css))])
+                .then(function(results) {
+                    // Stylesheet rules take over from the inline placeholder styles
+                    container.removeAttribute('style');
+                    container.querySelector('#chatToggle').removeAttribute('style');
+                    // Markup must be in place before the widget script initializes against it
+                    if (!document.getElementById('chatPopup')) {
+                        container.insertAdjacentHTML('beforeend', results[0]);
+                    }
+                    return loadScript(assetUrl(WIDGET_ASSETS.script));
+                })
+                .catch(function(error) {
+                    widgetPromise = null; // allow a retry on the next interaction
+                    throw error;
+                });
+        }
+        return widgetPromise;
+    }
+
+    function renderButton() {
+        // Minimal inline styling until the widget stylesheet arrives (it uses the same classes)
+        const container = document.createElement('div');
+        container.className = 'chat-widget';
+        container.style.cssText = 'position:fixed;bottom:20px;right:20px;z-index:1000;font-family:Arial,sans-serif;';
+        container.innerHTML =
+            '<button class="chat-button" id="chatToggle" aria-label="Open chat assistant" aria-expanded="false" ' +
+            'style="width:64px;height:64px;border-radius:50%;border:none;cursor:pointer;display:flex;align-items:center;' +
+            'justify-content:center;background:linear-gradient(135deg,#0057B8 0%,#0066cc 100%);box-shadow:0 6px 20px rgba(0,87,184,0.4);">' +
+            '<svg viewBox="0 0 24 24" aria-hidden="true" style="width:26px;height:26px;fill:white;">' +
+            '<path d="M20 2H4c-1.1 0-2 .9-2 2v12c0 1.1.9 2 2 2h4l4 4 4-4h4c1.1 0 2-.9 2-2V4c0-1.1-.9-2-2-2z"/></svg></button>';
+        document.body.appendChild(container);
+
+        const button = container.querySelector('#chatToggle');
+        const prefetch = function() {
+            loadWidget(container).catch(function(error) { console.warn('Chat widget prefetch failed:', error); });
+        };
+        button.addEventListener('mouseenter', prefetch, { once: true });
+        button.addEventListener('focus', prefetch, { once: true });
+        button.addEventListener('touchstart', prefetch, { once: true, passive: true });
+        button.addEventListener('click', function() {
+            button.setAttribute('aria-busy', 'true');
+            loadWidget(container)
+                .then(function() {
+                    window.toggleChat();
+                })
+                .catch(function(error) {
+                    console.error('Chat widget failed to load:', error);
+                })
+                .finally(function() {
+                    button.removeAttribute('aria-busy');
+                });
+        });
+    }
+
+    if (document.readyState === 'loading') {
+        document.addEventListener('DOMContentLoaded', renderButton);
+    } else {
+        renderButton();
+    }
+})();
@@ -5,17 +5,259 @@ let messageId = 0;
 let conversationHistory = []; // Store conversation context for current session
 let allConversationSources = []; // Accumulate all sources from the conversation without duplicates
 
+// Keyed render state: message records (text + structured sources) and rendered source items
+const messageStore = new Map(); // message id -> record
+const messageOrder = []; // records, oldest first
+const renderedSources = new Map(); // source key -> .source-item element
+let highlightedSourceItem = null;
+let messageWindowObserver = null;
+let windowedMessageCount = 0;
+// Only the newest messages stay rendered; older ones are emptied off-screen and rebuilt on approach
+const MESSAGE_RENDER_WINDOW = 40;
+
 // Language support variables
 let currentLanguage = 'en';
 let supportedLanguages = {};
 let isLanguageDropdownOpen = false;
 
+// API requests go to the chatbot host; chatbot_loader.js sets apiBase when embedded elsewhere
+function apiUrl(path) {
+    const config = window.CCC_CHAT_CONFIG || {};
+    return (config.apiBase || '') + path;
+}
+
+// Client-side cache (localStorage, alongside the saved language) for /languages and recent answers
+const LANGUAGES_CACHE_KEY = 'chatbot_languages';
+const LANGUAGES_CACHE_TTL_MS = 24 * 60 * 60 * 1000;
+// Localized fixed messages (/messages/<language>, built into a catalog on the server)
+const MESSAGES_CACHE_KEY_PREFIX = 'chatbot_messages_';
+const MESSAGES_CACHE_TTL_MS = 24 * 60 * 60 * 1000;
+const DEFAULT_MESSAGES = {
+    language_changed: "Language changed to {language}. I'll respond in {language} from now on."
+};
+const ANSWER_CACHE_KEY = 'chatbot_answers';
+const ANSWER_CACHE_TTL_MS = 30 * 60 * 1000;
+const ANSWER_CACHE_SIZE = 50;
+const ANSWER_CACHE_HISTORY_MESSAGES = 4; // the backend builds its search question from the same tail
+let inFlightChat = null; // { key, promise, controller } for the /chat request in progress
+// Attachments are analyzed in a background job; a retried upload sends the same key and reuses the job
+const JOB_POLL_INTERVAL_MS = 1000;
+const attachmentJobKeys = new WeakMap();
+// Jobs are only shared between uploads from the same page (sent as client_id)
+const attachmentClientId = randomId();
+
+function readCache(key) {
+    try {
+        const entry = JSON.parse(localStorage.getItem(key));
+        if (entry && entry.expires > Date.now()) return entry.value;
+    } catch (e) {
+        // Storage blocked or entry corrupt: behave as a miss
+    }
+    return null;
+}
+
+function writeCache(key, value, ttlMs) {
+    try {
+        localStorage.setItem(key, JSON.stringify({ value, expires: Date.now() + ttlMs }));
+    } catch (e) {
+        console.debug('Cache write skipped:', e);
+    }
+}
+
+function hashString(text) {
+    // FNV-1a; keeps history out of the cache keys themselves
+    let hash = 0x811c9dc5;
+    for (let i = 0; i < text.length; i++) {
+        hash ^= text.charCodeAt(i);
+        hash = Math.imul(hash, 0x01000193);
+    }
+    return (hash >>> 0).toString(16);
+}
+
+function answerCacheKey(message) {
+    // Same question, language and recent context -> same answer
+    const question = message.trim().toLowerCase().replace(/\s+/g, ' ');
+    const context = conversationHistory
+        .slice(-ANSWER_CACHE_HISTORY_MESSAGES)
+        .map(entry => `${entry.role}:${entry.content}`)
+        .join('\n');
+    return `${currentLanguage}|${hashString(context)}|${question}`;
+}
+
+function readCachedAnswer(key) {
+    const answers = readCache(ANSWER_CACHE_KEY) || {};
+    const entry = answers[key];
+    return entry && entry.expires > Date.now() ? entry.data : null;
+}
+
+function writeCachedAnswer(key, data) {
+    const now = Date.now();
+    const answers = readCache(ANSWER_CACHE_KEY) || {};
+    delete answers[key]; // re-insert so the newest entry is last
+    answers[key] = { data, expires: now + ANSWER_CACHE_TTL_MS };
+    // Drop expired entries, then the oldest ones beyond the size limit
+    const keys = Object.keys(answers).filter(k => answers[k].expires > now);
+    const kept = {};
+    keys.slice(-ANSWER_CACHE_SIZE).forEach(k => { kept[k] = answers[k]; });
+    writeCache(ANSWER_CACHE_KEY, kept, ANSWER_CACHE_TTL_MS);
+}
+
+function abortChatRequest() {
+    if (inFlightChat) {
+        inFlightChat.controller.abort();
+        inFlightChat = null;
+    }
+}
+
+// fetch() cannot report upload progress, so attachments go through XMLHttpRequest
+function xhrRequest(url, options, signal, onUploadProgress) {
+    return new Promise((resolve, reject) => {
+        const xhr = new XMLHttpRequest();
+        xhr.open(options.method || 'GET', url);
+        Object.entries(options.headers || {}).forEach(([name, value]) => xhr.setRequestHeader(name, value));
+        xhr.upload.onprogress = onUploadProgress;
+        xhr.onload = () => resolve({
+            ok: xhr.status >= 200 && xhr.status < 300,
+            status: xhr.status,
+            text: async () => xhr.responseText
+        });
+        xhr.onerror = () => reject(new TypeError('Network request failed'));
+        xhr.onabort = () => reject(new DOMException('The request was aborted.', 'AbortError'));
+        signal.addEventListener('abort', () => xhr.abort());
+        xhr.send(options.body);
+    });
+}
+
+function randomId() {
+    return window.crypto && crypto.randomUUID
+        ? crypto.randomUUID()
+        : `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+}
+
+function attachmentJobKey(file) {
+    if (!attachmentJobKeys.has(file)) {
+        attachmentJobKeys.set(file, randomId());
+    }
+    return attachmentJobKeys.get(file);
+}
+
+function showJobProgress(progress) {
+    const statusDiv = document.getElementById('fileStatus');
+    if (!statusDiv || !progress) return;
+    statusDiv.textContent = progress.stage === 'rendering' && progress.total
+        ? `Reading page ${progress.done} of ${progress.total}...`
+        : 'Processing...';
+    statusDiv.className = 'file-status processing';
+}
+
+// Poll an attachment job to its result
+function waitForJob(job, signal) {
+    if (job.status === 'done') return Promise.resolve(job.result);
+    return new Promise((resolve, reject) => {
+        let timer = null;
+        let settled = false;
+        const finish = (callback, value) => {
+            if (settled) return;
+            settled = true;
+            clearTimeout(timer);
+            callback(value);
+        };
+        const update = state => {
+            if (state.status === 'done') finish(resolve, state.result);
+            else if (state.status === 'failed') {
+                const failure = new Error(state.error || 'Attachment analysis failed');
+                failure.userMessage = state.error; // already in the user's language
+                finish(reject, failure);
+            }
+            else showJobProgress(state.progress);
+        };
+        const poll = async () => {
+            try {
+                const response = await fetch(apiUrl(job.status_url), { signal });
+                if (!response.ok) throw new Error(`Server error: ${response.status}`);
+                update(await response.json());
+            } catch (error) {
+                finish(reject, error);
+            }
+            if (!settled) timer = setTimeout(poll, JOB_POLL_INTERVAL_MS);
+        };
+        signal.addEventListener('abort', () => finish(reject, new DOMException('The request was aborted.', 'AbortError')));
+        timer = setTimeout(poll, JOB_POLL_INTERVAL_MS);
+    });
+}
+
+function postChat(key, fetchOptions, onUploadProgress = null) {
+    // Identical requests share the one in flight; any other request supersedes it
+    if (key && inFlightChat && inFlightChat.key === key) {
+        return inFlightChat.promise;
+    }
+    abortChatRequest();
+
+    const controller = new AbortController();
+    const request = onUploadProgress
+        ? xhrRequest(apiUrl('/chat'), fetchOptions, controller.signal, onUploadProgress)
+        : fetch(apiUrl('/chat'), { ...fetchOptions, signal: controller.signal });
+    const promise = request
+        .then(async response => {
+            if (!response.ok) {
+                throw new Error(`Server error: ${response.status}`);
+            }
+            const raw = await response.text();
+            const data = safeParseJson(raw);
+            if (!data) {
+                // Fallback: coerce a plain-text reply to the usual shape
+                console.warn('Response is not valid JSON; using text fallback');
+                return { response: raw };
+            }
+            if (data.job_id) {
+                showJobProgress(data.progress);
+                return waitForJob(data, controller.signal);
+            }
+            return data;
+        })
+        .finally(() => {
+            if (inFlightChat && inFlightChat.promise === promise) {
+                inFlightChat = null;
+            }
+        });
+    inFlightChat = { key, promise, controller };
+    return promise;
+}
+
+async function requestAnswer(message) {
+    const key = answerCacheKey(message);
+    const cached = readCachedAnswer(key);
+    if (cached) {
+        console.log('Answer served from client cache');
+        return cached;
+    }
+    const data = await postChat(key, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({ 
+            message: message,
+            conversation_history: conversationHistory,
+            user_language: currentLanguage,
+            output_language: currentLanguage
+        })
+    });
+    // Knowledge base failures come back as a normal reply flagged is_error; never cache them
+    if (data && (data.response || data.answer) && !data.error && !data.is_error) {
+        writeCachedAnswer(key, data);
+    }
+    return data;
+}
+
 // Initialize drag and drop and scroll handling
-document.addEventListener('DOMContentLoaded', function() {
+function initializeChatWidget() {
     initializeDragAndDrop();
     initializeScrollHandling();
     initializeKeyboardShortcuts();
     initializeLanguageSupport();
+    initializeMessageRendering();
+    initializeSourcesPanel();
     
     // Initialize textarea height
     const messageInput = document.getElementById('messageInput');
@@ -28,7 +270,7 @@ document.addEventListener('DOMContentLoaded', function() {
         window.chatDebug = {
             async runTest() {
                 const payload = { message: 'Please return test sources [TEST_SOURCES]', conversation_history: [], test_sources: true };
-                const res = await fetch('/chat', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify(payload) });
+                const res = await fetch(apiUrl('/chat'), { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify(payload) });
                 const data = await res.json();
                 console.log('[chatDebug] /chat data ->', data);
                 let responseText = data.response || data.answer || '';
@@ -38,15 +280,8 @@ document.addEventListener('DOMContentLoaded', function() {
                 }
                 const normalized = normalizeSources(sourcesFromJson);
                 console.log('[chatDebug] normalized sources ->', normalized);
-                if (normalized.length === 0) {
-                    const derived = deriveSourcesFromResponseText(responseText);
-                    console.log('[chatDebug] derived from text ->', derived);
-                    updateSourcesPanel(derived);
-                    addMessage(responseText, 'bot', derived, ++messageId);
-                } else {
-                    updateSourcesPanel(normalized);
-                    addMessage(responseText, 'bot', normalized, ++messageId);
-                }
+                updateSourcesPanel(normalized);
+                addMessage(responseText, 'bot', normalized, ++messageId);
             },
             logState() {
                 const panel = document.getElementById('sourcesPanel');
@@ -68,15 +303,29 @@ document.addEventListener('DOMContentLoaded', function() {
         };
         console.log('[chatDebug] available. Try: chatDebug.runTest() or chatDebug.logState()');
     } catch (e) {}
-});
+}
+
+// The loader injects this script after the page has loaded, when DOMContentLoaded has already fired
+if (document.readyState === 'loading') {
+    document.addEventListener('DOMContentLoaded', initializeChatWidget);
+} else {
+    initializeChatWidget();
+}
 
 // Language Support Functions
 async function initializeLanguageSupport() {
     try {
-        // Load supported languages from backend
-        const response = await fetch('/languages');
-        const data = await response.json();
-        supportedLanguages = data.languages;
+        // Load supported languages from the cache, or the backend when it has expired
+        let languages = readCache(LANGUAGES_CACHE_KEY);
+        if (!languages) {
+            const response = await fetch(apiUrl('/languages'));
+            const data = await response.json();
+            languages = data.languages;
+            if (languages) {
+                writeCache(LANGUAGES_CACHE_KEY, languages, LANGUAGES_CACHE_TTL_MS);
+            }
+        }
+        supportedLanguages = languages;
         
         // Set initial language from browser or saved preference (without showing message)
         const savedLang = localStorage.getItem('chatbot_language') || getBrowserLanguage();
@@ -159,6 +408,9 @@ function selectLanguage(languageCode) {
     
     currentLanguage = languageCode;
     
+    // An answer still on its way would come back in the old language
+    abortChatRequest();
+    
     // Update UI
     updateLanguageDisplay();
     updateLanguageDropdownSelection();
@@ -204,9 +456,33 @@ function updateLanguageDisplay() {
     }
 }
 
-function addLanguageChangeMessage(languageCode) {
+async function loadMessages(languageCode) {
+    const cacheKey = MESSAGES_CACHE_KEY_PREFIX + languageCode;
+    let messages = readCache(cacheKey);
+    if (!messages) {
+        try {
+            const response = await fetch(apiUrl(`/messages/${encodeURIComponent(languageCode)}`));
+            if (response.ok) {
+                messages = (await response.json()).messages;
+                if (messages) {
+                    writeCache(cacheKey, messages, MESSAGES_CACHE_TTL_MS);
+                }
+            }
+        } catch (error) {
+            console.debug('Message catalog unavailable:', error);
+        }
+    }
+    return { ...DEFAULT_MESSAGES, ...messages };
+}
+
+function formatMessage(template, values) {
+    return template.replace(/\{(\w+)\}/g, (match, name) => (name in values ? values[name] : match));
+}
+
+async function addLanguageChangeMessage(languageCode) {
     const languageName = supportedLanguages[languageCode] || languageCode;
-    const message = `Language changed to ${languageName}. I'll respond in ${languageName} from now on.`;
+    const messages = await loadMessages(languageCode);
+    const message = formatMessage(messages.language_changed, { language: languageName });
     
     // Add a small system message
     const chatMessages = document.getElementById('chatMessages');
@@ -254,15 +530,6 @@ function markdownToHtml(md) {
         .replace(/\n/g, '<br>');
 }
 
-function deriveSourcesFromResponseText(responseText) {
-    const html = markdownToHtml(responseText || '');
-    try {
-        return extractSourcesFromMessageHtml(html);
-    } catch {
-        return [];
-    }
-}
-
 // Flatten Bedrock-style citations into normalized sources
 function flattenCitations(citations) {
     if (!Array.isArray(citations)) return [];
@@ -383,15 +650,12 @@ function updateFullscreenButton() {
 }
 
 let sourcesToggleTimeout = null;
-let originalSourcesContent = null;
 let sourcesBorderTimeout = null; // delay adding unified border until panel is open
 
 function toggleSourcesPanel() {
     const panel = document.getElementById('sourcesPanel');
     const popup = document.getElementById('chatPopup');
     const btn = document.getElementById('sourcesBtn');
-    const sourcesList = document.getElementById('sourcesList');
-    const sourcesHeader = panel.querySelector('.sources-header');
     // Keep CSS variable in sync for unified border ::before width
     const SOURCES_WIDTH = 320; // keep in sync with CSS default
     
@@ -403,15 +667,8 @@ function toggleSourcesPanel() {
     }
     
     if (isOpen) {
-        // Closing: save content, replace with empty, then close panel
-        originalSourcesContent = {
-            list: sourcesList.innerHTML,
-            header: sourcesHeader.innerHTML
-        };
-        
-        // Clear content immediately
-        sourcesList.innerHTML = '';
-        sourcesHeader.innerHTML = '';
+        // Closing: hide the contents immediately (they stay in the DOM), then close panel
+        panel.classList.add('contents-hidden');
         
         // Begin closing: square corners right away
         popup.classList.add('sources-closing');
@@ -465,12 +722,8 @@ function toggleSourcesPanel() {
         // Hide notification dot when opening panel
         hideSourcesNotification();
         
-        // Restore content if it was saved
-        if (originalSourcesContent) {
-            sourcesList.innerHTML = originalSourcesContent.list;
-            sourcesHeader.innerHTML = originalSourcesContent.header;
-            originalSourcesContent = null;
-        }
+        // Show the contents again, including any sources added while closed
+        panel.classList.remove('contents-hidden');
     }
     
     // Update button appearance and accessibility
@@ -605,14 +858,164 @@ function handleAttachment(event) {
     }
 }
 
+// Images are downscaled to the long edge Claude Vision works at (it resizes anything larger
+// itself) and re-encoded before upload, so 10+ MB phone photos become a few hundred KB
+const MAX_UPLOAD_BYTES = 16 * 1024 * 1024; // 16MB, same as the backend
+const IMAGE_MAX_DIMENSION = 1568;
+const IMAGE_QUALITY = 0.85;
+const IMAGE_COMPRESS_MIN_BYTES = 512 * 1024; // smaller images upload quickly as they are
+const COMPRESSIBLE_IMAGE_TYPES = ['image/png', 'image/jpeg', 'image/bmp', 'image/tiff', 'image/webp'];
+let attachmentPreparation = null; // Promise of the file to upload for currentAttachment
+let imageWorker = null; // null: not created yet, false: unavailable
+const imageWorkerJobs = new Map();
+let imageWorkerJobId = 0;
+
+// Self-contained: its source is also copied into the image worker
+async function resizeImage(file, maxDimension, quality) {
+    const bitmap = await createImageBitmap(file);
+    const scale = Math.min(1, maxDimension / Math.max(bitmap.width, bitmap.height));
+    const width = Math.max(1, Math.round(bitmap.width * scale));
+    const height = Math.max(1, Math.round(bitmap.height * scale));
+    const makeCanvas = typeof OffscreenCanvas !== 'undefined'
+        ? () => new OffscreenCanvas(width, height)
+        : () => Object.assign(document.createElement('canvas'), { width, height });
+    const toBlob = (canvas, type) => canvas.convertToBlob
+        ? canvas.convertToBlob({ type, quality })
+        : new Promise(resolve => canvas.toBlob(resolve, type, quality));
+
+    try {
+        // WebP keeps transparency; browsers that cannot encode it hand back PNG, so fall back to JPEG
+        for (const type of ['image/webp', 'image/jpeg']) {
+            const canvas = makeCanvas();
+            const context = canvas.getContext('2d');
+            if (type === 'image/jpeg') {
+                context.fillStyle = '#fff';
+                context.fillRect(0, 0, width, height);
+            }
+            context.drawImage(bitmap, 0, 0, width, height);
+            const blob = await toBlob(canvas, type);
+            if (blob && blob.type === type) {
+                return { blob, width, height };
+            }
+        }
+        throw new Error('Image could not be re-encoded');
+    } finally {
+        bitmap.close();
+    }
+}
+
+function onImageWorkerRequest(event) {
+    const { id, file, maxDimension, quality } = event.data;
+    resizeImage(file, maxDimension, quality)
+        .then(result => self.postMessage({ id, ...result }))
+        .catch(error => self.postMessage({ id, error: error.message }));
+}
+
+function getImageWorker() {
+    if (imageWorker === null) {
+        imageWorker = false;
+        if (typeof Worker !== 'undefined' && typeof OffscreenCanvas !== 'undefined') {
+            try {
+                // A Blob URL works when the widget is embedded on another origin
+                const source = `${resizeImage.toString()}\nself.onmessage = ${onImageWorkerRequest.toString()};`;
+                imageWorker = new Worker(URL.createObjectURL(new Blob([source], { type: 'text/javascript' })));
+                imageWorker.onmessage = function(event) {
+                    const job = imageWorkerJobs.get(event.data.id);
+                    if (!job) return;
+                    imageWorkerJobs.delete(event.data.id);
+                    if (event.data.error) {
+                        job.reject(new Error(event.data.error));
+                    } else {
+                        job.resolve(event.data);
+                    }
+                };
+                imageWorker.onerror = function(event) {
+                    // e.g. a host page CSP that blocks blob: workers; later images resize on the main thread
+                    console.warn('Image worker failed:', event.message);
+                    imageWorker = false;
+                    imageWorkerJobs.forEach(job => job.reject(new Error('Image worker failed')));
+                    imageWorkerJobs.clear();
+                };
+            } catch (e) {
+                console.warn('Image worker unavailable:', e);
+                imageWorker = false;
+            }
+        }
+    }
+    return imageWorker || null;
+}
+
+function resizeImageOffMainThread(file) {
+    const worker = getImageWorker();
+    if (!worker) {
+        return resizeImage(file, IMAGE_MAX_DIMENSION, IMAGE_QUALITY);
+    }
+    return new Promise((resolve, reject) => {
+        const id = ++imageWorkerJobId;
+        imageWorkerJobs.set(id, { resolve, reject });
+        worker.postMessage({ id, file, maxDimension: IMAGE_MAX_DIMENSION, quality: IMAGE_QUALITY });
+    });
+}
+
+async function compressImage(file) {
+    if (!COMPRESSIBLE_IMAGE_TYPES.includes(file.type) || file.size < IMAGE_COMPRESS_MIN_BYTES) {
+        return file;
+    }
+    const { blob, width, height } = await resizeImageOffMainThread(file);
+    if (blob.size >= file.size) {
+        return file;
+    }
+    console.log(`Image compressed: ${file.size} -> ${blob.size} bytes (${width}x${height})`);
+    const extension = blob.type === 'image/webp' ? 'webp' : 'jpg';
+    const name = `${file.name.replace(/\.[^.]+$/, '')}.${extension}`;
+    return new File([blob], name, { type: blob.type, lastModified: file.lastModified });
+}
+
+function formatFileSize(bytes) {
+    return bytes >= 1024 * 1024 ? `${(bytes / 1024 / 1024).toFixed(1)} MB` : `${Math.ceil(bytes / 1024)} KB`;
+}
+
+function prepareAttachment(file) {
+    // Runs while the student types their question; sendMessage waits for it
+    const preparation = compressImage(file)
+        .catch(error => {
+            console.warn('Image compression failed; sending the original:', error);
+            return file;
+        })
+        .then(prepared => {
+            // Ignore an attachment that has since been replaced or removed
+            if (attachmentPreparation !== preparation) return prepared;
+            const statusDiv = document.getElementById('fileStatus');
+            if (prepared.size > MAX_UPLOAD_BYTES) {
+                showFileError('File is too large. Maximum size is 16MB.');
+            } else if (statusDiv) {
+                statusDiv.textContent = prepared === file
+                    ? 'Ready to send'
+                    : `Ready to send (${formatFileSize(file.size)} → ${formatFileSize(prepared.size)})`;
+                statusDiv.className = 'file-status';
+            }
+            return prepared;
+        });
+    attachmentPreparation = preparation;
+    return preparation;
+}
+
+function showUploadProgress(event) {
+    const statusDiv = document.getElementById('fileStatus');
+    if (!statusDiv || !event.lengthComputable) return;
+    const percent = Math.round((event.loaded / event.total) * 100);
+    statusDiv.textContent = percent < 100 ? `Uploading... ${percent}%` : 'Processing...';
+    statusDiv.className = 'file-status processing';
+}
+
 function handleFileSelection(file) {
-    const maxSize = 16 * 1024 * 1024; // 16MB
-    if (file.size > maxSize) {
+    // Images that will be compressed are checked against the limit after compression
+    if (file.size > MAX_UPLOAD_BYTES && !COMPRESSIBLE_IMAGE_TYPES.includes(file.type)) {
         showFileError('File is too large. Maximum size is 16MB.');
         return;
     }
     
-    const allowedTypes = ['pdf', 'png', 'jpg', 'jpeg', 'gif', 'bmp', 'tiff'];
+    const allowedTypes = ['pdf', 'png', 'jpg', 'jpeg', 'gif', 'bmp', 'tiff', 'webp'];
     const fileExt = file.name.split('.').pop().toLowerCase();
     if (!allowedTypes.includes(fileExt)) {
         showFileError('File type not supported. Please use PDF, PNG, JPG, or other image formats.');
@@ -631,6 +1034,7 @@ function handleFileSelection(file) {
     statusDiv.textContent = 'Ready to send';
     statusDiv.className = 'file-status';
     preview.style.display = 'flex';
+    prepareAttachment(file);
     
     // Update placeholder text
     const input = document.getElementById('messageInput');
@@ -655,6 +1059,7 @@ function showFileError(message) {
 
 function clearAttachment() {
     currentAttachment = null;
+    attachmentPreparation = null;
     const preview = document.getElementById('attachmentPreview');
     preview.style.display = 'none';
     
@@ -667,13 +1072,14 @@ function clearAttachment() {
 }
 
 function clearConversationHistory() {
+    abortChatRequest();
     conversationHistory = [];
     allConversationSources = [];
     currentSources = [];
     console.log('Conversation history and sources cleared');
     
     // Clear the sources panel
-    updateSourcesPanel([]);
+    resetSourcesPanel();
 }
 
 async function sendMessage() {
@@ -716,49 +1122,29 @@ async function sendMessage() {
     }
     
     try {
-        let response;
+        let data;
         
         if (currentAttachment) {
-            // Send message with attachment
+            // Send message with attachment (never cached), resized if preprocessing applied
+            const uploadFile = await (attachmentPreparation || currentAttachment);
             const formData = new FormData();
             formData.append('message', message);
-            formData.append('file', currentAttachment);
+            formData.append('file', uploadFile);
             formData.append('conversation_history', JSON.stringify(conversationHistory));
             formData.append('user_language', currentLanguage);
             formData.append('output_language', currentLanguage);
+            // Same file, question and context: a retry of this send
+            const requestHash = hashString(JSON.stringify([message, currentLanguage, conversationHistory]));
+            formData.append('idempotency_key', `${attachmentJobKey(currentAttachment)}-${requestHash}`);
+            formData.append('client_id', attachmentClientId);
             
-            response = await fetch('/chat', {
+            data = await postChat(null, {
                 method: 'POST',
                 body: formData
-            });
+            }, showUploadProgress);
         } else {
-            // Send regular message with conversation history
-            response = await fetch('/chat', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({ 
-                    message: message,
-                    conversation_history: conversationHistory,
-                    user_language: currentLanguage,
-                    output_language: currentLanguage
-                })
-            });
-        }
-        
-        if (!response.ok) {
-            throw new Error(`Server error: ${response.status}`);
-        }
-        
-        let data;
-        try {
-            data = await response.json();
-        } catch (e) {
-            // Fallback: try text and coerce to shape
-            const raw = await response.text();
-            console.warn('Response is not valid JSON; using text fallback');
-            data = safeParseJson(raw) || { response: raw };
+            // Send regular message with conversation history, or reuse a recent answer
+            data = await requestAnswer(message);
         }
         console.log('Received data:', data);
         
@@ -789,16 +1175,10 @@ async function sendMessage() {
             const flattened = flattenCitations(data.citations);
             if (flattened.length) sourcesFromJson = flattened;
         }
-        let normalizedSources = normalizeSources(sourcesFromJson);
+        // Sources are only ever the backend's structured list, kept on the message record
+        const normalizedSources = normalizeSources(sourcesFromJson);
         console.log('Sources from JSON:', sourcesFromJson, 'Normalized:', normalizedSources);
         
-        // If backend embedded sources into the text but not JSON, attempt extraction
-        if ((!normalizedSources || normalizedSources.length === 0) && responseText) {
-            console.log('Attempting to derive sources from response text');
-            normalizedSources = deriveSourcesFromResponseText(responseText);
-            console.log('Derived sources:', normalizedSources);
-        }
-        
     // Update panel ASAP so user sees sources even if message rendering fails
     try { updateSourcesPanel(normalizedSources); } catch (e) { console.warn('Early sources panel update failed:', e); }
         
@@ -808,7 +1188,7 @@ async function sendMessage() {
         try {
             console.log('About to call addMessage with:', responseText);
             console.log('normalizedSources:', normalizedSources);
-            addMessage(responseText, 'bot', normalizedSources, msgId + 1);
+            addMessage(responseText, 'bot', normalizedSources, ++messageId);
             console.log('addMessage completed successfully');
             
             // Store this exchange in conversation history
@@ -830,11 +1210,6 @@ async function sendMessage() {
             
             console.log('Conversation history updated:', conversationHistory);
             
-            // Update sources panel
-            console.log('About to update sources panel');
-            updateSourcesPanel(normalizedSources);
-            console.log('Sources panel updated');
-            
         } catch (messageError) {
             console.error('Error in message processing:', messageError);
             console.error('Error stack:', messageError.stack);
@@ -853,12 +1228,18 @@ async function sendMessage() {
         // emitMetric('message_sent', { hasAttachment: !!currentAttachment });
         
     } catch (error) {
-        console.error('Error sending message:', error);
         showTyping(false);
+        if (error.name === 'AbortError') {
+            // Superseded by a newer request, a language change or a cleared conversation
+            console.log('Chat request cancelled');
+            sendBtn.disabled = false;
+            return;
+        }
+        console.error('Error sending message:', error);
         
         // Show error message with retry option
-        const errorMsg = 'Sorry, I\'m having trouble connecting right now.';
-        addErrorMessage(errorMsg, message, currentAttachment, msgId + 1);
+        const errorMsg = error.userMessage || 'Sorry, I\'m having trouble connecting right now.';
+        addErrorMessage(errorMsg, message, currentAttachment, ++messageId);
         
         // Update file status if attachment exists
         if (currentAttachment) {
@@ -913,6 +1294,7 @@ function retryMessage(message, attachment, errorElement) {
         statusDiv.textContent = 'Ready to send';
         statusDiv.className = 'file-status';
         preview.style.display = 'flex';
+        prepareAttachment(attachment);
         
         input.placeholder = `Ask something about ${attachment.name}...`;
     }
@@ -921,105 +1303,161 @@ function retryMessage(message, attachment, errorElement) {
     sendMessage();
 }
 
+// Sources are identified by URI when available; otherwise by title + snippet
+function sourceKey(source) {
+    if (source.uri) return `uri:${source.uri}`;
+    return `text:${(source.title || '').trim()}|${(source.snippet || '').trim()}`;
+}
+
+function sourceItemElement(sourceIndex) {
+    const source = allConversationSources[sourceIndex];
+    return source ? renderedSources.get(sourceKey(source)) : null;
+}
+
+function createSourceItem(source, index) {
+    let linkUrl = source.uri || '';
+    if (source.uri && source.snippet && source.snippet.length > 5) {
+        // Clean and encode the snippet for the text fragment
+        const cleanSnippet = source.snippet.trim().replace(/[\r\n]+/g, ' ').substring(0, 150);
+        linkUrl = `${source.uri}#:~:text=${encodeURIComponent(cleanSnippet)}`;
+    }
+
+    const item = document.createElement('div');
+    item.className = 'source-item';
+    item.id = `source-${source.number}`;
+    item.dataset.sourceIndex = index;
+    item.dataset.sourceUrl = linkUrl;
+    item.setAttribute('role', 'button');
+    item.setAttribute('aria-label', `Source: ${source.title || 'Citation'}`);
+    item.tabIndex = 0;
+
+    const title = document.createElement('div');
+    title.className = 'source-title';
+    title.textContent = `[${source.number}] ${source.title || 'Citation'}`;
+
+    const snippet = document.createElement('div');
+    snippet.className = 'source-snippet';
+    snippet.textContent = source.snippet || '';
+
+    // Build URL section depending on availability
+    const urlSection = document.createElement('div');
+    urlSection.className = 'source-url';
+    if (source.uri) {
+        const link = document.createElement('a');
+        link.href = linkUrl;
+        link.target = '_blank';
+        link.rel = 'noopener noreferrer';
+        link.textContent = source.uri;
+        urlSection.appendChild(link);
+    } else {
+        urlSection.classList.add('no-link');
+        urlSection.textContent = 'No link available';
+    }
+
+    item.append(title, snippet, urlSection);
+    return item;
+}
+
+function initializeSourcesPanel() {
+    // Delegated handlers cover every source item, however many get appended later
+    const sourcesList = document.getElementById('sourcesList');
+    if (!sourcesList) return;
+
+    const activateSource = (event) => {
+        const item = event.target.closest('.source-item');
+        if (!item) return;
+        const index = parseInt(item.dataset.sourceIndex, 10);
+        if (item.dataset.sourceUrl) {
+            showSourceContextMenu(event, index, item.dataset.sourceUrl);
+        } else {
+            // No URL: only highlighting makes sense
+            event.preventDefault();
+            highlightSource(index);
+        }
+    };
+
+    sourcesList.addEventListener('click', function(event) {
+        // Let the source link itself open normally
+        if (event.target.closest('a')) return;
+        activateSource(event);
+    });
+    sourcesList.addEventListener('contextmenu', activateSource);
+    sourcesList.addEventListener('keypress', function(event) {
+        if (event.key !== 'Enter' && event.key !== ' ') return;
+        const item = event.target.closest('.source-item');
+        if (!item) return;
+        event.preventDefault();
+        showSourceContextMenu(event, parseInt(item.dataset.sourceIndex, 10), item.dataset.sourceUrl);
+    });
+}
+
+function resetSourcesPanel() {
+    renderedSources.clear();
+    highlightedSourceItem = null;
+
+    const placeholder = document.createElement('p');
+    placeholder.className = 'no-sources';
+    placeholder.textContent = 'No sources for this conversation.';
+    document.getElementById('sourcesList').replaceChildren(placeholder);
+
+    const sourcesHeaderTitle = document.getElementById('sourcesHeaderTitle');
+    if (sourcesHeaderTitle) {
+        sourcesHeaderTitle.textContent = 'Sources';
+    }
+}
+
 function updateSourcesPanel(newSources) {
-    // Add new sources to the accumulated list, avoiding duplicates
+    // Add new sources to the accumulated list, avoiding duplicates. Only new items are
+    // rendered; the ones already in the panel are left untouched.
     const wasEmpty = allConversationSources.length === 0;
-    if (newSources && newSources.length > 0) {
-        newSources.forEach(newSource => {
-            // Check if this source already exists. Prefer URI when available; otherwise match by snippet+title.
-            let existingSource = null;
-            if (newSource.uri) {
-                existingSource = allConversationSources.find(source => source.uri === newSource.uri);
-            } else {
-                existingSource = allConversationSources.find(source =>
-                    (!source.uri) &&
-                    (source.snippet || '').trim() === (newSource.snippet || '').trim() &&
-                    (source.title || '').trim() === (newSource.title || '').trim()
-                );
-            }
-            if (!existingSource) {
-                // Assign a new number based on total count
-                const sourceWithNumber = {
-                    ...newSource,
-                    number: allConversationSources.length + 1
-                };
-                allConversationSources.push(sourceWithNumber);
-            }
-        });
-    }
+    const added = document.createDocumentFragment();
+    (newSources || []).forEach(newSource => {
+        if (!newSource) return;
+        const key = sourceKey(newSource);
+        if (renderedSources.has(key)) return;
+        // Assign a new number based on total count
+        const source = { ...newSource, number: allConversationSources.length + 1 };
+        allConversationSources.push(source);
+        const item = createSourceItem(source, allConversationSources.length - 1);
+        renderedSources.set(key, item);
+        added.appendChild(item);
+    });
     
     // Update current sources to be all accumulated sources
     currentSources = allConversationSources;
-    const sourcesList = document.getElementById('sourcesList');
-    const notificationDot = document.getElementById('sourcesNotificationDot');
-    const sourcesPanel = document.getElementById('sourcesPanel');
-    const sourcesHeaderTitle = document.getElementById('sourcesHeaderTitle');
-    const sourcesBtn = document.getElementById('sourcesBtn');
     
-    if (!allConversationSources || allConversationSources.length === 0) {
-        sourcesList.innerHTML = '<p class="no-sources">No sources for this conversation.</p>';
+    if (allConversationSources.length === 0) {
+        resetSourcesPanel();
         hideSourcesNotification();
         return;
     }
+    if (!added.childNodes.length) return;
     
-    // Show notification dot and accent button if panel is closed and there are new sources
-    if (!sourcesPanel.classList.contains('open') && newSources && newSources.length > 0) {
-        showSourcesNotification();
-        if (sourcesBtn) sourcesBtn.style.background = 'rgba(255,255,255,0.35)';
-    }
-    
-    let sourcesHTML = '';
-    allConversationSources.forEach((source, index) => {
-        let linkUrl = source.uri || '';
-        if (source.uri && source.snippet && source.snippet.length > 5) {
-            // Clean and encode the snippet for the text fragment
-            const cleanSnippet = source.snippet.trim().replace(/[\r\n]+/g, ' ').substring(0, 150);
-            linkUrl = `${source.uri}#:~:text=${encodeURIComponent(cleanSnippet)}`;
-        }
-
-        // Build URL section depending on availability
-        const urlSection = source.uri
-            ? `<div class="source-url"><a href="${linkUrl}" target="_blank" rel="noopener noreferrer" onclick="event.stopPropagation();">${source.uri}</a></div>`
-            : `<div class="source-url no-link">No link available</div>`;
-
-        // For context menu, when no URL, pass empty string and only enable highlight
-        const safeLinkForMenu = (linkUrl || '').replace(/'/g, "\\'");
-    const hasUrl = !!source.uri;
-        const onClick = hasUrl
-            ? `showSourceContextMenu(event, ${index}, '${safeLinkForMenu}')`
-            : `highlightSource(${index});`;
-
-        sourcesHTML += `
-            <div class="source-item" id="source-${source.number}" data-source-index="${index}" data-source-url="${linkUrl}" role="button" tabindex="0" aria-label="Source: ${source.title || 'Citation'}" onclick="${onClick}" oncontextmenu="${hasUrl ? `showSourceContextMenu(event, ${index}, '${safeLinkForMenu}')` : 'event.preventDefault(); highlightSource(' + index + ');'}" style="position: relative;">
-                <div class="source-title">[${source.number}] ${source.title || 'Citation'}</div>
-                <div class="source-snippet">${source.snippet || ''}</div>
-                ${urlSection}
-            </div>
-        `;
-    });
+    const sourcesList = document.getElementById('sourcesList');
+    const sourcesPanel = document.getElementById('sourcesPanel');
+    const sourcesHeaderTitle = document.getElementById('sourcesHeaderTitle');
+    const sourcesBtn = document.getElementById('sourcesBtn');
     
-    sourcesList.innerHTML = sourcesHTML;
+    const placeholder = sourcesList.querySelector('.no-sources');
+    if (placeholder) {
+        placeholder.remove();
+    }
+    sourcesList.appendChild(added);
     // Update header count if available
     if (sourcesHeaderTitle) {
         sourcesHeaderTitle.textContent = `Sources (${allConversationSources.length})`;
     }
     
-    // On first arrival of sources, automatically open the panel for visibility
-    if (wasEmpty && allConversationSources.length > 0 && !sourcesPanel.classList.contains('open')) {
-        toggleSourcesPanel();
+    if (!sourcesPanel.classList.contains('open')) {
+        if (wasEmpty) {
+            // On first arrival of sources, automatically open the panel for visibility
+            toggleSourcesPanel();
+        } else {
+            // Show notification dot and accent button for new sources while the panel is closed
+            showSourcesNotification();
+            if (sourcesBtn) sourcesBtn.style.background = 'rgba(255,255,255,0.35)';
+        }
     }
-    
-    // Add keyboard support for source items
-    document.querySelectorAll('.source-item').forEach(item => {
-        item.addEventListener('keypress', function(e) {
-            if (e.key === 'Enter' || e.key === ' ') {
-                e.preventDefault();
-                const index = parseInt(this.getAttribute('data-source-index'));
-                const url = this.getAttribute('data-source-url');
-                showSourceContextMenu(e, index, url);
-            }
-        });
-    });
 }
 
 function showSourcesNotification() {
@@ -1034,27 +1472,25 @@ function hideSourcesNotification() {
 
 function highlightSource(sourceIndex) {
     // Highlight source in panel
-    document.querySelectorAll('.source-item').forEach(item => {
-        item.classList.remove('highlighted');
-        item.setAttribute('aria-selected', 'false');
-    });
+    if (highlightedSourceItem) {
+        highlightedSourceItem.classList.remove('highlighted');
+        highlightedSourceItem.setAttribute('aria-selected', 'false');
+    }
     
-    const sourceItem = document.querySelector(`[data-source-index="${sourceIndex}"]`);
+    const sourceItem = sourceItemElement(sourceIndex);
+    highlightedSourceItem = sourceItem;
     if (sourceItem) {
         sourceItem.classList.add('highlighted');
         sourceItem.setAttribute('aria-selected', 'true');
         sourceItem.scrollIntoView({ behavior: 'smooth', block: 'center' });
     }
     
-    // Find and highlight corresponding link(s) in messages by URI or number
-    document.querySelectorAll('.footnote-link').forEach(link => {
-        link.style.backgroundColor = 'transparent';
-        link.style.fontWeight = '500';
-    });
-
+    // Find and highlight corresponding link(s) in rendered messages by URI or number
     const src = currentSources[sourceIndex] || {};
     const targetLinks = [];
-    document.querySelectorAll('.footnote-link').forEach(link => {
+    document.querySelectorAll('#chatMessages .footnote-link').forEach(link => {
+        link.style.backgroundColor = 'transparent';
+        link.style.fontWeight = '500';
         const byIndex = link.getAttribute('data-source-index') === String(sourceIndex);
         const byUri = src.uri && link.getAttribute('data-source-uri') === src.uri;
         const byNumber = link.textContent && link.textContent.trim() === `[${src.number}]`;
@@ -1183,29 +1619,13 @@ function scrollToSource(number) {
 function showMessageSources(messageId, sourceNumber) {
     console.log(`Looking for source ${sourceNumber} from message ${messageId}`);
     
-    // Find the message element
-    const messageElement = document.querySelector(`[data-message-id="${messageId}"]`);
-    if (!messageElement) {
+    // Sources were stored with the message when it was added
+    const record = messageStore.get(Number(messageId));
+    if (!record) {
         console.log('Message not found:', messageId);
         return;
     }
-    
-    // First try to get sources from the message's data attribute
-    let sources = [];
-    try {
-        const sourcesData = messageElement.getAttribute('data-sources');
-        if (sourcesData) {
-            sources = JSON.parse(sourcesData);
-        }
-    } catch (e) {
-        console.warn('Failed to parse stored sources:', e);
-    }
-    
-    // If no stored sources, extract from HTML
-    if (!sources || sources.length === 0) {
-        const messageHtml = messageElement.innerHTML;
-        sources = extractSourcesFromMessageHtml(messageHtml);
-    }
+    const sources = record.sources;
     
     console.log('Sources for message:', sources);
     
@@ -1242,23 +1662,6 @@ function showMessageSources(messageId, sourceNumber) {
     }
 }
 
-function highlightSourceByNumber(sourceNumber) {
-    // Find source by its number (not index)
-    const sourceElements = document.querySelectorAll('.source-item');
-    sourceElements.forEach((element, index) => {
-        element.classList.remove('highlighted');
-        element.setAttribute('aria-selected', 'false');
-        
-        // Check if this source has the matching number
-        const sourceId = element.getAttribute('id');
-        if (sourceId === `source-${sourceNumber}`) {
-            element.classList.add('highlighted');
-            element.setAttribute('aria-selected', 'true');
-            element.scrollIntoView({ behavior: 'smooth', block: 'center' });
-        }
-    });
-}
-
 function highlightSpecificSource(sourceNumber, sources) {
     console.log(`Highlighting source ${sourceNumber} from:`, sources);
     
@@ -1269,23 +1672,10 @@ function highlightSpecificSource(sourceNumber, sources) {
         return;
     }
 
-    // Primary mapping: find the panel item by URI (ignore text-fragment differences)
+    // Map to the panel's numbering by URI (ignore text-fragment differences), then by number
     const baseUri = (sourceObj.uri || '').split('#')[0];
     let targetIndex = -1;
-    const items = Array.from(document.querySelectorAll('.source-item'));
-    for (const el of items) {
-        const url = (el.getAttribute('data-source-url') || '').split('#')[0];
-        if (baseUri && url && url === baseUri) {
-            const idxAttr = el.getAttribute('data-source-index');
-            if (idxAttr != null) {
-                targetIndex = parseInt(idxAttr, 10);
-                break;
-            }
-        }
-    }
-
-    // Fallbacks: try matching in currentSources by uri, then by number
-    if (targetIndex === -1 && baseUri) {
+    if (baseUri) {
         targetIndex = currentSources.findIndex(s => (s.uri || '').split('#')[0] === baseUri);
     }
     if (targetIndex === -1) {
@@ -1295,120 +1685,120 @@ function highlightSpecificSource(sourceNumber, sources) {
     console.log(`Source ${sourceNumber} mapped to index:`, targetIndex, 'baseUri:', baseUri);
     if (targetIndex !== -1) {
         highlightSource(targetIndex);
-        return;
     }
+}
 
-    // Last resort: try to scroll by number-based id (may not exist if numbers differ)
-    console.log('Falling back to number-based highlight');
-    highlightSourceByNumber(sourceNumber);
+function escapeAttribute(value) {
+    return String(value).replace(/&/g, '&amp;').replace(/"/g, '&quot;').replace(/</g, '&lt;');
 }
 
-function updateSourcesPanelWithSources(sources) {
-    const sourcesList = document.getElementById('sourcesList');
-    const sourcesHeader = document.getElementById('sourcesHeader');
-    
-    if (!sources || sources.length === 0) {
-        sourcesList.innerHTML = '<div class="no-sources">No sources available</div>';
-        sourcesHeader.innerHTML = 'Sources';
-        return;
-    }
-    
-    sourcesHeader.innerHTML = `Sources (${sources.length})`;
-    
-    const sourcesHTML = sources.map((source, index) => {
-        let linkUrl = source.uri;
-        if (source.snippet && source.snippet.length > 5) {
-            linkUrl = `${source.uri}#:~:text=${encodeURIComponent(source.snippet)}`;
-        }
-        
-        return `
-            <div class="source-item" id="source-${source.number}" data-source-index="${index}" data-source-url="${linkUrl}" role="button" tabindex="0" aria-label="Source: ${source.title}" onclick="showSourceContextMenu(event, ${index}, '${linkUrl.replace(/'/g, "\\'")}')" oncontextmenu="showSourceContextMenu(event, ${index}, '${linkUrl.replace(/'/g, "\\'")}')" style="position: relative;">
-                <div class="source-header">
-                    <span class="source-number">[${source.number}]</span>
-                    <span class="source-title">${source.title || 'Document'}</span>
-                </div>
-                ${source.snippet ? `<div class="source-snippet">"${source.snippet}"</div>` : ''}
-                <div class="source-url">${source.uri}</div>
-            </div>
-        `;
-    }).join('');
-    
-    sourcesList.innerHTML = sourcesHTML;
+function renderMessageHtml(record) {
+    // Create footnote links to the message's own sources
+    return markdownToHtml(record.text).replace(/\[(\d+)\]/g, function(match, number) {
+        const sourceNum = parseInt(number, 10);
+        const source = record.sources.find(s => s.number === sourceNum);
+        const title = source ? `View source ${number}: ${source.title || source.uri}` : `Source ${number}`;
+        const dataUriAttr = source && source.uri ? ` data-source-uri="${escapeAttribute(source.uri)}"` : '';
+        return `<a href="#source-${number}" class="footnote-link" data-source-number="${sourceNum}" ` +
+            `data-source-index="${sourceNum - 1}"${dataUriAttr} title="${escapeAttribute(title)}">${match}</a>`;
+    });
 }
 
-function addMessage(text, sender, sources = [], msgId = null) {
+function initializeMessageRendering() {
     const messagesContainer = document.getElementById('chatMessages');
-    const messageDiv = document.createElement('div');
-    messageDiv.className = `message ${sender}-message`;
-    if (msgId) {
-        messageDiv.setAttribute('data-message-id', msgId);
-    }
-    
-    // Process and validate sources (allow entries without uri to still show in panel)
-    let perMessageSources = Array.isArray(sources) ? sources.filter(s => s) : [];
-    
-    // Store sources on the message element for later retrieval
-    try {
-        if (perMessageSources.length > 0) {
-            messageDiv.setAttribute('data-sources', JSON.stringify(perMessageSources));
+    if (!messagesContainer) return;
+
+    // One delegated handler for the footnote links of every message
+    messagesContainer.addEventListener('click', function(event) {
+        const link = event.target.closest('.footnote-link');
+        if (!link) return;
+        event.preventDefault();
+        const messageElement = link.closest('[data-message-id]');
+        if (messageElement) {
+            showMessageSources(messageElement.dataset.messageId, parseInt(link.dataset.sourceNumber, 10));
         }
-    } catch (e) {
-        console.warn('Failed to store sources on message:', e);
+    });
+
+    // Without IntersectionObserver every message simply stays rendered
+    if ('IntersectionObserver' in window) {
+        messageWindowObserver = new IntersectionObserver(onMessageVisibilityChange, {
+            root: messagesContainer,
+            rootMargin: '600px 0px'
+        });
     }
-    
-    console.log('Processing message:', text);
-    console.log('Sources received:', sources);
-    
-    let messageContent = text
-        .replace(/\*\*(.*?)\*\*/g, '<strong>$1</strong>')
-        .replace(/\[([^\]]+)\]\(([^)]+)\)/g, '<a href="$2" target="_blank" rel="noopener noreferrer">$1</a>')
-        .replace(/\n/g, '<br>');
-    
-    console.log('After markdown conversion:', messageContent);
-    
-    // Create footnote links with proper source references
-    messageContent = messageContent.replace(/\[(\d+)\]/g, function(match, number) {
-        const messageId = msgId || Date.now();
-        const sourceNum = parseInt(number);
-        // Find corresponding source
-        const source = perMessageSources.find(s => s.number === sourceNum);
-        let title = source ? `View source ${number}: ${source.title || source.uri}` : `Source ${number}`;
-        const dataUriAttr = source && source.uri ? ` data-source-uri="${source.uri.replace(/"/g, '&quot;')}"` : '';
-        return `<a href="#source-${number}" 
-            class="footnote-link" 
-            data-source-index="${sourceNum - 1}"
-            ${dataUriAttr}
-            onclick="showMessageSources('${messageId}', ${number}); return false;" 
-            title="${title}">${match}</a>`;
+}
+
+function onMessageVisibilityChange(entries) {
+    entries.forEach(entry => {
+        const record = messageStore.get(Number(entry.target.dataset.messageId));
+        if (!record) return;
+        if (entry.isIntersecting) {
+            hydrateMessage(record);
+        } else if (entry.boundingClientRect.height > 0) {
+            // A zero height means the popup is hidden; keep the content until it can be measured
+            dehydrateMessage(record, entry.boundingClientRect.height);
+        }
     });
-    
-    console.log('Final message content:', messageContent);
-    messageDiv.innerHTML = messageContent;
-    messagesContainer.appendChild(messageDiv);
+}
+
+function dehydrateMessage(record, height) {
+    if (record.dehydrated) return;
+    // Keep the measured height so the scroll position doesn't move
+    record.element.style.height = `${height}px`;
+    record.element.classList.add('dehydrated');
+    record.element.textContent = '';
+    record.dehydrated = true;
+}
+
+function hydrateMessage(record) {
+    if (!record.dehydrated) return;
+    record.element.innerHTML = record.html;
+    record.element.classList.remove('dehydrated');
+    record.element.style.height = '';
+    record.dehydrated = false;
+}
+
+function windowOlderMessages() {
+    if (!messageWindowObserver) return;
+    // Messages leaving the render window are handed to the observer, which empties them while
+    // they are off-screen and rebuilds them from their record when scrolled back into view
+    while (messageOrder.length - windowedMessageCount > MESSAGE_RENDER_WINDOW) {
+        messageWindowObserver.observe(messageOrder[windowedMessageCount].element);
+        windowedMessageCount++;
+    }
+}
+
+function addMessage(text, sender, sources = [], msgId = null) {
+    const messagesContainer = document.getElementById('chatMessages');
+    const id = msgId || ++messageId;
+    
+    // The record is the source of truth: the element can be emptied and rebuilt from it, and
+    // footnote links read their sources from it
+    const record = {
+        id,
+        sender,
+        text: text || '',
+        sources: Array.isArray(sources) ? sources.filter(s => s) : [],
+        element: document.createElement('div'),
+        dehydrated: false
+    };
+    record.html = renderMessageHtml(record);
+    record.element.className = `message ${sender}-message`;
+    record.element.dataset.messageId = id;
+    record.element.innerHTML = record.html;
+    messageStore.set(id, record);
+    messageOrder.push(record);
+    
+    messagesContainer.appendChild(record.element);
     messagesContainer.scrollTop = messagesContainer.scrollHeight;
     
     // Update scroll button visibility
     updateScrollButton();
+    windowOlderMessages();
     
     // If this is a bot message with sources, ensure the sources panel is up to date
-    if (sender === 'bot' && perMessageSources.length > 0) {
-        updateSourcesPanel(perMessageSources);
-    }
-
-    // Persist or compute sources for this bot message and update panel if needed
-    if (sender === 'bot') {
-        try {
-            if (!perMessageSources || perMessageSources.length === 0) {
-                perMessageSources = extractSourcesFromMessageHtml(messageDiv.innerHTML);
-            }
-            if (perMessageSources && perMessageSources.length > 0) {
-                try { messageDiv.setAttribute('data-sources', JSON.stringify(perMessageSources)); } catch {}
-                // If backend didn't already update the panel, update with extracted ones
-                updateSourcesPanel(perMessageSources);
-            }
-        } catch (e) {
-            console.warn('Auto-extraction of sources failed:', e);
-        }
+    if (sender === 'bot' && record.sources.length > 0) {
+        updateSourcesPanel(record.sources);
     }
 }
 
@@ -1423,156 +1813,3 @@ function showTyping(show) {
     }
     messagesContainer.scrollTop = messagesContainer.scrollHeight;
 }
-
-// Helper: extract sources array from a bot message's HTML content
-function extractSourcesFromMessageHtml(messageHtml) {
-    try {
-        // Build a DOM we can query for anchors (to keep href)
-        const container = document.createElement('div');
-        container.innerHTML = messageHtml;
-
-        // Try to locate the Sources section by finding a <strong>Sources:</strong> marker
-        let sourcesStartNode = null;
-        const strongs = container.querySelectorAll('strong');
-        strongs.forEach(s => {
-            const text = (s.textContent || '').trim().toLowerCase();
-            if (!sourcesStartNode && text.startsWith('sources')) {
-                sourcesStartNode = s;
-            }
-        });
-
-        // Take the HTML after the marker; otherwise use entire container
-        let htmlAfterMarker = '';
-        if (sourcesStartNode) {
-            // Collect following siblings as HTML
-            let node = sourcesStartNode.nextSibling;
-            while (node) {
-                htmlAfterMarker += node.outerHTML || node.textContent || '';
-                node = node.nextSibling;
-            }
-        } else {
-            htmlAfterMarker = container.innerHTML;
-        }
-
-        // Split by <br> boundaries to approximate original lines
-        const lineHtmls = htmlAfterMarker
-            .split(/<br\s*\/?\s*>/i)
-            .map(s => s.trim())
-            .filter(Boolean);
-
-        const extractedSources = [];
-        lineHtmls.forEach(lineHtml => {
-            // Create a per-line DOM to extract text and the first anchor href
-            const lineDiv = document.createElement('div');
-            lineDiv.innerHTML = lineHtml;
-            const lineText = (lineDiv.textContent || '').trim();
-
-            // Must start with [n]
-            const numMatch = lineText.match(/^\[(\d+)\]/);
-            if (!numMatch) return;
-            const sourceNum = parseInt(numMatch[1]);
-
-            // Parse both formats:
-            // New format: [1] The title of the page — URL
-            // Old format: [1] "quote text" — URL
-            const afterNumber = lineText.replace(/^\[\d+\]\s*/, '');
-            
-            // Check for the new title format first
-            const titleUrlMatch = afterNumber.match(/^(.+?)\s*—\s*(.+)$/);
-            let snippet = '';
-            let url = '';
-            let title = '';
-            
-            if (titleUrlMatch) {
-                // New format: [1] Title — URL
-                title = titleUrlMatch[1].trim();
-                url = titleUrlMatch[2].trim();
-                
-                // Clean up URLs - remove line number fragments like #L23-L27
-                if (url.includes('#L')) {
-                    url = url.split('#L')[0];
-                }
-                
-                // Remove quotes if present (for old format compatibility)
-                if (title.startsWith('"') && title.endsWith('"')) {
-                    snippet = title.slice(1, -1); // Use quoted text as snippet
-                    title = ''; // Will be generated below
-                } else {
-                    snippet = title; // Use title as snippet for now
-                }
-            } else {
-                // Fallback: entire text after [n] is the snippet
-                snippet = afterNumber.trim();
-                
-                // Look for any anchor with href (not just http)
-                const anchor = lineDiv.querySelector('a[href]');
-                url = anchor ? anchor.getAttribute('href') : '';
-                
-                // If it's an internal anchor, look for markdown links in the text
-                if (!url || url.startsWith('#')) {
-                    // Look for markdown link pattern [text](url)
-                    const markdownMatch = lineText.match(/\[([^\]]+)\]\(([^)]+)\)/);
-                    if (markdownMatch) {
-                        url = markdownMatch[2];
-                    }
-                }
-            }
-            
-            // Create a meaningful title based on the snippet content (only if we don't have one)
-            if (!title && snippet) {
-                const lowerSnippet = snippet.toLowerCase();
-                if (lowerSnippet.includes('openccc')) {
-                    title = 'OpenCCC Documentation';
-                } else if (lowerSnippet.includes('cccapply')) {
-                    title = 'CCCApply Information';
-                } else if (lowerSnippet.includes('mypath')) {
-                    title = 'CCC MyPath Documentation';
-                } else if (lowerSnippet.includes('cccid')) {
-                    title = 'CCCID System Documentation';
-                } else if (lowerSnippet.includes('career coach')) {
-                    title = 'Career Coach Information';
-                } else {
-                    // Use first few words of snippet as title
-                    const words = snippet.split(' ').slice(0, 4).join(' ');
-                    title = words.length > 20 ? words + '...' : words;
-                }
-            }
-            
-            // Final fallback for title
-            if (!title) {
-                title = `Source ${sourceNum}`;
-            }
-
-            // Only create fallback URLs if we have no URL at all
-            if (!url && snippet) {
-                console.warn('No URL found for source, using fallback:', snippet.substring(0, 50));
-                // Try to detect the system and create a reasonable fallback
-                const baseUrl = 'https://docs.cccnext.net';
-                const lowerSnippet = snippet.toLowerCase();
-                if (lowerSnippet.includes('openccc')) {
-                    url = `${baseUrl}/openccc`;
-                } else if (lowerSnippet.includes('cccapply')) {
-                    url = `${baseUrl}/cccapply`;
-                } else if (lowerSnippet.includes('mypath')) {
-                    url = `${baseUrl}/mypath`;
-                } else if (lowerSnippet.includes('cccid')) {
-                    url = `${baseUrl}/identity`;
-                } else {
-                    url = `${baseUrl}/documentation`;
-                }
-            }
-
-            extractedSources.push({
-                number: sourceNum,
-                snippet,
-                uri: url,
-                title: title
-            });
-        });
-
-        return extractedSources;
-    } catch (e) {
-        console.warn('Failed to parse sources from message HTML:', e);
-        return [];
-    }
-}
@@ -0,0 +1,76 @@
+"""Production server settings for chatbot_backend (read by gunicorn from the working directory).
+
+    gunicorn chatbot_backend:app                    # uses this file automatically
+    kill -HUP <master pid>                          # graceful worker restart (config re-read)
+    kill -USR2 <master pid>, then -QUIT the old one # zero-downtime code upgrade
+
+The app is imported once in the master and workers are forked from it, so the Flask
+app, PyMuPDF, the langdetect profiles, boto3's service models and the local FAQ index
+are shared copy-on-write instead of being loaded again by every worker. Anything holding
+a socket (boto3 clients) is dropped after fork and rebuilt per worker on first use.
+Because the code is preloaded, HUP does not pick up code changes; use the USR2 upgrade.
+
+Answer caches are per worker. /admin/warm-cache invalidates all of them via
+CACHE_GENERATION_FILE (each worker notices within CACHE_GENERATION_CHECK_SECONDS), but
+its replay, like the batch endpoint's answers, only fills the worker that served it;
+the others refill on demand.
+"""
+import importlib.util
+import multiprocessing
+import os
+import time
+
+from ccc_core import config as ccc_config  # "config" is itself a gunicorn setting
+
+bind = os.getenv('BIND', '0.0.0.0:5000')
+
+# Requests mostly wait on Bedrock, so a few processes with several threads each go furthest:
+# processes scale the CPU-bound parts (language detection, PDF rendering), threads the waiting
+workers = int(os.getenv('WEB_WORKERS', multiprocessing.cpu_count()))
+threads = int(os.getenv('WEB_THREADS', '8'))
+worker_class = 'gthread'
+preload_app = True
+
+# A request may wait for every Bedrock attempt to time out; leave room for translation on top
+timeout = int(os.getenv('WEB_TIMEOUT', ccc_config.BEDROCK_MAX_ATTEMPTS * (ccc_config.BEDROCK_CONNECT_TIMEOUT + ccc_config.BEDROCK_READ_TIMEOUT) + 30))
+graceful_timeout = timeout  # let in-flight answers finish on reload/shutdown
+keepalive = 5
+
+# Recycle workers now and then so slow leaks (PDF rendering, translator sessions) can't accumulate
+max_requests = int(os.getenv('WEB_MAX_REQUESTS', '2000'))
+max_requests_jitter = max_requests // 10
+
+accesslog = os.getenv('WEB_ACCESS_LOG', '-') or None  # empty disables the access log
+errorlog = '-'
+
+
+def preload_shared_state():
+    """Load what workers would otherwise each load lazily, so they share it after fork"""
+    started = time.time()
+    from ccc_core import clients, query_engine, translation
+
+    if importlib.util.find_spec('fitz') is not None:
+        importlib.import_module('fitz')  # PyMuPDF, otherwise imported on the first PDF
+    else:
+        print("Preload skipped PyMuPDF (not installed)")
+    try:
+        translation.load_language_profiles()
+    except ImportError as e:
+        print(f"Preload skipped optional module: {e}")
+
+    # Building the clients loads the service models into boto3's shared session
+    for service_name in ('bedrock-runtime', 'bedrock-agent-runtime'):
+        clients.get_client(service_name)
+    query_engine.get_local_index()
+    print(f"Preloaded shared state in {time.time() - started:.1f}s")
+
+
+def when_ready(server):
+    preload_shared_state()
+
+
+def post_fork(server, worker):
+    # Pooled connections must not be shared between processes
+    from ccc_core import clients
+
+    clients.reset_clients()
@@ -0,0 +1,145 @@
+"""Companion Lambda that follows an ingestion job and warms the chatbot afterwards.
+
+kb_sync_lambda invokes this function asynchronously with the job it started. The
+monitor polls get_ingestion_job until the job finishes, re-invoking itself if the
+job outlives one Lambda run. It records duration and document statistics, then
+asks the backend to warm its answer cache by replaying the most frequent questions
+from the request log. Finally it plans a sync again: triggers coalesced while the job
+ran left their changes in the manifest diff, and this is what starts their job.
+"""
+from datetime import datetime
+import json
+import os
+import urllib.request
+
+import boto3
+
+import kb_sync_planner
+
+# Give up on a job after this many chained monitor invocations
+MONITOR_MAX_INVOCATIONS = int(os.environ.get("MONITOR_MAX_INVOCATIONS", "8"))
+INGESTION_HISTORY_S3_URI = os.environ.get("INGESTION_HISTORY_S3_URI")
+INGESTION_HISTORY_LIMIT = 200
+CACHE_WARM_URL = os.environ.get("CACHE_WARM_URL")  # e.g. https://chat.example.edu/admin/warm-cache
+CACHE_WARM_TOKEN = os.environ.get("CACHE_WARM_TOKEN")
+CACHE_WARM_TOP_N = int(os.environ.get("CACHE_WARM_TOP_N", "50"))
+# Same manifest as the sync Lambda; unset disables planning after a job
+SYNC_MANIFEST_S3_URI = os.environ.get("SYNC_MANIFEST_S3_URI")
+
+
+def start_monitor(job, function_name, lambda_client=None):
+    """Asynchronously invoke the monitor Lambda for a freshly started job"""
+    lambda_client = lambda_client or boto3.client("lambda")
+    lambda_client.invoke(
+        FunctionName=function_name,
+        InvocationType="Event",
+        Payload=json.dumps({
+            "knowledgeBaseId": job["knowledgeBaseId"],
+            "dataSourceId": job["dataSourceId"],
+            "ingestionJobId": job["ingestionJobId"],
+            "invocation": 1
+        }).encode("utf-8")
+    )
+
+
+def record_job(job, metrics, s3_client=None):
+    """Append the finished job's stats to the ingestion history in S3"""
+    entry = {
+        "ingestionJobId": job["ingestionJobId"],
+        "status": job["status"],
+        "startedAt": job["startedAt"].isoformat() if job.get("startedAt") else None,
+        "updatedAt": job["updatedAt"].isoformat() if job.get("updatedAt") else None,
+        "failureReasons": job.get("failureReasons", []),
+        **metrics
+    }
+    print(f"Ingestion job finished: {json.dumps(entry)}")
+    if not INGESTION_HISTORY_S3_URI:
+        return entry
+
+    s3_client = s3_client or boto3.client("s3")
+    bucket, key = INGESTION_HISTORY_S3_URI[5:].split("/", 1)
+    try:
+        history = json.loads(s3_client.get_object(Bucket=bucket, Key=key)["Body"].read())
+    except Exception:
+        history = []
+    history = (history + [entry])[-INGESTION_HISTORY_LIMIT:]
+    s3_client.put_object(Bucket=bucket, Key=key, Body=json.dumps(history).encode("utf-8"), ContentType="application/json")
+    return entry
+
+
+def warm_backend_cache(top_n=CACHE_WARM_TOP_N):
+    """Ask the chatbot backend to replay its most frequent questions"""
+    if not CACHE_WARM_URL or not CACHE_WARM_TOKEN:
+        print("Cache warm skipped: CACHE_WARM_URL/CACHE_WARM_TOKEN not configured")
+        return None
+
+    request = urllib.request.Request(
+        CACHE_WARM_URL,
+        data=json.dumps({"top_n": top_n}).encode("utf-8"),
+        headers={"Content-Type": "application/json", "X-Cache-Warm-Token": CACHE_WARM_TOKEN},
+        method="POST"
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            result = json.loads(response.read())
+            print(f"Cache warm requested: {result}")
+            return result
+    except Exception as e:
+        print(f"Cache warm request failed: {e}")
+        return None
+
+
+def start_pending_sync(client, knowledge_base_id, data_source_id, function_name):
+    """Start a job for changes whose triggers were coalesced while the last job ran"""
+    if not SYNC_MANIFEST_S3_URI:
+        return None
+    bucket, prefix = kb_sync_planner.get_data_source_location(client, knowledge_base_id, data_source_id)
+    plan = kb_sync_planner.plan_and_start_sync(
+        client, knowledge_base_id, data_source_id, bucket, prefix, SYNC_MANIFEST_S3_URI
+    )
+    if plan["action"] == "started":
+        print(f"Started ingestion job {plan['job']['ingestionJobId']} for changes made during the last one")
+        kb_sync_planner.refresh_local_index(client, knowledge_base_id, data_source_id, listed=plan["objects"])
+        start_monitor(plan["job"], function_name)
+    return plan
+
+
+def lambda_handler(event, context):
+    print(f"Ingestion monitor triggered at {datetime.utcnow().isoformat()}: {json.dumps(event)}")
+
+    knowledge_base_id = event["knowledgeBaseId"]
+    data_source_id = event["dataSourceId"]
+    job_id = event["ingestionJobId"]
+    invocation = event.get("invocation", 1)
+
+    client = boto3.client("bedrock-agent")
+    job = kb_sync_planner.wait_for_ingestion_job(client, knowledge_base_id, data_source_id, job_id, context)
+
+    if job["status"] not in kb_sync_planner.TERMINAL_JOB_STATUSES:
+        if invocation >= MONITOR_MAX_INVOCATIONS:
+            print(f"Giving up on ingestion job {job_id} after {invocation} monitor invocations")
+            return {"statusCode": 200, "body": f"Ingestion job {job_id} still {job['status']}"}
+        # Keep following the job in a fresh invocation
+        boto3.client("lambda").invoke(
+            FunctionName=context.function_name,
+            InvocationType="Event",
+            Payload=json.dumps(dict(event, invocation=invocation + 1)).encode("utf-8")
+        )
+        return {"statusCode": 200, "body": f"Ingestion job {job_id} still {job['status']}; monitor re-invoked"}
+
+    metrics = kb_sync_planner.job_metrics(job)
+    kb_sync_planner.emit_metrics(knowledge_base_id, metrics, units={"JobDurationSeconds": "Seconds"})
+    record_job(job, metrics)
+
+    if job["status"] == "COMPLETE":
+        warm_backend_cache()
+
+    try:
+        start_pending_sync(client, knowledge_base_id, data_source_id, context.function_name)
+    except Exception as e:
+        print(f"Planning a sync after job {job_id} failed: {e}")
+
+    return {
+        "statusCode": 200,
+        "body": f"Ingestion job {job_id} finished: {job['status']}"
+    }
@@ -2,6 +2,15 @@ from datetime import datetime
 import boto3
 import os
 
+import kb_ingestion_monitor
+import kb_sync_planner
+
+# Manifest of source-document ETags; when unset every trigger runs a full ingestion job
+SYNC_MANIFEST_S3_URI = os.environ.get("SYNC_MANIFEST_S3_URI")
+SYNC_WAIT_FOR_COMPLETION = os.environ.get("SYNC_WAIT_FOR_COMPLETION", "false").lower() == "true"
+# Companion Lambda (kb_ingestion_monitor) that follows the job and warms the backend cache
+INGESTION_MONITOR_FUNCTION = os.environ.get("INGESTION_MONITOR_FUNCTION")
+
 def lambda_handler(event, context):
     print(f"Lambda triggered at {datetime.utcnow().isoformat()}")
 
@@ -9,16 +18,46 @@ def lambda_handler(event, context):
     data_source_id = os.environ["DATA_SOURCE_ID"]
 
     client = boto3.client("bedrock-agent")
+    listed = None
 
-    response = client.start_ingestion_job(
-        knowledgeBaseId=knowledge_base_id,
-        dataSourceId=data_source_id,
-        clientToken="sync-" + context.aws_request_id
-    )
+    if SYNC_MANIFEST_S3_URI:
+        # Only ingest when source documents actually changed, coalescing rapid triggers
+        bucket, prefix = kb_sync_planner.get_data_source_location(client, knowledge_base_id, data_source_id)
+        plan = kb_sync_planner.plan_and_start_sync(
+            client, knowledge_base_id, data_source_id, bucket, prefix, SYNC_MANIFEST_S3_URI
+        )
+        if plan["action"] != "started":
+            print(f"Ingestion job not started: {plan['action']}")
+            return {
+                "statusCode": 200,
+                "body": f"Ingestion job not started: {plan['action']}"
+            }
+        job = plan["job"]
+        listed = plan["objects"]
+    else:
+        response = client.start_ingestion_job(
+            knowledgeBaseId=knowledge_base_id,
+            dataSourceId=data_source_id,
+            clientToken="sync-" + context.aws_request_id
+        )
+        job = response["ingestionJob"]
 
-    job_id = response["ingestionJob"]["ingestionJobId"]
+    job_id = job["ingestionJobId"]
     print(f"Started ingestion job: {job_id}")
 
+    kb_sync_planner.refresh_local_index(client, knowledge_base_id, data_source_id, listed=listed)
+
+    if INGESTION_MONITOR_FUNCTION:
+        try:
+            kb_ingestion_monitor.start_monitor(job, INGESTION_MONITOR_FUNCTION)
+        except Exception as e:
+            print(f"Failed to start ingestion monitor: {e}")
+
+    if SYNC_WAIT_FOR_COMPLETION:
+        job = kb_sync_planner.wait_for_ingestion_job(client, knowledge_base_id, data_source_id, job_id, context)
+        kb_sync_planner.emit_metrics(knowledge_base_id, kb_sync_planner.job_metrics(job),
+                                     units={"JobDurationSeconds": "Seconds"})
+
     return {
         "statusCode": 200,
         "body": f"Ingestion job started: {job_id}"
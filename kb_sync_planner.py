@@ -0,0 +1,244 @@
+"""Incremental knowledge base sync planning.
+
+Keeps a manifest of the data source's object ETags so an ingestion job is only
+started when documents were actually added, modified, or deleted. Rapid triggers
+(e.g. a burst of S3 events from a bulk upload) are coalesced: while a job is running
+or one was started within SYNC_COALESCE_SECONDS, the trigger is skipped and the
+changes stay pending in the manifest diff. kb_ingestion_monitor plans again once the
+job finishes, so changes from the end of a burst are not left waiting for another upload.
+"""
+import hashlib
+import json
+import os
+import time
+
+import boto3
+
+SYNC_COALESCE_SECONDS = int(os.environ.get("SYNC_COALESCE_SECONDS", "120"))
+SYNC_POLL_SECONDS = 10
+# Stop polling when the Lambda has less than this much time left
+SYNC_POLL_SAFETY_MS = 15000
+METRICS_NAMESPACE = "CCCApply/KnowledgeBaseSync"
+
+ACTIVE_JOB_STATUSES = ["STARTING", "IN_PROGRESS"]
+TERMINAL_JOB_STATUSES = {"COMPLETE", "FAILED", "STOPPED"}
+
+
+def get_data_source_location(client, knowledge_base_id, data_source_id):
+    """Return (bucket, prefix) of the S3 data source the knowledge base ingests"""
+    if os.environ.get("KB_SOURCE_BUCKET"):
+        return os.environ["KB_SOURCE_BUCKET"], os.environ.get("KB_SOURCE_PREFIX", "")
+
+    data_source = client.get_data_source(knowledgeBaseId=knowledge_base_id, dataSourceId=data_source_id)["dataSource"]
+    s3_configuration = data_source["dataSourceConfiguration"]["s3Configuration"]
+    bucket = s3_configuration["bucketArn"].split(":::")[-1]
+    prefixes = s3_configuration.get("inclusionPrefixes") or [""]
+    return bucket, prefixes[0]
+
+
+def refresh_local_index(client, knowledge_base_id, data_source_id, listed=None):
+    """Incrementally rebuild the local FAQ index snapshot from the same source documents"""
+    index_location = os.environ.get("LOCAL_INDEX_S3_URI")
+    if not index_location:
+        return None
+
+    try:
+        from ccc_core import local_index
+
+        bucket, prefix = get_data_source_location(client, knowledge_base_id, data_source_id)
+        embed_fn = None
+        if os.environ.get("LOCAL_INDEX_EMBEDDINGS", "false").lower() == "true":
+            embed_fn = local_index.titan_embedder()
+        return local_index.refresh_index_snapshot(bucket, prefix, index_location, embed_fn=embed_fn, listed=listed)
+    except Exception as e:
+        # The local index is an optimization; never fail the ingestion trigger because of it
+        print(f"Local index refresh failed: {e}")
+        return None
+
+
+def list_source_objects(bucket, prefix="", s3_client=None):
+    """Return {key: etag} for every object under the data source prefix"""
+    s3_client = s3_client or boto3.client("s3")
+    objects = {}
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            objects[obj["Key"]] = obj["ETag"].strip('"')
+    return objects
+
+
+def compute_changes(previous_objects, current_objects):
+    """Diff two {key: etag} maps into added/modified/deleted key lists"""
+    added = sorted(key for key in current_objects if key not in previous_objects)
+    deleted = sorted(key for key in previous_objects if key not in current_objects)
+    modified = sorted(
+        key for key, etag in current_objects.items()
+        if key in previous_objects and previous_objects[key] != etag
+    )
+    return {"added": added, "modified": modified, "deleted": deleted}
+
+
+def count_changes(changes):
+    return len(changes["added"]) + len(changes["modified"]) + len(changes["deleted"])
+
+
+def load_manifest(location, s3_client=None):
+    """Load the sync manifest from an s3:// URI (empty manifest if missing)"""
+    try:
+        bucket, key = location[5:].split("/", 1)
+        body = (s3_client or boto3.client("s3")).get_object(Bucket=bucket, Key=key)["Body"].read()
+        return json.loads(body)
+    except Exception as e:
+        print(f"No sync manifest at {location}, starting fresh: {e}")
+        return {"objects": {}, "last_job": None}
+
+
+def save_manifest(location, manifest, s3_client=None):
+    bucket, key = location[5:].split("/", 1)
+    manifest["updated_at"] = time.time()
+    (s3_client or boto3.client("s3")).put_object(
+        Bucket=bucket, Key=key, Body=json.dumps(manifest).encode("utf-8"), ContentType="application/json"
+    )
+
+
+def find_active_job(client, knowledge_base_id, data_source_id):
+    """Return the summary of a STARTING/IN_PROGRESS ingestion job, if any"""
+    response = client.list_ingestion_jobs(
+        knowledgeBaseId=knowledge_base_id,
+        dataSourceId=data_source_id,
+        filters=[{"attribute": "STATUS", "operator": "EQ", "values": ACTIVE_JOB_STATUSES}],
+        maxResults=1
+    )
+    summaries = response.get("ingestionJobSummaries", [])
+    return summaries[0] if summaries else None
+
+
+def job_finished(client, knowledge_base_id, data_source_id, job_id):
+    """True when the job is known to have reached a terminal status"""
+    try:
+        job = client.get_ingestion_job(
+            knowledgeBaseId=knowledge_base_id,
+            dataSourceId=data_source_id,
+            ingestionJobId=job_id
+        )["ingestionJob"]
+    except Exception as e:
+        print(f"Could not get ingestion job {job_id}: {e}")
+        return False
+    return job["status"] in TERMINAL_JOB_STATUSES
+
+
+def change_set_token(changes):
+    """Idempotency token derived from the change set, so duplicate triggers reuse one job"""
+    digest = hashlib.sha256(json.dumps(changes, sort_keys=True).encode("utf-8")).hexdigest()
+    return "sync-" + digest[:40]
+
+
+def emit_metrics(knowledge_base_id, metrics, units=None):
+    """Log metrics in CloudWatch Embedded Metric Format (no extra dependency needed)"""
+    units = units or {}
+    print(json.dumps({
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": METRICS_NAMESPACE,
+                "Dimensions": [["KnowledgeBaseId"]],
+                "Metrics": [{"Name": name, "Unit": units.get(name, "Count")} for name in metrics]
+            }]
+        },
+        "KnowledgeBaseId": knowledge_base_id,
+        **metrics
+    }))
+
+
+def wait_for_ingestion_job(client, knowledge_base_id, data_source_id, job_id, context=None, poll_seconds=SYNC_POLL_SECONDS):
+    """Poll get_ingestion_job until it finishes or the Lambda is about to time out"""
+    while True:
+        job = client.get_ingestion_job(
+            knowledgeBaseId=knowledge_base_id,
+            dataSourceId=data_source_id,
+            ingestionJobId=job_id
+        )["ingestionJob"]
+        status = job["status"]
+        print(f"Ingestion job {job_id}: {status}")
+        if status in TERMINAL_JOB_STATUSES:
+            return job
+        if context is not None and context.get_remaining_time_in_millis() < SYNC_POLL_SAFETY_MS + poll_seconds * 1000:
+            print(f"Stopped polling ingestion job {job_id}; Lambda time nearly exhausted")
+            return job
+        time.sleep(poll_seconds)
+
+
+def job_metrics(job):
+    """Flatten an ingestion job's status and statistics into metric values"""
+    statistics = job.get("statistics", {})
+    metrics = {
+        "JobComplete": 1 if job["status"] == "COMPLETE" else 0,
+        "JobFailed": 1 if job["status"] == "FAILED" else 0,
+        "DocumentsScanned": statistics.get("numberOfDocumentsScanned", 0),
+        "DocumentsIndexed": statistics.get("numberOfNewDocumentsIndexed", 0) + statistics.get("numberOfModifiedDocumentsIndexed", 0),
+        "DocumentsDeleted": statistics.get("numberOfDocumentsDeleted", 0),
+        "DocumentsFailed": statistics.get("numberOfDocumentsFailed", 0)
+    }
+    started_at, updated_at = job.get("startedAt"), job.get("updatedAt")
+    if started_at and updated_at and job["status"] in TERMINAL_JOB_STATUSES:
+        metrics["JobDurationSeconds"] = round((updated_at - started_at).total_seconds(), 1)
+    return metrics
+
+
+def plan_and_start_sync(client, knowledge_base_id, data_source_id, bucket, prefix, manifest_location, s3_client=None):
+    """Start an ingestion job only if the data source changed since the last job.
+
+    Returns a dict with 'action' ('started', 'skipped_no_changes', 'coalesced'), the
+    change set, the current object listing, and the job (when one was started).
+    """
+    s3_client = s3_client or boto3.client("s3")
+    manifest = load_manifest(manifest_location, s3_client)
+    current_objects = list_source_objects(bucket, prefix, s3_client)
+    changes = compute_changes(manifest.get("objects", {}), current_objects)
+    changed_count = count_changes(changes)
+    print(f"Sync plan: {len(changes['added'])} added, {len(changes['modified'])} modified, {len(changes['deleted'])} deleted")
+
+    result = {"action": None, "changes": changes, "objects": current_objects, "job": None}
+
+    if changed_count == 0:
+        result["action"] = "skipped_no_changes"
+    else:
+        active_job = find_active_job(client, knowledge_base_id, data_source_id)
+        last_job = manifest.get("last_job") or {}
+        recently_started = time.time() - last_job.get("started_at", 0) < SYNC_COALESCE_SECONDS
+        if recently_started and not active_job:
+            # The window covers a job not listed as active yet, not one that already finished
+            recently_started = not job_finished(client, knowledge_base_id, data_source_id, last_job["id"])
+
+        if active_job or recently_started:
+            # Leave the manifest untouched so these changes remain in the next trigger's diff
+            reason = f"job {active_job['ingestionJobId']} is {active_job['status']}" if active_job else "a job started recently"
+            print(f"Coalescing trigger: {reason}")
+            result["action"] = "coalesced"
+        else:
+            try:
+                response = client.start_ingestion_job(
+                    knowledgeBaseId=knowledge_base_id,
+                    dataSourceId=data_source_id,
+                    clientToken=change_set_token(changes),
+                    description=f"Incremental sync: {changed_count} changed documents"
+                )
+            except client.exceptions.ConflictException as e:
+                # Another trigger won the race and already has a job running
+                print(f"Coalescing trigger after conflict: {e}")
+                result["action"] = "coalesced"
+            else:
+                job = response["ingestionJob"]
+                manifest["objects"] = current_objects
+                manifest["last_job"] = {"id": job["ingestionJobId"], "started_at": time.time(), "changed": changed_count}
+                save_manifest(manifest_location, manifest, s3_client)
+                result["action"] = "started"
+                result["job"] = job
+
+    emit_metrics(knowledge_base_id, {
+        "ChangedDocuments": changed_count,
+        "IngestionJobStarted": 1 if result["action"] == "started" else 0,
+        "TriggersSkipped": 1 if result["action"] == "skipped_no_changes" else 0,
+        "TriggersCoalesced": 1 if result["action"] == "coalesced" else 0
+    })
+    return result
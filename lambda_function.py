@@ -1,146 +1,132 @@
+import time
+
+_INIT_STARTED = time.perf_counter()
+
 import json
-import boto3
-
-def extract_key_phrase(text):
-    """Extract a key phrase from the content for deep linking"""
-    if not text:
-        return ""
-    
-    # Look for headings (lines starting with #)
-    lines = text.split('\n')
-    for line in lines:
-        line = line.strip()
-        if line.startswith('#') and len(line) > 3:
-            return line.replace('#', '').strip()[:50]
-    
-    # Look for sentences with key terms
-    sentences = text.split('. ')
-    for sentence in sentences[:3]:  # Check first 3 sentences
-        if len(sentence.strip()) > 20 and len(sentence.strip()) < 100:
-            return sentence.strip()[:50]
-    
-    # Fallback to first 50 characters
-    return text.strip()[:50]
-
-def query_knowledge_base(question):
-    client = boto3.client("bedrock-agent-runtime", region_name="us-west-2")
-    
+import os
+
+# Leave headroom under the 30s function timeout; Lambda serves one request at a time
+os.environ.setdefault('BEDROCK_READ_TIMEOUT', '25')
+os.environ.setdefault('BEDROCK_MAX_POOL_CONNECTIONS', '4')
+# The Lambda has always answered from its own knowledge base, not the Flask server's default
+os.environ.setdefault('KNOWLEDGE_BASE_ID', 'GWVQU3YPXK')
+
+from ccc_core import clients, config, query_engine
+
+# Created once per execution environment and reused by every warm invocation
+bedrock_agent_runtime = clients.get_client('bedrock-agent-runtime')
+
+CORS_PREFLIGHT_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Headers': 'Content-Type',
+    'Access-Control-Allow-Methods': 'POST, OPTIONS'
+}
+JSON_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Content-Type': 'application/json'
+}
+
+def is_warmup_event(event):
+    """Scheduled/provisioned-concurrency warmers send a marker instead of an API Gateway request"""
+    return bool(event.get('warmup')) or event.get('source') in ('serverless-plugin-warmup', 'aws.events')
+
+def warm_connection_pool():
+    """Open (and authenticate) a pooled HTTPS connection to Bedrock with a minimal retrieve call"""
+    started = time.perf_counter()
     try:
-        response = client.retrieve_and_generate(
-            input={
-                'text': question
-            },
-            retrieveAndGenerateConfiguration={
-                'type': 'KNOWLEDGE_BASE',
-                'knowledgeBaseConfiguration': {
-                    'knowledgeBaseId': 'GWVQU3YPXK',
-                    'modelArn': 'arn:aws:bedrock:us-west-2::foundation-model/anthropic.claude-3-5-sonnet-20241022-v2:0'
-                }
-            }
+        bedrock_agent_runtime.retrieve(
+            knowledgeBaseId=config.KNOWLEDGE_BASE_ID,
+            retrievalQuery={'text': 'CCCApply'},
+            retrievalConfiguration={'vectorSearchConfiguration': {'numberOfResults': 1}}
         )
-        
-        answer = response['output']['text']
-        sources = []
-        
-        # Extract citations with proper footnote formatting
-        if 'citations' in response:
-            source_counter = 1
-            for citation in response['citations']:
-                for reference in citation.get('retrievedReferences', []):
-                    location = reference.get('location', {})
-                    uri = None
-                    title = None
-                    
-                    # Handle different location types
-                    if 'webLocation' in location:
-                        uri = location['webLocation']['url']
-                        title = reference.get('metadata', {}).get('title') or uri.split('/')[-1] if uri else 'Web Document'
-                    elif 's3Location' in location:
-                        uri = location['s3Location']['uri']
-                        title = reference.get('metadata', {}).get('title') or uri.split('/')[-1] if uri else 'Document'
-                    
-                    if uri:
-                        # Extract a snippet of the relevant text for deep linking
-                        content_text = reference.get('content', {}).get('text', '')
-                        snippet = extract_key_phrase(content_text)
-                        
-                        sources.append({
-                            'number': source_counter,
-                            'title': title,
-                            'uri': uri,
-                            'snippet': snippet
-                        })
-                        source_counter += 1
-        
-        return {
-            'answer': answer,
-            'sources': sources
-        }
-        
+        warmed = True
     except Exception as e:
-        return {
-            'answer': f"I'm having trouble accessing the knowledge base right now. Error: {str(e)}",
-            'sources': []
-        }
+        print(f"Connection warmup failed: {e}")
+        warmed = False
+    return warmed, round((time.perf_counter() - started) * 1000, 1)
 
-def lambda_handler(event, context):
+def handle_request(event):
     # Handle CORS preflight requests
     if event.get('httpMethod') == 'OPTIONS':
         return {
             'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Headers': 'Content-Type',
-                'Access-Control-Allow-Methods': 'POST, OPTIONS'
-            },
+            'headers': CORS_PREFLIGHT_HEADERS,
             'body': ''
         }
-    
+
     try:
         # Parse the request body
-        body = json.loads(event.get('body', '{}'))
+        body = json.loads(event.get('body') or '{}')
         question = body.get('message', '')
-        
+        user_language = body.get('user_language', 'en')
+        output_language = body.get('output_language')
+
         if not question:
             return {
                 'statusCode': 400,
-                'headers': {
-                    'Access-Control-Allow-Origin': '*',
-                    'Content-Type': 'application/json'
-                },
+                'headers': JSON_HEADERS,
                 'body': json.dumps({'error': 'No message provided'})
             }
-        
+
         # Query the knowledge base
-        result = query_knowledge_base(question)
-        
+        # The Lambda package doesn't ship langdetect, so answer in the language the client asked for
+        result = query_engine.query_knowledge_base(question, user_language, output_language, auto_detect=False)
+
         # Format response with footnotes
         response_text = result['answer']
-        
+
         # Add footnotes section if sources exist
         if result['sources']:
             response_text += "\n\n**Sources:**\n"
             for source in result['sources']:
                 response_text += f"[{source['number']}] {source['title']}\n"
-        
+
         return {
             'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Content-Type': 'application/json'
-            },
+            'headers': JSON_HEADERS,
             'body': json.dumps({
                 'response': response_text,
-                'sources': result['sources']
+                'sources': result['sources'],
+                'is_error': result.get('is_error', False),
+                'detected_language': result['detected_language'],
+                'output_language': result['output_language']
             })
         }
-        
+
     except Exception as e:
+        import traceback  # Only needed on the error path
+        traceback.print_exc()
         return {
             'statusCode': 500,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Content-Type': 'application/json'
-            },
+            'headers': JSON_HEADERS,
             'body': json.dumps({'error': f'Internal server error: {str(e)}'})
-        }
\ No newline at end of file
+        }
+
+def lambda_handler(event, context):
+    global _cold_start
+    started = time.perf_counter()
+    cold_start = _cold_start
+    _cold_start = False
+
+    if is_warmup_event(event):
+        warmed, warmup_ms = warm_connection_pool()
+        response = {'statusCode': 200, 'body': json.dumps({'warmed': warmed, 'warmupMs': warmup_ms})}
+    else:
+        response = handle_request(event)
+
+    # One structured line per invocation so cold vs warm latency can be queried in CloudWatch
+    print(json.dumps({
+        'coldStart': cold_start,
+        'warmup': is_warmup_event(event),
+        'initMs': INIT_DURATION_MS if cold_start else 0,
+        'handlerMs': round((time.perf_counter() - started) * 1000, 1)
+    }))
+    return response
+
+_cold_start = True
+
+# Provisioned concurrency runs init ahead of traffic, so pay for the TLS handshake here too
+if os.environ.get('AWS_LAMBDA_INITIALIZATION_TYPE') == 'provisioned-concurrency':
+    warm_connection_pool()
+
+INIT_DURATION_MS = round((time.perf_counter() - _INIT_STARTED) * 1000, 1)
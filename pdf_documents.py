@@ -0,0 +1,364 @@
+"""Memory-efficient PDF handling for attachment analysis.
+
+Uploads are spooled to a temporary file and memory-mapped, so PyMuPDF reads the
+document straight from the page cache instead of a Python bytes copy. PyMuPDF itself
+is imported when the first PDF is opened, so text-only workers never load it. Pages are
+rendered lazily one at a time, and their base64 encoding is written directly into
+the outgoing invoke_model request body.
+
+Before rendering, each page is looked at cheaply (text layer and a small grayscale
+thumbnail): blank pages and exact repeats of an earlier page are skipped, and the zoom
+is chosen per page so its smallest text comes out legible, instead of a fixed 2x. A page
+that is just one embedded JPEG or PNG (a scan) is not rendered at all: the image's own
+bytes are sent, downscaled only when far larger than a MAX_ZOOM render.
+"""
+import base64
+import hashlib
+import json
+import mmap
+import shutil
+import tempfile
+
+SPOOL_CHUNK_SIZE = 1024 * 1024  # 1MB copy chunks when spooling uploads
+# Keep encode chunks a multiple of 3 bytes so base64 pieces concatenate without padding
+BASE64_CHUNK_SIZE = 3 * 256 * 1024
+# Request bodies larger than this are spooled to disk instead of held in memory
+REQUEST_BODY_MEMORY_LIMIT = 4 * 1024 * 1024
+# Marker placed in a message content list where the page images should be streamed
+PAGE_IMAGES_PLACEHOLDER = "__PDF_PAGE_IMAGES__"
+
+# Adaptive zoom: render so the smallest text on the page is about LEGIBLE_TEXT_PX tall
+# (1 pt = 1 px at zoom 1), within MIN_ZOOM..MAX_ZOOM. Pages without a text layer (scans)
+# or mostly covered by images are rendered at MAX_ZOOM.
+MIN_ZOOM = 1.0
+MAX_ZOOM = 2.0
+LEGIBLE_TEXT_PX = 16
+MIN_SPAN_CHARACTERS = 3  # Ignore stray glyphs (bullets, footnote marks) when finding the smallest text
+IMAGE_COVERAGE_FOR_MAX_ZOOM = 0.25
+# Blank page: no text layer and almost no ink in a THUMBNAIL_ZOOM grayscale thumbnail
+THUMBNAIL_ZOOM = 0.25
+INK_LEVEL = 240  # Gray values below this count as ink
+BLANK_INK_RATIO = 0.002
+# Scanned page: a single image covering at least this share of the page, with no visible
+# text or vector drawings (an invisible OCR text layer is fine)
+SCAN_IMAGE_COVERAGE = 0.9
+EMBEDDED_IMAGE_TYPES = {'jpeg': 'image/jpeg', 'png': 'image/png'}  # others (JPX, JBIG2, CCITT) are rendered
+DOWNSCALED_JPEG_QUALITY = 85
+INVISIBLE_TEXT = 3  # PDF text render mode of OCR layers
+
+
+def spool_stream(stream, max_bytes=None):
+    """Copy an upload stream into a temporary spool file in chunks.
+
+    Returns (spool_file, size). Copying stops one byte past max_bytes so callers can
+    reject oversized uploads without reading the whole stream.
+    """
+    spool = tempfile.TemporaryFile()
+    size = 0
+    while True:
+        chunk = stream.read(SPOOL_CHUNK_SIZE)
+        if not chunk:
+            break
+        spool.write(chunk)
+        size += len(chunk)
+        if max_bytes is not None and size > max_bytes:
+            break
+    spool.flush()
+    spool.seek(0)
+    return spool, size
+
+
+class PdfDocument:
+    """A PDF opened from a memory-mapped spool file"""
+
+    def __init__(self, spool_file):
+        self._spool = spool_file
+        self._map = None
+        self._view = None
+        self._document = None
+        try:
+            self._map = mmap.mmap(spool_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # mmap refuses zero-length files
+            self.close()
+            raise ValueError("PDF file is empty.")
+        self._view = memoryview(self._map)
+        import fitz  # PyMuPDF is only loaded once a PDF is actually opened
+
+        # PyMuPDF keeps a reference to the memoryview instead of copying it
+        self._document = fitz.open(stream=self._view, filetype="pdf")
+
+    @classmethod
+    def from_bytes(cls, pdf_data):
+        """Open a PDF that is already held in memory"""
+        spool = tempfile.TemporaryFile()
+        spool.write(pdf_data)
+        spool.flush()
+        return cls(spool)
+
+    @classmethod
+    def from_stream(cls, stream):
+        """Open a PDF from a readable stream (e.g. an upload's file.stream)"""
+        spool = tempfile.TemporaryFile()
+        shutil.copyfileobj(stream, spool, SPOOL_CHUNK_SIZE)
+        spool.flush()
+        return cls(spool)
+
+    def __len__(self):
+        return len(self._document) if self._document is not None else 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def analyze_page(self, page_num):
+        """Look at a page without rendering it in full.
+
+        Returns {'blank', 'fingerprint', 'zoom', 'image_xref'}: whether the page is blank,
+        a hash of its text and thumbnail (equal for identical pages), the zoom to render it
+        at, and the xref of the image to send instead when the page is a single scan.
+        """
+        import fitz
+
+        page = self._document[page_num]
+        text = page.get_text('text').strip()
+        thumbnail = page.get_pixmap(matrix=fitz.Matrix(THUMBNAIL_ZOOM, THUMBNAIL_ZOOM), colorspace=fitz.csGRAY, alpha=False)
+        samples = thumbnail.samples
+        # Deleting the ink levels leaves the light pixels, so the difference is the ink
+        ink = len(samples) - len(samples.translate(None, bytes(range(INK_LEVEL))))
+        blank = not text and ink <= BLANK_INK_RATIO * len(samples)
+
+        fingerprint = hashlib.sha256(text.encode('utf-8'))
+        fingerprint.update(b'%d:%d:' % (thumbnail.width, thumbnail.height))
+        fingerprint.update(samples)
+        return {
+            'blank': blank,
+            'fingerprint': fingerprint.hexdigest(),
+            'zoom': page_zoom(page, bool(text)),
+            'image_xref': None if blank else scanned_image_xref(page)
+        }
+
+    def plan_pages(self, max_pages=None):
+        """Pages worth sending: [(page_num, zoom, image_xref)], plus skip counts"""
+        page_count = len(self)
+        if max_pages is not None:
+            page_count = min(page_count, max_pages)
+
+        plan = []
+        skipped = {'blank': 0, 'duplicate': 0}
+        seen = set()
+        for page_num in range(page_count):
+            analysis = self.analyze_page(page_num)
+            if analysis['blank']:
+                skipped['blank'] += 1
+            elif analysis['fingerprint'] in seen:
+                skipped['duplicate'] += 1
+            else:
+                seen.add(analysis['fingerprint'])
+                plan.append((page_num, analysis['zoom'], analysis['image_xref']))
+        if not plan and page_count:
+            plan.append((0, MIN_ZOOM, None))  # Every page blank: still show the model what there is
+        return plan, skipped
+
+    def iter_page_images(self, max_pages=None, zoom=None):
+        """Render pages lazily as PNG, keeping at most one page's pixmap alive.
+
+        With zoom=None blank and repeated pages are skipped and each page gets its own
+        zoom (see plan_pages); a number renders every page at that zoom.
+        """
+        import fitz
+
+        page_count = len(self) if max_pages is None else min(len(self), max_pages)
+        if zoom is None:
+            plan, skipped = self.plan_pages(max_pages)
+        else:
+            plan, skipped = [(page_num, zoom, None) for page_num in range(page_count)], {}
+
+        pixels = embedded = 0
+        for page_num, page_zoom_factor, image_xref in plan:
+            page = self._document[page_num]
+            image = self.embedded_image(page, image_xref) if image_xref else None
+            if image is not None:
+                embedded += 1
+                pixels += image['width'] * image['height']
+                yield {
+                    'data': image['data'],
+                    'page_num': page_num + 1,
+                    'filename': f"page_{page_num + 1}.{image['ext']}",
+                    'media_type': image['media_type'],
+                    'zoom': None
+                }
+                continue
+
+            pix = page.get_pixmap(matrix=fitz.Matrix(page_zoom_factor, page_zoom_factor))
+            img_data = pix.tobytes("png")
+            pixels += pix.width * pix.height
+            # Drop the pixel buffer before handing the PNG to the caller
+            pix = None
+            page = None
+
+            yield {
+                'data': img_data,
+                'page_num': page_num + 1,
+                'filename': f"page_{page_num + 1}.png",
+                'media_type': 'image/png',
+                'zoom': page_zoom_factor
+            }
+
+        if zoom is None and plan:
+            # Against the old behaviour: every page at MAX_ZOOM
+            full_pixels = sum(
+                round(self._document[page_num].rect.width * MAX_ZOOM) * round(self._document[page_num].rect.height * MAX_ZOOM)
+                for page_num in range(page_count)
+            ) or 1
+            print(f"PDF pages: {len(plan) - embedded} rendered, {embedded} sent as embedded images, "
+                  f"{skipped['blank']} blank and {skipped['duplicate']} duplicate skipped; "
+                  f"{pixels / 1e6:.1f} MP ({pixels / full_pixels:.0%} of every page at {MAX_ZOOM:g}x)")
+
+    def embedded_image(self, page, xref):
+        """The page's scanned image as sent to the model, or None to render the page instead.
+
+        The original bytes are used when the format is accepted as is. An image more than
+        twice as wide as a MAX_ZOOM render is downscaled to that render's size instead:
+        rendered as JPEG, which lets MuPDF decode the JPEG at reduced scale.
+        """
+        import fitz
+
+        try:
+            extracted = self._document.extract_image(xref)
+        except Exception as e:
+            print(f"Embedded image extraction failed on page {page.number + 1}: {e}")
+            return None
+        ext = extracted.get('ext')
+        # Soft masks (transparency) and CMYK would look different from the rendered page
+        if ext not in EMBEDDED_IMAGE_TYPES or extracted.get('smask') or extracted.get('colorspace') not in (1, 3):
+            return None
+
+        width, height = extracted['width'], extracted['height']
+        if width <= 2 * page.rect.width * MAX_ZOOM:
+            return {'data': extracted['image'], 'ext': ext, 'media_type': EMBEDDED_IMAGE_TYPES[ext],
+                    'width': width, 'height': height}
+
+        pix = page.get_pixmap(matrix=fitz.Matrix(MAX_ZOOM, MAX_ZOOM), alpha=False)
+        data = pix.tobytes('jpeg', jpg_quality=DOWNSCALED_JPEG_QUALITY)
+        return {'data': data, 'ext': 'jpeg', 'media_type': 'image/jpeg', 'width': pix.width, 'height': pix.height}
+
+    def close(self):
+        if self._document is not None:
+            self._document.close()
+            self._document = None
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._spool is not None:
+            self._spool.close()
+            self._spool = None
+
+
+def page_zoom(page, has_text):
+    """Zoom at which the page's smallest text is about LEGIBLE_TEXT_PX tall"""
+    if not has_text:
+        return MAX_ZOOM
+    page_area = abs(page.rect) or 1
+    image_area = sum(abs(page.rect & image['bbox']) for image in page.get_image_info())
+    if image_area / page_area > IMAGE_COVERAGE_FOR_MAX_ZOOM:
+        return MAX_ZOOM  # Text in the images can't be measured
+
+    smallest = None
+    for block in page.get_text('dict')['blocks']:
+        for line in block.get('lines', []):
+            for span in line['spans']:
+                if len(span['text'].strip()) >= MIN_SPAN_CHARACTERS and span['size'] > 0:
+                    smallest = span['size'] if smallest is None else min(smallest, span['size'])
+    if smallest is None:
+        return MAX_ZOOM
+    return round(min(MAX_ZOOM, max(MIN_ZOOM, LEGIBLE_TEXT_PX / smallest)), 2)
+
+
+def scanned_image_xref(page):
+    """xref of the one upright image that makes up the page, or None for mixed content"""
+    if page.rotation:
+        return None
+    # get_image_info(xrefs=True) would decode the image to hash it, so pair it with get_images()
+    images = page.get_image_info()
+    referenced = page.get_images(full=True)
+    if len(images) != 1 or len(referenced) != 1:
+        return None
+    image = images[0]
+    a, b, c, d, _, _ = image['transform']
+    if b or c or a <= 0 or d <= 0:  # rotated or mirrored on the page
+        return None
+    if abs(page.rect & image['bbox']) < SCAN_IMAGE_COVERAGE * abs(page.rect):
+        return None
+    if any(span['type'] != INVISIBLE_TEXT for span in page.get_texttrace()):
+        return None
+    if page.get_drawings():
+        return None
+    return referenced[0][0]
+
+
+def open_pdf(pdf_source):
+    """Return a PdfDocument for raw bytes, a spool/upload stream, or an open document"""
+    if isinstance(pdf_source, PdfDocument):
+        return pdf_source
+    if isinstance(pdf_source, (bytes, bytearray, memoryview)):
+        return PdfDocument.from_bytes(pdf_source)
+    if hasattr(pdf_source, 'fileno'):
+        try:
+            pdf_source.fileno()
+            pdf_source.seek(0)
+            return PdfDocument(pdf_source)
+        except (OSError, ValueError, AttributeError):
+            pass
+    return PdfDocument.from_stream(pdf_source)
+
+
+def write_base64(out, data):
+    """Base64-encode data straight into a writable body, one chunk at a time"""
+    view = memoryview(data)
+    for start in range(0, len(view), BASE64_CHUNK_SIZE):
+        out.write(base64.b64encode(view[start:start + BASE64_CHUNK_SIZE]))
+    view.release()
+
+
+def build_vision_request_body(body, images):
+    """Serialize an invoke_model body, streaming images into the placeholder slot.
+
+    `body` is the usual request dict with PAGE_IMAGES_PLACEHOLDER as one element of a
+    message content list. `images` is any iterable of {'data', 'media_type'} dicts, so
+    a lazy page generator is consumed one page at a time. Returns (body_file,
+    image_count) where body_file is seekable and suitable for invoke_model(body=...).
+    """
+    encoded = json.dumps(body).encode('utf-8')
+    marker = json.dumps(PAGE_IMAGES_PLACEHOLDER).encode('utf-8')
+    head, tail = encoded.split(marker, 1)
+
+    out = tempfile.SpooledTemporaryFile(max_size=REQUEST_BODY_MEMORY_LIMIT)
+    out.write(head)
+
+    image_count = 0
+    for image in images:
+        if image_count:
+            out.write(b', ')
+        media_type = image.get('media_type', 'image/png').encode('utf-8')
+        out.write(b'{"type": "image", "source": {"type": "base64", "media_type": "' + media_type + b'", "data": "')
+        write_base64(out, image['data'])
+        out.write(b'"}}')
+        image_count += 1
+
+    if image_count == 0:
+        # Nothing was streamed, so drop the list separator next to the placeholder
+        if head.endswith(b', '):
+            out.seek(-2, 2)
+            out.truncate()
+        elif tail.startswith(b', '):
+            tail = tail[2:]
+
+    out.write(tail)
+    out.seek(0)
+    return out, image_count
@@ -0,0 +1,140 @@
+"""Opt-in, bounded log of questions asked, used to find the most frequent ones.
+
+Questions can be sensitive, so nothing is logged unless REQUEST_LOG_PATH is set. The
+file is rotated to REQUEST_LOG_PATH + '.1' when it grows past REQUEST_LOG_MAX_BYTES or
+its oldest entry is half the retention period old, and the rotated file is deleted once
+that old too, so no question is kept much longer than REQUEST_LOG_RETENTION_DAYS.
+"""
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter
+
+REQUEST_LOG_PATH = os.getenv('REQUEST_LOG_PATH', '')  # empty disables the log
+REQUEST_LOG_MAX_BYTES = int(os.getenv('REQUEST_LOG_MAX_BYTES', str(8 * 1024 * 1024)))
+REQUEST_LOG_RETENTION_DAYS = float(os.getenv('REQUEST_LOG_RETENTION_DAYS', '30'))
+# Only the most recent questions are considered when ranking (about 50,000 lines)
+REQUEST_LOG_WINDOW_BYTES = 8 * 1024 * 1024
+RETENTION_CHECK_INTERVAL = 60
+
+_write_lock = threading.Lock()
+_last_retention_check = 0
+
+
+def normalize_logged_question(question):
+    return re.sub(r'\s+', ' ', (question or '').strip().lower()).rstrip('?!. ')
+
+
+def rotated_path():
+    return REQUEST_LOG_PATH + '.1'
+
+
+def rotation_age():
+    return REQUEST_LOG_RETENTION_DAYS * 86400 / 2
+
+
+def rotate():
+    try:
+        os.replace(REQUEST_LOG_PATH, rotated_path())
+    except OSError as e:  # another worker rotated it first
+        print(f"Request log rotation skipped: {e}")
+
+
+def oldest_entry_time(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.loads(f.readline())['ts']
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def enforce_retention():
+    """Rotate a log that holds old questions and delete an old rotated file (once a minute per process)"""
+    global _last_retention_check
+    now = time.time()
+    if now - _last_retention_check < RETENTION_CHECK_INTERVAL:
+        return
+    _last_retention_check = now
+    oldest = oldest_entry_time(REQUEST_LOG_PATH)
+    if oldest is not None and now - oldest > rotation_age():
+        rotate()
+    try:
+        if now - os.path.getmtime(rotated_path()) > rotation_age():
+            os.remove(rotated_path())
+    except OSError:
+        pass
+
+
+def log_question(question, user_language='en', output_language=None):
+    """Record a text question (one JSON line; O_APPEND keeps lines intact across workers)"""
+    if not REQUEST_LOG_PATH or not question:
+        return
+    line = json.dumps({
+        'ts': round(time.time(), 3),
+        'question': question,
+        'user_language': user_language,
+        'output_language': output_language
+    }, ensure_ascii=False)
+    try:
+        with _write_lock:
+            enforce_retention()
+            with open(REQUEST_LOG_PATH, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+                size = f.tell()
+            if size > REQUEST_LOG_MAX_BYTES:
+                rotate()
+    except OSError as e:
+        print(f"Request log write error: {e}")
+
+
+def tail_lines(path, max_bytes):
+    """The complete lines in the last max_bytes of a file"""
+    try:
+        with open(path, 'rb') as f:
+            size = f.seek(0, os.SEEK_END)
+            f.seek(max(0, size - max_bytes))
+            data = f.read()
+    except OSError:
+        return []
+    lines = data.decode('utf-8', errors='replace').splitlines()
+    return lines[1:] if size > max_bytes else lines  # the first line may be cut
+
+
+def recent_lines(window):
+    """The last window bytes of the log, continuing into the rotated file when needed"""
+    lines = tail_lines(REQUEST_LOG_PATH, window)
+    try:
+        remaining = window - os.path.getsize(REQUEST_LOG_PATH)
+    except OSError:
+        remaining = window
+    if remaining > 0:
+        lines = tail_lines(rotated_path(), remaining) + lines
+    return lines
+
+
+def top_questions(n=20, window=REQUEST_LOG_WINDOW_BYTES):
+    """Return the n most frequently asked questions from the recent log window"""
+    if not REQUEST_LOG_PATH:
+        return []
+    oldest_kept = time.time() - REQUEST_LOG_RETENTION_DAYS * 86400
+    counts = Counter()
+    examples = {}
+    for line in recent_lines(window):
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue
+        if entry.get('ts', 0) < oldest_kept:
+            continue
+        key = (normalize_logged_question(entry.get('question')), entry.get('user_language') or 'en', entry.get('output_language'))
+        if not key[0]:
+            continue
+        counts[key] += 1
+        examples.setdefault(key, entry['question'])
+
+    return [
+        {'question': examples[key], 'user_language': key[1], 'output_language': key[2], 'count': count}
+        for key, count in counts.most_common(n)
+    ]
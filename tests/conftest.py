@@ -0,0 +1,34 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'test')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'test')
+os.environ['LOCAL_INDEX_LOCATION'] = ''
+
+
+class Translated:
+    def __init__(self, text):
+        self.text = text
+
+
+class UppercaseTranslator:
+    """Stands in for googletrans.Translator: 'translates' by upper-casing, counting calls"""
+
+    def __init__(self):
+        self.calls = []
+
+    def translate(self, text, dest='en', src='auto'):
+        self.calls.append(text)
+        return Translated(text.upper())
+
+
+@pytest.fixture
+def translator(monkeypatch):
+    from ccc_core import translation
+
+    fake = UppercaseTranslator()
+    monkeypatch.setattr(translation, '_translator', fake)
+    return fake
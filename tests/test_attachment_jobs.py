@@ -0,0 +1,121 @@
+import io
+import threading
+import time
+
+import pytest
+
+import attachment_jobs
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(attachment_jobs, 'JOBS_DIR', str(tmp_path))
+    import chatbot_backend
+
+    return chatbot_backend, chatbot_backend.app.test_client()
+
+
+def post_pdf(client, client_id='browser-1', idempotency_key='upload-1'):
+    data = {
+        'message': 'What is my GPA?',
+        'file': (io.BytesIO(b'%PDF-1.4 transcript'), 'transcript.pdf'),
+        'client_id': client_id
+    }
+    if idempotency_key:
+        data['idempotency_key'] = idempotency_key
+    return client.post('/chat', data=data, content_type='multipart/form-data')
+
+
+def wait_for(client, job_id):
+    for _ in range(100):
+        job = client.get(f'/chat/jobs/{job_id}').get_json()
+        if job['status'] in attachment_jobs.FINISHED:
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def test_failed_analysis_can_be_retried(client, monkeypatch):
+    backend, client = client
+    outcomes = [backend.AttachmentAnalysisError('Vision model unavailable'), 'Your GPA is 3.4.']
+
+    def analyze_pdf(pdf_data, *args):
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    monkeypatch.setattr(backend, 'analyze_pdf_simple', analyze_pdf)
+
+    first = post_pdf(client).get_json()
+    failed = wait_for(client, first['job_id'])
+    assert failed['status'] == 'failed'
+    assert failed['error'] == 'Vision model unavailable'
+
+    retry = post_pdf(client).get_json()
+    assert retry['job_id'] != first['job_id']
+    done = wait_for(client, retry['job_id'])
+    assert done['status'] == 'done'
+    assert done['result']['response'] == 'Your GPA is 3.4.'
+
+
+def test_retry_of_running_job_reuses_it(client, monkeypatch):
+    backend, client = client
+    calls = []
+
+    def analyze_pdf(pdf_data, *args):
+        calls.append(1)
+        time.sleep(0.3)
+        return 'Done.'
+
+    monkeypatch.setattr(backend, 'analyze_pdf_simple', analyze_pdf)
+
+    first = post_pdf(client).get_json()
+    second = post_pdf(client).get_json()
+    assert second['job_id'] == first['job_id']
+    assert wait_for(client, first['job_id'])['status'] == 'done'
+    assert len(calls) == 1
+
+
+def test_jobs_are_not_shared_between_clients(client, monkeypatch):
+    backend, client = client
+    monkeypatch.setattr(backend, 'analyze_pdf_simple', lambda *args: 'Your GPA is 3.4.')
+
+    # Without a key the job is matched on the file, question and context, which others can reproduce
+    mine = post_pdf(client, idempotency_key=None).get_json()
+    theirs = post_pdf(client, client_id='browser-2', idempotency_key=None).get_json()
+    again = post_pdf(client, idempotency_key=None).get_json()
+
+    assert theirs['job_id'] != mine['job_id']
+    assert again['job_id'] == mine['job_id']
+    assert attachment_jobs.JOB_ID.fullmatch(mine['job_id'])
+
+
+def test_concurrent_retries_of_a_failed_job_start_one_job(tmp_path, monkeypatch):
+    monkeypatch.setattr(attachment_jobs, 'JOBS_DIR', str(tmp_path))
+    failed, _ = attachment_jobs.create_job('upload-1', scope='browser-1')
+    attachment_jobs.update_job(failed['id'], status='failed', error='Vision model unavailable')
+
+    read_job = attachment_jobs.get_job
+
+    def slow_get_job(job_id):
+        job = read_job(job_id)
+        time.sleep(0.05)  # every retry reads the failed job before any replaces it
+        return job
+
+    monkeypatch.setattr(attachment_jobs, 'get_job', slow_get_job)
+    barrier = threading.Barrier(8)
+    results = []
+
+    def retry():
+        barrier.wait()
+        results.append(attachment_jobs.create_job('upload-1', scope='browser-1'))
+
+    threads = [threading.Thread(target=retry) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sum(created for _, created in results) == 1
+    assert len({job['id'] for job, _ in results}) == 1
@@ -0,0 +1,20 @@
+from ccc_core import batch, query_engine
+
+
+def test_knowledge_base_failures_count_as_errors(monkeypatch):
+    def query_knowledge_base(question, user_language='en', output_language=None):
+        if 'transcript' in question:
+            return {'answer': "I'm having trouble accessing the knowledge base right now. Error: throttled",
+                    'sources': [], 'is_error': True, 'detected_language': 'en', 'output_language': 'en'}
+        return {'answer': 'Apply at cccapply.org.', 'sources': [], 'detected_language': 'en', 'output_language': 'en'}
+
+    monkeypatch.setattr(query_engine, 'query_knowledge_base', query_knowledge_base)
+    items = [batch.parse_item({'question': question}, number)
+             for number, question in enumerate(['How do I apply?', 'How do I send my transcript?'], 1)]
+
+    *results, summary = batch.run_batch(items, max_workers=2)
+
+    failed = next(result for result in results if result['id'] == 2)
+    assert 'answer' not in failed and 'throttled' in failed['error']
+    assert summary['summary']['answered'] == 1
+    assert summary['summary']['errors'] == 1
@@ -0,0 +1,10 @@
+import pytest
+
+import bench_cold_start
+
+
+@pytest.mark.parametrize('module', sorted(bench_cold_start.DEFERRED_IMPORTS))
+def test_entry_point_import_defers_heavy_packages(module):
+    packages = bench_cold_start.run_import(module)['packages']
+
+    assert [name for name in bench_cold_start.DEFERRED_IMPORTS[module] if name in packages] == []
@@ -0,0 +1,121 @@
+import io
+import json
+
+import boto3
+import pytest
+
+import kb_ingestion_monitor
+import kb_sync_planner
+
+MANIFEST = 's3://sync-bucket/sync/manifest.json'
+
+
+class FakeS3:
+    """Source objects and the manifest, behind the few S3 calls the planner makes"""
+
+    def __init__(self):
+        self.objects = {}  # source key -> etag
+        self.stored = {}
+
+    def get_paginator(self, name):
+        return self
+
+    def paginate(self, Bucket, Prefix=''):
+        return [{'Contents': [{'Key': key, 'ETag': f'"{etag}"'} for key, etag in self.objects.items()]}]
+
+    def get_object(self, Bucket, Key):
+        return {'Body': io.BytesIO(self.stored[(Bucket, Key)])}
+
+    def put_object(self, Bucket, Key, Body, ContentType=None):
+        self.stored[(Bucket, Key)] = Body
+
+
+class ConflictException(Exception):
+    pass
+
+
+class FakeBedrockAgent:
+    """Ingestion jobs that stay IN_PROGRESS until finish() is called"""
+
+    class exceptions:
+        ConflictException = ConflictException
+
+    def __init__(self):
+        self.jobs = []
+
+    def start_ingestion_job(self, knowledgeBaseId, dataSourceId, clientToken, description):
+        job = {'knowledgeBaseId': knowledgeBaseId, 'dataSourceId': dataSourceId,
+               'ingestionJobId': f'job-{len(self.jobs) + 1}', 'status': 'IN_PROGRESS', 'description': description}
+        self.jobs.append(job)
+        return {'ingestionJob': dict(job)}
+
+    def list_ingestion_jobs(self, filters, **kwargs):
+        return {'ingestionJobSummaries': [job for job in self.jobs if job['status'] in filters[0]['values']][:1]}
+
+    def get_ingestion_job(self, ingestionJobId, **kwargs):
+        return {'ingestionJob': dict(next(job for job in self.jobs if job['ingestionJobId'] == ingestionJobId))}
+
+    def finish(self, job_id):
+        next(job for job in self.jobs if job['ingestionJobId'] == job_id)['status'] = 'COMPLETE'
+
+
+class FakeLambda:
+    def __init__(self):
+        self.invocations = []
+
+    def invoke(self, FunctionName, InvocationType, Payload):
+        self.invocations.append(json.loads(Payload))
+
+
+class FakeContext:
+    function_name = 'ingestion-monitor'
+
+    def get_remaining_time_in_millis(self):
+        return 300000
+
+
+@pytest.fixture
+def aws(monkeypatch):
+    clients = {'s3': FakeS3(), 'bedrock-agent': FakeBedrockAgent(), 'lambda': FakeLambda()}
+    monkeypatch.setattr(boto3, 'client', lambda name, **kwargs: clients[name])
+    monkeypatch.setenv('KB_SOURCE_BUCKET', 'source-bucket')
+    monkeypatch.setattr(kb_ingestion_monitor, 'SYNC_MANIFEST_S3_URI', MANIFEST)
+    return clients
+
+
+def trigger(aws):
+    return kb_sync_planner.plan_and_start_sync(
+        aws['bedrock-agent'], 'kb', 'ds', 'source-bucket', '', MANIFEST, aws['s3']
+    )['action']
+
+
+def test_trailing_change_after_a_burst_starts_a_second_job(aws):
+    s3, agent = aws['s3'], aws['bedrock-agent']
+    s3.objects['faq/apply.pdf'] = 'a1'
+    assert trigger(aws) == 'started'
+    for number in range(3):  # the rest of the burst arrives while the job runs
+        s3.objects[f'faq/burst-{number}.pdf'] = 'b1'
+        assert trigger(aws) == 'coalesced'
+    s3.objects['faq/trailing.pdf'] = 't1'
+    assert trigger(aws) == 'coalesced'
+
+    agent.finish('job-1')
+    kb_ingestion_monitor.lambda_handler(
+        {'knowledgeBaseId': 'kb', 'dataSourceId': 'ds', 'ingestionJobId': 'job-1'}, FakeContext()
+    )
+
+    assert [job['ingestionJobId'] for job in agent.jobs] == ['job-1', 'job-2']
+    assert agent.jobs[1]['description'] == 'Incremental sync: 4 changed documents'
+    assert aws['lambda'].invocations[-1]['ingestionJobId'] == 'job-2'
+    assert trigger(aws) == 'skipped_no_changes'
+
+
+def test_change_soon_after_a_finished_job_is_not_coalesced(aws):
+    s3, agent = aws['s3'], aws['bedrock-agent']
+    s3.objects['faq/apply.pdf'] = 'a1'
+    assert trigger(aws) == 'started'
+    agent.finish('job-1')
+
+    s3.objects['faq/apply.pdf'] = 'a2'  # within SYNC_COALESCE_SECONDS of job-1 starting
+
+    assert trigger(aws) == 'started'
@@ -0,0 +1,41 @@
+import pytest
+
+from ccc_core import config, local_index, query_engine
+
+pytest.importorskip('numpy')
+
+FAQ = "How do I reset my password?\nUse the Forgot Password link.\n\nWhen is the application deadline?\nAugust 1."
+
+
+def fake_embed(texts):
+    """Two-topic stand-in for Titan: account access vs everything else"""
+    return [[1.0, 0.0] if 'password' in text.lower() or 'sign in' in text.lower() else [0.0, 1.0] for text in texts]
+
+
+@pytest.fixture
+def served_index(tmp_path, monkeypatch):
+    def serve(embed_fn):
+        index = local_index.LocalKnowledgeIndex(embed_fn=embed_fn)
+        index.add_document('faq.md', 'etag-1', FAQ)
+        location = str(tmp_path / 'index.json.gz')
+        index.save(location)
+        monkeypatch.setattr(config, 'LOCAL_INDEX_LOCATION', location)
+        monkeypatch.setattr(local_index, 'titan_embedder', lambda client=None: fake_embed)
+        monkeypatch.setattr(query_engine, 'local_index', None)
+        return query_engine.get_local_index()
+
+    return serve
+
+
+def test_served_index_uses_stored_embeddings(served_index):
+    index = served_index(fake_embed)
+
+    assert index.embed_fn is fake_embed
+    match = index.lookup("I can't sign in to my account")
+    assert match['question'] == 'How do I reset my password?'
+
+
+def test_index_without_embeddings_skips_query_embedding(served_index):
+    index = served_index(None)
+
+    assert index.embed_fn is None
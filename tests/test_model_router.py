@@ -0,0 +1,10 @@
+from ccc_core import config, model_router
+
+
+def test_untranslated_questions_skip_the_english_keywords(monkeypatch):
+    monkeypatch.setattr(config, 'MODEL_ROUTING', True)
+    spanish = "¿Debería transferirme? ¿Cuál es el link?"  # counseling, but 'link' is an English lookup keyword
+
+    assert model_router.classify_question("What's the CCCApply link?") == ('fast', 'lookup')
+    assert model_router.classify_question(spanish, language='es') == ('full', 'untranslated es question')
+    assert model_router.route_question(spanish, language='es')['model_id'] == config.MODEL_ID
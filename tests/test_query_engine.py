@@ -0,0 +1,160 @@
+import time
+
+import pytest
+from conftest import Translated
+
+from ccc_core import query_engine
+
+
+def test_translate_answer_translates_every_paragraph_before_sources(translator):
+    answer = (
+        "Create an OpenCCC account first [1].\n\n"
+        "Then choose a college and start the application [2].\n\n"
+        "You can save your progress and return later.\n\n"
+        "**Sources:**\n"
+        "[1]: \"OpenCCC\" — https://www.cccapply.org/en/account\n"
+        "[2]: \"Apply\" — https://www.cccapply.org/en/apply"
+    )
+
+    translated = query_engine.translate_answer(answer, 'es')
+
+    body, sources = translated.split('\n\n**Sources:**\n')
+    assert body == (
+        "CREATE AN OPENCCC ACCOUNT FIRST [1].\n\n"
+        "THEN CHOOSE A COLLEGE AND START THE APPLICATION [2].\n\n"
+        "YOU CAN SAVE YOUR PROGRESS AND RETURN LATER."
+    )
+    assert sources == answer.split('\n\n**Sources:**\n')[1]
+
+
+def test_translate_answer_without_sources(translator):
+    assert query_engine.translate_answer("First paragraph.\n\nSecond paragraph.", 'vi') == \
+        "FIRST PARAGRAPH.\n\nSECOND PARAGRAPH."
+
+
+class QuestionTranslator:
+    """Translates the test question to one English search question, a little slowly"""
+
+    def __init__(self):
+        self.calls = []
+
+    def translate(self, text, dest='en', src='auto'):
+        time.sleep(0.05)
+        self.calls.append((text, dest, src))
+        if dest == 'en' and text in QUESTIONS.values():
+            return Translated('How do I apply?')
+        return Translated(f"[{dest}] {text}")
+
+
+QUESTIONS = {'es': '¿Cómo presento mi solicitud?', 'vi': 'Làm thế nào để nộp đơn?'}
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    from ccc_core import config, translation
+
+    monkeypatch.setattr(translation, '_translator', QuestionTranslator())
+    monkeypatch.setattr(translation, 'translation_available', lambda: True)
+    monkeypatch.setattr(query_engine, 'translation_available', lambda: True)
+    monkeypatch.setattr(config, 'SPECULATIVE_PIPELINE', True)
+    generations = []
+
+    def generate_answer(search_question, user_language, output_language, conversation_history=None,
+                        retrieval_score=None, question_language='en'):
+        generations.append((search_question, output_language, question_language))
+        return {'answer': f"Answer to {search_question} [1]",
+                'sources': [{'title': f"Source for {output_language}", 'url': f"https://example.com/{output_language}"}]}
+
+    monkeypatch.setattr(query_engine, 'generate_answer', generate_answer)
+    query_engine.clear_caches()
+    yield config, generations
+    query_engine.clear_caches()
+
+
+def wait_for_canonical(key, seconds=2):
+    deadline = time.time() + seconds
+    while query_engine.canonical_cache.get(key) is None and time.time() < deadline:
+        time.sleep(0.01)
+    return query_engine.canonical_cache.get(key)
+
+
+def test_speculative_answer_keeps_its_sources_and_fills_canonical(pipeline, monkeypatch):
+    config, generations = pipeline
+    monkeypatch.setattr(config, 'SPECULATION_DELAY_MS', 0)  # the translation is slower: speculate
+
+    spanish = query_engine.query_knowledge_base(QUESTIONS['es'], 'es', auto_detect=False)
+
+    assert generations == [(QUESTIONS['es'], 'es', 'es')]  # routed as a Spanish question
+    assert spanish['sources'][0]['title'] == 'Source for es'
+    canonical = wait_for_canonical(query_engine.canonical_cache_key('How do I apply?'))
+    assert canonical is not None and canonical['sources'] == spanish['sources']
+
+    # Another language is translated from the back-filled canonical answer, with its sources
+    monkeypatch.setattr(config, 'SPECULATION_DELAY_MS', 1000)
+    vietnamese = query_engine.query_knowledge_base(QUESTIONS['vi'], 'vi', auto_detect=False)
+
+    assert len(generations) == 1
+    assert vietnamese['sources'] == spanish['sources']
+
+    # Once the answer cache entry is gone, Spanish still gets the speculative answer and its sources
+    query_engine.answer_cache.clear()
+    query_engine.canonical_cache.set(query_engine.canonical_cache_key('How do I apply?'),
+                                     {'answer': 'Other answer [1]', 'sources': [{'title': 'Other'}]})
+    again = query_engine.query_knowledge_base(QUESTIONS['es'], 'es', auto_detect=False)
+    assert again['answer'] == spanish['answer'] and again['sources'] == spanish['sources']
+
+
+def test_fast_translation_checks_caches_before_speculating(pipeline, monkeypatch):
+    config, generations = pipeline
+    monkeypatch.setattr(config, 'SPECULATION_DELAY_MS', 1000)
+    query_engine.canonical_cache.set(query_engine.canonical_cache_key('How do I apply?'),
+                                     {'answer': 'Create an account first [1].', 'sources': [{'title': 'Account'}]})
+
+    result = query_engine.query_knowledge_base(QUESTIONS['es'], 'es', auto_detect=False)
+
+    assert generations == []
+    assert result['sources'] == [{'title': 'Account'}]
+
+
+def test_speculation_looks_up_each_cache_once(pipeline, monkeypatch):
+    config, generations = pipeline
+    monkeypatch.setattr(config, 'SPECULATION_DELAY_MS', 0)
+    query_engine.canonical_cache.set(query_engine.canonical_cache_key('How do I apply?'),
+                                     {'answer': 'Create an account first [1].', 'sources': [{'title': 'Account'}]})
+    caches = [query_engine.canonical_cache, query_engine.translation_cache]
+    before = [cache.hits + cache.misses for cache in caches]
+
+    result = query_engine.query_knowledge_base(QUESTIONS['es'], 'es', auto_detect=False)
+
+    assert result['sources'] == [{'title': 'Account'}]
+    assert [cache.hits + cache.misses for cache in caches] == [count + 1 for count in before]
+
+
+def test_knowledge_base_failure_is_flagged_and_not_cached(pipeline, monkeypatch):
+    def unavailable(*args, **kwargs):
+        raise RuntimeError('throttled')
+
+    monkeypatch.setattr(query_engine, 'generate_answer', unavailable)
+
+    result = query_engine.query_knowledge_base('How do I apply?', 'en', auto_detect=False)
+
+    assert result['is_error'] is True
+    assert 'throttled' in result['answer']
+    assert query_engine.answer_cache.get(query_engine.answer_cache_key('How do I apply?', 'en', None)) is None
+
+
+def test_invalidation_in_another_worker_clears_the_caches(tmp_path, monkeypatch):
+    from ccc_core import config
+
+    monkeypatch.setattr(config, 'CACHE_GENERATION_FILE', str(tmp_path / 'generation'))
+    monkeypatch.setattr(query_engine, 'cache_generation', query_engine.cache_generation)
+    query_engine.invalidate_caches()
+    query_engine.answer_cache.set(('question', 'en', None), {'answer': 'Old answer'})
+
+    # Another worker invalidates: this one notices on its next check
+    (tmp_path / 'generation').write_text('newer')
+    monkeypatch.setattr(query_engine, 'generation_checked_at', 0)
+    query_engine.check_cache_generation()
+
+    assert query_engine.answer_cache.get(('question', 'en', None)) is None
+    assert query_engine.cache_generation == 'newer'
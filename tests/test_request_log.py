@@ -0,0 +1,47 @@
+import json
+import time
+
+import pytest
+
+import request_log
+
+
+@pytest.fixture
+def log_path(tmp_path, monkeypatch):
+    path = tmp_path / 'request_log.jsonl'
+    monkeypatch.setattr(request_log, 'REQUEST_LOG_PATH', str(path))
+    monkeypatch.setattr(request_log, '_last_retention_check', 0)
+    return path
+
+
+def test_log_rotates_past_the_size_cap(log_path, monkeypatch):
+    monkeypatch.setattr(request_log, 'REQUEST_LOG_MAX_BYTES', 500)
+    for number in range(20):
+        request_log.log_question(f'How do I apply, question {number}?', 'en', 'en')
+
+    line_bytes = 150
+    sizes = [path.stat().st_size for path in log_path.parent.iterdir()]
+    assert len(sizes) <= 2 and all(size <= 500 + line_bytes for size in sizes)
+    assert request_log.top_questions(5)[0]['question'].startswith('How do I apply')
+
+
+def test_top_questions_reads_the_recent_tail_and_skips_expired_entries(log_path):
+    old = time.time() - 40 * 86400
+    lines = [{'ts': old, 'question': 'Expired question', 'user_language': 'en', 'output_language': None}] * 5
+    lines += [{'ts': time.time(), 'question': 'Older question', 'user_language': 'en', 'output_language': None}] * 50
+    lines += [{'ts': time.time(), 'question': 'Recent question', 'user_language': 'es', 'output_language': None}] * 3
+    log_path.write_text(''.join(json.dumps(line) + '\n' for line in lines), encoding='utf-8')
+
+    assert [entry['question'] for entry in request_log.top_questions(5)] == ['Older question', 'Recent question']
+    # A window holding only the last few lines never sees the older ones
+    window = len(json.dumps(lines[-1])) * 4
+    assert [entry['question'] for entry in request_log.top_questions(5, window=window)] == ['Recent question']
+
+
+def test_nothing_is_logged_without_a_path(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(request_log, 'REQUEST_LOG_PATH', '')
+    request_log.log_question('Can I change my major?')
+
+    assert list(tmp_path.iterdir()) == []
+    assert request_log.top_questions() == []
@@ -0,0 +1,42 @@
+from ccc_core import translation
+from conftest import Translated
+
+
+def test_translate_preserve_urls_makes_one_call(translator):
+    text = "Apply online [1] [2] and check https://www.cccapply.org/en/status for updates [3] [4]."
+
+    translated = translation.translate_preserve_urls(text, 'es')
+
+    assert len(translator.calls) == 1
+    assert translated == "APPLY ONLINE [1] [2] AND CHECK https://www.cccapply.org/en/status FOR UPDATES [3] [4]."
+
+
+def test_translate_preserve_urls_falls_back_when_placeholders_are_lost(translator, monkeypatch):
+    monkeypatch.setattr(translator, 'translate', lambda text, dest='en', src='auto': Translated(
+        translation.PLACEHOLDER_PATTERN.sub('', text).upper()))
+
+    translated = translation.translate_preserve_urls("See https://www.cccapply.org/en/help now [1].", 'es')
+
+    assert translated == "SEE https://www.cccapply.org/en/help NOW [1]."
+
+
+def test_ensure_language_translates_only_english_paragraphs(translator):
+    spanish = "Para solicitar admisión, crea una cuenta de OpenCCC y completa la solicitud en línea [1]."
+    english = "You can check the status of your application with the admissions office of the college [2]."
+    answer = f"{spanish}\n\n{english}\n\nSources:\n[1] https://www.cccapply.org/en/apply"
+
+    checked = translation.ensure_language(answer, 'es')
+
+    assert checked == f"{spanish}\n\n{english.upper()}\n\nSources:\n[1] https://www.cccapply.org/en/apply"
+    assert len(translator.calls) == 1
+
+
+def test_ensure_language_translates_paragraphs_in_another_non_english_language(translator):
+    french = "Pour postuler, créez un compte OpenCCC et remplissez la demande d'admission en ligne [1]."
+    spanish = "Puede consultar el estado de su solicitud con la oficina de admisiones del colegio [2]."
+    answer = f"{french}\n\n{spanish}"
+
+    checked = translation.ensure_language(answer, 'fr')
+
+    assert checked == f"{french}\n\n{spanish.upper()}"
+    assert len(translator.calls) == 1